@@ -10,8 +10,18 @@ import pandas as pd
 import pickle
 from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
+from .model_health import MODEL_HEALTH, MODEL_METRICS, StageTimer
+from .tracing import (
+    METRICS_CONTENT_TYPE,
+    TRACING_ENABLED,
+    TracingMiddleware,
+    render_metrics,
+    span,
+)
+
 APP_TITLE = "ICL Vault API"
 
 app = FastAPI(title=APP_TITLE, version="1.0.0")
@@ -22,8 +32,12 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 
 class PredictionInput(BaseModel):
     Age: int = Field(..., ge=18, le=90)
@@ -279,44 +293,57 @@ async def parse_ini(file: UploadFile = File(...)):
     return {"extracted": extracted}
 
 
+@app.get("/metrics")
+def metrics():
+    """
+    Per-model scoring metrics, plus request and span latency histograms
+    when TRACING_ENABLED is set (Prometheus text format).
+    """
+    content = render_metrics() if TRACING_ENABLED else render_metrics(MODEL_METRICS)
+    return Response(content=content, media_type=METRICS_CONTENT_TYPE)
+
+
 @app.post("/predict", response_model=PredictionResponse)
 def predict(payload: PredictionInput):
-    df_eng = engineer_features(payload.model_dump())
+    with span("features"):
+        df_eng = engineer_features(payload.model_dump())
     tight_score = float(df_eng["Tight_Chamber_Score"].iloc[0])
 
-    if tight_score > 0:
-        all_m = load_all_models()
-        m = all_m.get("lgb-27f-756c")
-        if m is None:
-            m_default = load_models()
-            model_tag = "gestalt-24f-756c"
-            feature_names = m_default["feature_names"]
-            lens_model, lens_scaler = m_default["lens_model"], m_default["lens_scaler"]
-            vault_model, vault_scaler = m_default["vault_model"], m_default["vault_scaler"]
+    with span("load_models"):
+        if tight_score > 0:
+            all_m = load_all_models()
+            m = all_m.get("lgb-27f-756c")
+            if m is None:
+                m_default = load_models()
+                model_tag = "gestalt-24f-756c"
+                feature_names = m_default["feature_names"]
+                lens_model, lens_scaler = m_default["lens_model"], m_default["lens_scaler"]
+                vault_model, vault_scaler = m_default["vault_model"], m_default["vault_scaler"]
+            else:
+                model_tag = "lgb-27f-756c"
+                feature_names = m["feature_names"]
+                lens_model, lens_scaler = m["lens_model"], m["lens_scaler"]
+                vault_model, vault_scaler = m["vault_model"], m["vault_scaler"]
         else:
-            model_tag = "lgb-27f-756c"
-            feature_names = m["feature_names"]
-            lens_model, lens_scaler = m["lens_model"], m["lens_scaler"]
-            vault_model, vault_scaler = m["vault_model"], m["vault_scaler"]
-    else:
-        models = load_models()
-        model_tag = "gestalt-24f-756c"
-        feature_names = models["feature_names"]
-        lens_model, lens_scaler = models["lens_model"], models["lens_scaler"]
-        vault_model, vault_scaler = models["vault_model"], models["vault_scaler"]
+            models = load_models()
+            model_tag = "gestalt-24f-756c"
+            feature_names = models["feature_names"]
+            lens_model, lens_scaler = models["lens_model"], models["lens_scaler"]
+            vault_model, vault_scaler = models["vault_model"], models["vault_scaler"]
 
-    X = df_eng[feature_names]
-    X_scaled = lens_scaler.transform(X)
+    with span("score"):
+        X = df_eng[feature_names]
+        X_scaled = lens_scaler.transform(X)
 
-    lens_probs = lens_model.predict_proba(X_scaled)[0]
-    lens_classes = lens_model.classes_
+        lens_probs = lens_model.predict_proba(X_scaled)[0]
+        lens_classes = lens_model.classes_
 
-    top_idx = int(np.argsort(lens_probs)[::-1][0])
-    best_size = float(lens_classes[top_idx])
-    best_prob = float(lens_probs[top_idx])
+        top_idx = int(np.argsort(lens_probs)[::-1][0])
+        best_size = float(lens_classes[top_idx])
+        best_prob = float(lens_probs[top_idx])
 
-    vault_scaled = vault_scaler.transform(X)
-    pred_vault = int(vault_model.predict(vault_scaled)[0])
+        vault_scaled = vault_scaler.transform(X)
+        pred_vault = int(vault_model.predict(vault_scaled)[0])
 
     if pred_vault < 250:
         vault_flag = "low"
@@ -406,7 +433,7 @@ def load_all_models() -> dict:
 
 @app.get("/models")
 def list_models():
-    """Return available model tags with metadata."""
+    """Return available model tags with metadata and compare circuit-breaker health."""
     all_m = load_all_models()
     return {
         tag: {
@@ -415,6 +442,7 @@ def list_models():
             "lens_model": type(info["lens_model"]).__name__,
             "vault_model": type(info["vault_model"]).__name__,
             "description": info["description"],
+            "health": MODEL_HEALTH.report(tag),
         }
         for tag, info in all_m.items()
     }
@@ -426,7 +454,8 @@ def predict_compare(payload: CompareInput, models: str = "all"):
 
     Query param ``models`` is a comma-separated list of tags or ``"all"``.
     """
-    all_m = load_all_models()
+    with span("load_models"):
+        all_m = load_all_models()
 
     if models == "all":
         selected_tags = list(all_m.keys())
@@ -436,7 +465,8 @@ def predict_compare(payload: CompareInput, models: str = "all"):
     if not selected_tags:
         raise HTTPException(status_code=400, detail="No valid model tags provided.")
 
-    df_eng = engineer_features(payload.model_dump())
+    with span("features"):
+        df_eng = engineer_features(payload.model_dump())
     results: dict = {}
 
     acv_dependent_features = {
@@ -446,24 +476,47 @@ def predict_compare(payload: CompareInput, models: str = "all"):
 
     for tag in selected_tags:
         m = all_m[tag]
+        # Explicitly requested tags always run and never hold the trial slot
+        claim = MODEL_HEALTH.allow(tag) if models == "all" else "run"
+        if not claim:
+            results[tag] = {
+                "error": f"Skipped: {MODEL_HEALTH.report(tag)['reason']}",
+                "skipped": True,
+            }
+            continue
+
+        timer = StageTimer()
         try:
             feature_names = m["feature_names"]
 
             needs_acv = bool(set(feature_names) & acv_dependent_features)
             if needs_acv and payload.ACV is None:
+                if claim == "trial":
+                    MODEL_HEALTH.release(tag)
                 results[tag] = {"error": "Requires ACV (missing from input)"}
                 continue
 
             X = df_eng[feature_names]
             if X.isna().any().any():
+                if claim == "trial":
+                    MODEL_HEALTH.release(tag)
                 missing = [c for c in X.columns if X[c].isna().any()]
                 results[tag] = {"error": f"Missing features: {', '.join(missing)}"}
                 continue
+            timer.lap("slice")
 
-            X_lens = m["lens_scaler"].transform(X)
-            lens_probs = m["lens_model"].predict_proba(X_lens)[0]
-            lens_classes = m["lens_model"].classes_
+            with span("score"):
+                X_lens = m["lens_scaler"].transform(X)
+                X_vault = m["vault_scaler"].transform(X)
+                timer.lap("scaler")
+
+                lens_probs = m["lens_model"].predict_proba(X_lens)[0]
+                timer.lap("predict_proba")
 
+                pred_vault = int(m["vault_model"].predict(X_vault)[0])
+                timer.lap("predict")
+
+            lens_classes = m["lens_model"].classes_
             # XGBoost stores integer-mapped classes; real labels on _vault_classes
             real_classes = getattr(m["lens_model"], "_vault_classes", lens_classes)
 
@@ -471,9 +524,6 @@ def predict_compare(payload: CompareInput, models: str = "all"):
             best_size = float(real_classes[top_idx])
             best_prob = float(lens_probs[top_idx])
 
-            X_vault = m["vault_scaler"].transform(X)
-            pred_vault = int(m["vault_model"].predict(X_vault)[0])
-
             if pred_vault < 250:
                 vault_flag = "low"
             elif pred_vault > 900:
@@ -495,7 +545,10 @@ def predict_compare(payload: CompareInput, models: str = "all"):
                 "feature_count": m["feature_count"],
                 "description": m["description"],
             }
+            MODEL_HEALTH.record(tag, timer.seconds, trial=claim == "trial")
         except Exception as exc:
+            MODEL_HEALTH.record(tag, timer.seconds, error=f"{type(exc).__name__}: {exc}",
+                                trial=claim == "trial")
             results[tag] = {"error": str(exc)}
 
     return {"predictions": results}
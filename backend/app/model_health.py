@@ -0,0 +1,202 @@
+"""
+Per-model health for /predict-compare.
+
+Every archived model's scoring is timed by stage (feature slicing, scaler
+transforms, predict_proba, predict) and its outcome recorded. A circuit
+breaker per tag drops a model from models="all" once its recent error rate
+or p95 scoring latency exceeds the budget; after a cooldown one request is
+let through as a trial, and the tag rejoins "all" if it succeeds. Tags
+requested explicitly always run, so they can still be checked by hand.
+
+Budgets come from the environment:
+    MODEL_BREAKER_WINDOW       recent calls considered per tag (20)
+    MODEL_BREAKER_MIN_CALLS    calls needed before the breaker can open (5)
+    MODEL_ERROR_BUDGET         error rate that opens the breaker (0.5)
+    MODEL_LATENCY_BUDGET_MS    p95 scoring latency that opens it (250)
+    MODEL_BREAKER_COOLDOWN_S   seconds before a trial request (60)
+
+The stage timings and outcomes are exported through /metrics whether or
+not TRACING_ENABLED is set.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from .tracing import Counter, Histogram
+
+# Imported by main.py before supabase_client loads .env
+load_dotenv()
+
+BREAKER_WINDOW = int(os.getenv("MODEL_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("MODEL_BREAKER_MIN_CALLS", "5"))
+ERROR_BUDGET = float(os.getenv("MODEL_ERROR_BUDGET", "0.5"))
+LATENCY_BUDGET_MS = float(os.getenv("MODEL_LATENCY_BUDGET_MS", "250"))
+BREAKER_COOLDOWN_S = float(os.getenv("MODEL_BREAKER_COOLDOWN_S", "60"))
+
+MODEL_STAGE_SECONDS = Histogram(
+    "vault_model_stage_duration_seconds",
+    "Time per scoring stage of each archived model in /predict-compare.",
+    ("tag", "stage"),
+)
+MODEL_PREDICTIONS = Counter(
+    "vault_model_predictions_total",
+    "Scoring attempts per archived model by outcome (ok, error, skipped).",
+    ("tag", "outcome"),
+)
+MODEL_METRICS = (MODEL_STAGE_SECONDS, MODEL_PREDICTIONS)
+
+
+class StageTimer:
+    """Seconds per scoring stage: call lap(stage) as each stage finishes."""
+
+    def __init__(self):
+        self.seconds: dict = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self._last
+        self._last = now
+
+
+class CircuitBreaker:
+    """closed -> open when over budget -> half_open after cooldown -> closed on success."""
+
+    def __init__(self):
+        self.calls = deque(maxlen=BREAKER_WINDOW)   # (ok, seconds) of recent scorings
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.reason = ""
+        self.trial_running = False
+        self.total = 0
+        self.errors = 0
+        self.skipped = 0
+        self.last_error = ""
+
+    def error_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for ok, _ in self.calls if not ok) / len(self.calls)
+
+    def p95_ms(self) -> float:
+        if not self.calls:
+            return 0.0
+        # Lower rank, so one cold-start outlier in a short window isn't the p95
+        seconds = sorted(s for _, s in self.calls)
+        return seconds[int(0.95 * (len(seconds) - 1))] * 1000
+
+    def over_budget(self) -> str:
+        if len(self.calls) < BREAKER_MIN_CALLS:
+            return ""
+        if self.error_rate() > ERROR_BUDGET:
+            return f"error rate {self.error_rate():.0%} > {ERROR_BUDGET:.0%}"
+        if self.p95_ms() > LATENCY_BUDGET_MS:
+            return f"p95 {self.p95_ms():.0f} ms > {LATENCY_BUDGET_MS:.0f} ms"
+        return ""
+
+
+class ModelHealth:
+    """Circuit breakers for every tag seen by /predict-compare."""
+
+    def __init__(self):
+        self._breakers: dict = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, tag: str) -> CircuitBreaker:
+        breaker = self._breakers.get(tag)
+        if breaker is None:
+            breaker = self._breakers[tag] = CircuitBreaker()
+        return breaker
+
+    def allow(self, tag: str) -> str:
+        """
+        Whether models="all" should score `tag` now: "run", "trial" (this
+        request claimed the half-open trial slot) or "" to skip it.
+        """
+        with self._lock:
+            breaker = self._breaker(tag)
+            if breaker.state == "closed":
+                return "run"
+            if breaker.state == "open" and time.monotonic() - breaker.opened_at >= BREAKER_COOLDOWN_S:
+                breaker.state = "half_open"
+            if breaker.state == "half_open" and not breaker.trial_running:
+                breaker.trial_running = True
+                return "trial"
+            breaker.skipped += 1
+        MODEL_PREDICTIONS.inc((tag, "skipped"))
+        return ""
+
+    def record(self, tag: str, stage_seconds: dict, error: str = "", trial: bool = False) -> None:
+        """
+        Record one scoring of `tag`: seconds per stage, and the exception text
+        if it failed. trial=True when allow() gave this request the trial slot.
+        """
+        seconds = sum(stage_seconds.values())
+        with self._lock:
+            breaker = self._breaker(tag)
+            breaker.calls.append((not error, seconds))
+            breaker.total += 1
+            if error:
+                breaker.errors += 1
+                breaker.last_error = error
+            if trial and breaker.state == "half_open":
+                breaker.trial_running = False
+                if error or seconds * 1000 > LATENCY_BUDGET_MS:
+                    self._open(tag, breaker, f"trial failed: {error or f'{seconds * 1000:.0f} ms'}")
+                else:
+                    breaker.state, breaker.reason = "closed", ""
+                    breaker.calls.clear()
+            elif breaker.state == "closed":
+                reason = breaker.over_budget()
+                if reason:
+                    self._open(tag, breaker, reason)
+        for stage, stage_secs in stage_seconds.items():
+            MODEL_STAGE_SECONDS.observe((tag, stage), stage_secs)
+        MODEL_PREDICTIONS.inc((tag, "error" if error else "ok"))
+
+    def release(self, tag: str) -> None:
+        """
+        Give back the trial slot this request claimed (allow() returned
+        "trial") when the model was not scored (bad input).
+        """
+        with self._lock:
+            self._breaker(tag).trial_running = False
+
+    @staticmethod
+    def _open(tag: str, breaker: CircuitBreaker, reason: str) -> None:
+        breaker.state = "open"
+        breaker.opened_at = time.monotonic()
+        breaker.reason = reason
+        print(f"⚠️  Model {tag} removed from compare 'all' for {BREAKER_COOLDOWN_S:.0f}s: {reason}")
+
+    def report(self, tag: str) -> dict:
+        """Breaker state and recent scoring stats for /models."""
+        with self._lock:
+            breaker = self._breaker(tag)
+            retry_in = 0.0
+            if breaker.state == "open":
+                retry_in = max(0.0, BREAKER_COOLDOWN_S - (time.monotonic() - breaker.opened_at))
+            return {
+                "state": breaker.state,
+                "in_all": breaker.state == "closed",
+                "reason": breaker.reason,
+                "retry_in_s": round(retry_in, 1),
+                "recent_calls": len(breaker.calls),
+                "recent_error_rate": round(breaker.error_rate(), 3),
+                "recent_p95_ms": round(breaker.p95_ms(), 2),
+                "total_calls": breaker.total,
+                "total_errors": breaker.errors,
+                "skipped": breaker.skipped,
+                "last_error": breaker.last_error,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+
+MODEL_HEALTH = ModelHealth()
@@ -17,6 +17,7 @@ from .supabase_client import (
     get_supabase_client,
 )
 from .main import predict, PredictionInput, load_models, predict_compare, load_all_models
+from .tracing import span
 
 # HIPAA Compliance: Import encryption module (when enabled)
 try:
@@ -115,7 +116,8 @@ async def get_current_user(authorization: str = Header(None)) -> dict:
         
         # Verify token with Supabase
         client = get_supabase_client()
-        user_response = client.auth.get_user(token)
+        with span("auth"):
+            user_response = client.auth.get_user(token)
         
         if not user_response or not user_response.user:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -161,7 +163,8 @@ async def upload_ini_file(
         raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
     
     # Extract features (strips PHI)
-    parsed = parse_ini_strip_phi(content)
+    with span("parse_ini"):
+        parsed = parse_ini_strip_phi(content)
     features = parsed["features"]
     eye = parsed["eye"]
     initials = parsed.get("initials")
@@ -197,12 +200,13 @@ async def upload_ini_file(
             
             # Update patient with encrypted PHI
             client = get_supabase_client()
-            client.table("patients").update({
-                "first_name": patient_first_name,  # Plain text for search (Supabase HIPAA encrypts at rest)
-                "last_name": patient_last_name,
-                "dob": patient_dob if patient_dob else None,
-                "encrypted_name": encrypted_last_name + b":" + encrypted_first_name if encrypted_first_name and encrypted_last_name else None,
-            }).eq("id", patient["id"]).execute()
+            with span("db.update_patient_phi"):
+                client.table("patients").update({
+                    "first_name": patient_first_name,  # Plain text for search (Supabase HIPAA encrypts at rest)
+                    "last_name": patient_last_name,
+                    "dob": patient_dob if patient_dob else None,
+                    "encrypted_name": encrypted_last_name + b":" + encrypted_first_name if encrypted_first_name and encrypted_last_name else None,
+                }).eq("id", patient["id"]).execute()
         except Exception as e:
             # Log but don't fail - still saved the scan
             print(f"PHI encryption failed: {type(e).__name__}")
@@ -337,7 +341,8 @@ async def compare_upload(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
 
-    parsed = parse_ini_strip_phi(content)
+    with span("parse_ini"):
+        parsed = parse_ini_strip_phi(content)
     features = parsed["features"]
     eye = parsed["eye"]
     patient_first_name = parsed.get("first_name", "")
@@ -9,6 +9,8 @@ from typing import Optional
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from .tracing import span, traced
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -19,7 +21,8 @@ def get_supabase_client() -> Client:
     """Get Supabase client instance."""
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY environment variables")
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    with span("supabase.connect"):
+        return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 
 def get_user_client(access_token: str) -> Client:
@@ -149,6 +152,7 @@ def parse_ini_strip_phi(ini_content: str) -> dict:
 # Database Operations
 # =============================================================================
 
+@traced("db")
 class VaultDatabase:
     """Database operations for Vault 3.0."""
     
@@ -412,6 +416,7 @@ class VaultDatabase:
 # Storage Operations
 # =============================================================================
 
+@traced("storage")
 class VaultStorage:
     """File storage operations for Vault 3.0."""
     
@@ -0,0 +1,264 @@
+"""
+Request tracing for the Vault API.
+
+Set TRACING_ENABLED=true to time each request and the spans inside it
+(auth, INI parsing, Supabase calls, feature engineering, model scoring).
+Span times are returned in a Server-Timing header and aggregated into
+histograms served by /metrics in Prometheus text format.
+
+When tracing is disabled the middleware is not installed, span() returns
+a shared no-op context manager and traced() leaves classes untouched, so
+the hot path pays one boolean check per span.
+"""
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from dotenv import load_dotenv
+
+# main.py imports this module before supabase_client loads .env
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_current_trace: ContextVar = ContextVar("vault_trace", default=None)
+
+# Every Histogram / Counter, in creation order, for render_metrics()
+REGISTRY: list = []
+
+
+class Histogram:
+    """Cumulative Prometheus histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series: dict = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, label_values: tuple, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(BUCKETS), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((key, list(c), s, n) for key, (c, s, n) in self._series.items())
+        for label_values, counts, total, count in snapshot:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Prometheus counter keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, label_values: tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for label_values, value in snapshot:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value:g}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "vault_request_duration_seconds",
+    "Time from request start to the last response byte.",
+    ("method", "route", "status"),
+)
+SPAN_SECONDS = Histogram(
+    "vault_span_duration_seconds",
+    "Time spent in instrumented spans within requests.",
+    ("span",),
+)
+
+
+# =============================================================================
+# Spans
+# =============================================================================
+
+class _Span:
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name: str, trace: list):
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.trace.append((self.name, seconds))
+        SPAN_SECONDS.observe((self.name,), seconds)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str):
+    """
+    Time a block as span `name` of the current request.
+
+    Outside a traced request (tracing disabled, a script calling the
+    handlers directly) this is a no-op.
+    """
+    if not TRACING_ENABLED:
+        return _NOOP
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _Span(name, trace)
+
+
+def traced(prefix: str):
+    """Class decorator: run every public method inside span '<prefix>.<method>'."""
+
+    def decorate(cls):
+        if not TRACING_ENABLED:
+            return cls
+        for attr, func in list(vars(cls).items()):
+            if attr.startswith("_") or not callable(func):
+                continue
+            setattr(cls, attr, _wrap(f"{prefix}.{attr}", func))
+        return cls
+
+    return decorate
+
+
+def _wrap(name: str, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+# =============================================================================
+# ASGI middleware and exposition
+# =============================================================================
+
+def server_timing(trace: list, total: float) -> str:
+    """Server-Timing header value: one entry per span name, in first-seen order."""
+    totals: dict = {}
+    calls: dict = {}
+    for name, seconds in trace:
+        totals[name] = totals.get(name, 0.0) + seconds
+        calls[name] = calls.get(name, 0) + 1
+    entries = []
+    for name, seconds in totals.items():
+        desc = f';desc="{calls[name]} calls"' if calls[name] > 1 else ""
+        entries.append(f"{name}{desc};dur={seconds * 1000:.1f}")
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware: opens a trace per HTTP request, adds the
+    Server-Timing header and records the request duration by route
+    template (e.g. /beta/scans/{scan_id}) so IDs don't become labels.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace: list = []
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(trace, time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(
+                (scope["method"], route_path, str(status)), time.perf_counter() - start
+            )
+
+
+def render_metrics(metrics=None) -> str:
+    """`metrics` (default: every registered metric) in Prometheus text exposition format."""
+    lines = [line for metric in (REGISTRY if metrics is None else metrics) for line in metric.render()]
+    return "\n".join(lines) + "\n"
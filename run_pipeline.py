@@ -4,7 +4,7 @@ ICL Vault Prediction - Master Pipeline
 Automated end-to-end workflow from INI files to training dataset.
 
 Usage:
-    python run_pipeline.py
+    python run_pipeline.py [--full] [--jobs N] [--serial]
 
 This will:
 1. Convert Excel to CSV (canonical data/excel path)
@@ -14,14 +14,36 @@ This will:
 5. Extract features for ML training
 6. Run post-extraction audit and enforce feature gates
 7. Generate summary report
+
+All stages run in this process as a dependency graph (see stage_dag.py):
+the Excel conversion runs alongside INI processing + the preprocessing
+audit, and matching runs alongside feature extraction. Stages share the
+roster and one parse of every XML, hand their DataFrames to the audit
+directly, and the per-stage timings / row counts are saved to
+data/processed/pipeline_report.json.
+
+--full ignores the stage manifests, --jobs sets INI conversion workers and
+--serial runs one stage at a time.
 """
 
-import subprocess
 import sys
 import os
 import csv
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "pipeline"))
+
+import data_audit  # noqa: E402
+from cli_args import pop_jobs_arg  # noqa: E402
+from exam_store import list_xml_names  # noqa: E402
+import extract_features  # noqa: E402
+import ini_to_xml  # noqa: E402
+import match_xml_csv  # noqa: E402
+from excel_to_csv import excel_to_csv  # noqa: E402
+from feature_config import TRAINING_FEATURES  # noqa: E402
+from stage_dag import Stage, run_stages, print_report, save_report  # noqa: E402
+from xml_reader import PATIENT_INFO_KEYS, shared_entry_cache  # noqa: E402
+
 EXCEL_XLSX = "data/excel/VAULT 3.0.xlsx"
 EXCEL_CSV = "data/excel/VAULT 3.0.csv"
 PROCESSED_DIR = "data/processed"
@@ -31,25 +53,9 @@ FLAGGED_INCOMPLETE = f"{PROCESSED_DIR}/flagged_incomplete_cases.csv"
 AUDIT_MISSING_XML = f"{PROCESSED_DIR}/missing_xml_ids.csv"
 AUDIT_NONSTANDARD_XML = f"{PROCESSED_DIR}/nonstandard_xml_filenames.csv"
 AUDIT_DUPLICATE_XML = f"{PROCESSED_DIR}/duplicate_xml_ids.csv"
+RUN_REPORT = f"{PROCESSED_DIR}/pipeline_report.json"
 
 
-def run_command(cmd, description):
-    """Run a shell command and report status."""
-    print(f"\n{'='*70}")
-    print(f"STEP: {description}")
-    print(f"{'='*70}")
-    
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    
-    if result.returncode == 0:
-        print(result.stdout)
-        print(f"✅ {description} - COMPLETE")
-        return True
-    else:
-        print(f"❌ {description} - FAILED")
-        print(result.stderr)
-        return False
-
 def csv_row_count(path):
     if not os.path.exists(path):
         return 0
@@ -86,13 +92,14 @@ def check_files():
         'Excel roster': EXCEL_XLSX,
         'Images folder': 'data/images',
         'XML folder': 'XML files',
-        'Virtual env': 'venv',
+        'stage_dag.py': 'scripts/pipeline/stage_dag.py',
         'excel_to_csv.py': 'scripts/pipeline/excel_to_csv.py',
         'ini_to_xml.py': 'scripts/pipeline/ini_to_xml.py',
         'match_xml_csv.py': 'scripts/pipeline/match_xml_csv.py',
         'extract_features.py': 'scripts/pipeline/extract_features.py',
         'feature_config.py': 'scripts/pipeline/feature_config.py',
         'data_audit.py': 'scripts/pipeline/data_audit.py',
+        'manifest.py': 'scripts/pipeline/manifest.py',
     }
     
     all_ok = True
@@ -117,8 +124,129 @@ def check_files():
     return True
 
 
+def has_images_to_process():
+    """True if data/images has ZIP or INI files for the INI stage."""
+    if not os.path.exists('data/images'):
+        return False
+    files = [f for f in os.listdir('data/images') if os.path.isfile(os.path.join('data/images', f))]
+    return any(f.lower().endswith('.zip') or f.upper().endswith('.INI') for f in files)
+
+
+def xml_file_count():
+    return len(list_xml_names(ini_to_xml.XML_OUTPUT_DIR))
+
+
+def build_stages(full=False, jobs=1):
+    """The pipeline DAG. Each stage gets its dependencies' results."""
+
+    def convert_excel(_):
+        os.makedirs("data/excel", exist_ok=True)
+        return excel_to_csv(EXCEL_XLSX, EXCEL_CSV, full=full)
+
+    def process_inis(_):
+        if has_images_to_process():
+            ini_to_xml.auto_process(jobs)
+        else:
+            print("⚠️  No data/images folder or no ZIP/INI files found - skipping INI processing")
+        # Later stages read exams from the store; add any XMLs it lacks
+        ini_to_xml.sync_exam_store()
+        return xml_file_count()
+
+    def preprocessing_audit(_):
+        summary = data_audit.audit()
+        run_preprocessing_gates()
+        return summary
+
+    def match(_):
+        return match_xml_csv.match_xml_to_csv(full=full)
+
+    def extract(_):
+        return extract_features.extract_all_features(full=full)
+
+    def post_audit(results):
+        summary = data_audit.audit(matched_df=results['match'], training_df=results['extract'])
+        run_feature_gates()
+        return summary
+
+    return [
+        Stage('excel', convert_excel, description="Convert Excel roster to CSV",
+              rows=lambda path: csv_row_count(EXCEL_CSV)),
+        Stage('ini', process_inis, description="Process INI files",
+              rows=lambda count: count),
+        Stage('preaudit', preprocessing_audit, deps=['ini'], description="Preprocessing audit",
+              rows=lambda summary: summary['xml_files']),
+        Stage('match', match, deps=['excel', 'preaudit'], description="Match XML files with CSV"),
+        Stage('extract', extract, deps=['excel', 'preaudit'], description="Extract features"),
+        Stage('postaudit', post_audit, deps=['match', 'extract'], description="Post-extraction audit",
+              rows=lambda summary: summary.get('trainable')),
+    ]
+
+
+def print_summary(df):
+    """Summarise the training data produced by this run."""
+    print(f"\n{'='*70}")
+    print("PIPELINE SUMMARY")
+    print(f"{'='*70}")
+
+    print()
+    print("Files generated:")
+    print("  ✓ data/excel/VAULT 3.0.csv - Roster in CSV format")
+    print("  ✓ data/processed/roster.md - Quick reference of processed XMLs")
+    print("  ✓ data/processed/exams.parquet - Compressed store of every exam")
+    print("  ✓ data/processed/matched_patients.csv - XML↔CSV crosswalk")
+    print("  ✓ data/processed/training_data.csv - ML training dataset")
+    print("  ✓ data/processed/training_data.parquet - Typed dataset for trainers")
+    print("  ✓ data/processed/flagged_incomplete_cases.csv - Outcomes but missing features")
+    print(f"  ✓ {RUN_REPORT} - Stage timings and row counts")
+
+    if df is not None:
+        training_features = TRAINING_FEATURES
+
+        both_outcomes = df[['Vault', 'Lens_Size']].notna().all(axis=1)
+        # Check configurable features used in training
+        all_features = df[training_features].notna().all(axis=1)
+        complete = all_features & both_outcomes
+
+        print()
+        print(f"Total XML files processed: {len(df)}")
+        print(f"  With Vault + Lens Size: {both_outcomes.sum()}")
+        print(f"  With {len(training_features)} training features: {all_features.sum()}")
+        print()
+        print(f"🎯 COMPLETE TRAINING CASES: {complete.sum()}/{len(df)}")
+
+        # Flag incomplete cases (already saved by extract_features.py)
+        incomplete = both_outcomes & ~all_features
+        if incomplete.sum() > 0:
+            print()
+            print(f"⚠️  {incomplete.sum()} cases have outcomes but missing features:")
+            print("   → Saved to: data/processed/flagged_incomplete_cases.csv")
+            incomplete_df = df[incomplete]
+
+            # Show what's missing
+            for col in training_features:
+                missing = incomplete_df[col].isnull().sum()
+                if missing > 0:
+                    print(f"      {missing} missing {col}")
+    else:
+        print("⚠️  data/processed/training_data.csv not found")
+
+    print()
+    print("="*70)
+    print("✅ PIPELINE COMPLETE")
+    print("="*70)
+    print()
+    print("Next steps:")
+    print("  1. Review data/processed/flagged_incomplete_cases.csv (if exists)")
+    print("  2. Use data/processed/training_data.csv for ML model training")
+    print("  3. Re-run this pipeline when adding new INI batches")
+
+
 def main():
     """Run the complete pipeline."""
+    jobs = pop_jobs_arg(sys.argv)
+    full = '--full' in sys.argv
+    serial = '--serial' in sys.argv
+
     print("\n" + "="*70)
     print("ICL VAULT PREDICTION - AUTOMATED PIPELINE")
     print("="*70)
@@ -127,157 +255,23 @@ def main():
     # Pre-flight check
     if not check_files():
         sys.exit(1)
-    
-    # Step 1: Convert Excel to CSV (canonical path)
-    os.makedirs("data/excel", exist_ok=True)
-    success = run_command(
-        f"source venv/bin/activate && python scripts/pipeline/excel_to_csv.py \"{EXCEL_XLSX}\" \"{EXCEL_CSV}\"",
-        "Convert Excel roster to CSV"
-    )
-    if not success:
-        print("\n❌ Pipeline failed at Excel conversion")
-        sys.exit(1)
-    
-    # Step 2: Process INI files (unzip + convert to XML)
-    # Check if there are any files to process
-    if os.path.exists('data/images'):
-        has_zip = any(f.lower().endswith('.zip') for f in os.listdir('data/images') if os.path.isfile(os.path.join('data/images', f)))
-        has_ini = any(f.upper().endswith('.INI') for f in os.listdir('data/images') if os.path.isfile(os.path.join('data/images', f)))
-    else:
-        has_zip = False
-        has_ini = False
-    
-    if has_zip or has_ini:
-        success = run_command(
-            "source venv/bin/activate && python scripts/pipeline/ini_to_xml.py --auto",
-            "Process INI files (unzip + convert to XML)"
-        )
-        if not success:
-            print("\n❌ Pipeline failed at INI processing")
-            sys.exit(1)
-    else:
-        print("\n⚠️  No data/images folder or no ZIP/INI files found - skipping INI processing")
-    
-    # Step 3: Preprocessing audit (XML integrity gates)
-    success = run_command(
-        "source venv/bin/activate && python scripts/pipeline/data_audit.py",
-        "Run preprocessing audit (XML integrity)"
-    )
-    if not success:
-        print("\n❌ Pipeline failed at preprocessing audit")
-        sys.exit(1)
-    run_preprocessing_gates()
-
-    # Step 4: Match XML to CSV
-    success = run_command(
-        "source venv/bin/activate && python scripts/pipeline/match_xml_csv.py",
-        "Match XML files with CSV roster"
-    )
-    if not success:
-        print("\n❌ Pipeline failed at XML-CSV matching")
-        sys.exit(1)
-    
-    # Step 5: Extract features
-    success = run_command(
-        "source venv/bin/activate && python scripts/pipeline/extract_features.py",
-        "Extract features for ML training"
-    )
-    if not success:
-        print("\n❌ Pipeline failed at feature extraction")
-        sys.exit(1)
-    
-    # Step 6: Post-extraction audit (outputs + readiness)
-    success = run_command(
-        "source venv/bin/activate && python scripts/pipeline/data_audit.py",
-        "Run post-extraction data audit"
-    )
-    if not success:
-        print("\n❌ Pipeline failed at data audit")
+
+    # Matching and feature extraction share one parse of each XML
+    xml_keys = set(PATIENT_INFO_KEYS) | extract_features.XML_FEATURE_KEYS
+    with shared_entry_cache(xml_keys):
+        results, report = run_stages(build_stages(full=full, jobs=jobs),
+                                     max_workers=1 if serial else None)
+
+    print_report(report)
+    save_report(report, RUN_REPORT)
+    print(f"\nRun report saved to: {RUN_REPORT}")
+
+    if not report['ok']:
+        failed = [e['description'] for e in report['stages'] if e['status'] == 'failed']
+        print(f"\n❌ Pipeline failed at: {', '.join(failed)}")
         sys.exit(1)
-    run_feature_gates()
 
-    # Step 7: Generate summary report
-    print(f"\n{'='*70}")
-    print("PIPELINE SUMMARY")
-    print(f"{'='*70}")
-    
-    # Run summary analysis
-    summary_cmd = """
-import pandas as pd
-import os
-import importlib.util
-
-def load_training_features():
-    config_path = os.path.join(os.getcwd(), "scripts/pipeline/feature_config.py")
-    spec = importlib.util.spec_from_file_location("feature_config", config_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module.TRAINING_FEATURES
-
-print()
-print("Files generated:")
-print("  ✓ data/excel/VAULT 3.0.csv - Roster in CSV format")
-print("  ✓ data/processed/roster.md - Quick reference of processed XMLs")
-print("  ✓ data/processed/matched_patients.csv - XML↔CSV crosswalk")
-print("  ✓ data/processed/training_data.csv - ML training dataset")
-print("  ✓ data/processed/flagged_incomplete_cases.csv - Outcomes but missing features")
-
-if os.path.exists('data/processed/training_data.csv'):
-    df = pd.read_csv('data/processed/training_data.csv')
-    training_features = load_training_features()
-    
-    both_outcomes = df[['Vault','Lens_Size']].notna().all(axis=1)
-    # Check configurable features used in training
-    all_features = df[training_features].notna().all(axis=1)
-    complete = all_features & both_outcomes
-    
-    print()
-    print(f"Total XML files processed: {len(df)}")
-    print(f"  With Vault + Lens Size: {both_outcomes.sum()}")
-    print(f"  With {len(training_features)} training features: {all_features.sum()}")
-    print()
-    print(f"🎯 COMPLETE TRAINING CASES: {complete.sum()}/{len(df)}")
-    
-    # Flag incomplete cases (already saved by extract_features.py)
-    incomplete = both_outcomes & ~all_features
-    if incomplete.sum() > 0:
-        print()
-        print(f"⚠️  {incomplete.sum()} cases have outcomes but missing features:")
-        print("   → Saved to: data/processed/flagged_incomplete_cases.csv")
-        incomplete_df = df[incomplete]
-        
-        # Show what's missing
-        for col in training_features:
-            missing = incomplete_df[col].isnull().sum()
-            if missing > 0:
-                print(f"      {missing} missing {col}")
-    
-    # Flag validation warnings
-    if 'validation_warnings' in df.columns:
-        has_warnings = df['validation_warnings'].notna() & (df['validation_warnings'] != '')
-        if has_warnings.sum() > 0:
-            print()
-            print(f"⚠️  {has_warnings.sum()} cases have validation warnings")
-            print("   → Check extract_features.py output for details")
-else:
-    print("⚠️  data/processed/training_data.csv not found")
-
-print()
-print("="*70)
-print("✅ PIPELINE COMPLETE")
-print("="*70)
-print()
-print("Next steps:")
-print("  1. Review data/processed/flagged_incomplete_cases.csv (if exists)")
-print("  2. Use data/processed/training_data.csv for ML model training")
-print("  3. Re-run this pipeline when adding new INI batches")
-"""
-    
-    summary_cmd_escaped = summary_cmd.replace('"', '\\"')
-    subprocess.run(
-        f"source venv/bin/activate && python3 -c \"{summary_cmd_escaped}\"",
-        shell=True
-    )
+    print_summary(results.get('extract'))
     
     print(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print()
@@ -285,4 +279,3 @@ print("  3. Re-run this pipeline when adding new INI batches")
 
 if __name__ == '__main__':
     main()
-
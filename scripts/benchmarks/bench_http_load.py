@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+HTTP load test of the FastAPI app against a local fake of Supabase.
+
+Starts fake_supabase.py (with --latency-ms injected into every Supabase
+call) and the app under uvicorn pointed at it, then
+1. seeds a few uploads per user,
+2. profiles each request type one at a time: Supabase round trips and new
+   connections per request, next to how many rows the user has,
+3. replays a weighted mix of /beta/upload, /beta/compare-upload,
+   /beta/scans, /beta/patients and /predict built from the data/test_ini
+   INIs with --concurrency clients, reporting throughput and p50/p95/p99,
+4. profiles again: round trips that grow with the user's rows are N+1
+   queries; connections per request show client churn.
+
+The report is versioned JSON in data/processed/benchmarks/, compared with
+a saved baseline like bench_inference.py: any rise in round trips per
+request, or a p50 slowdown beyond --threshold, is flagged.
+
+Run it with the backend's Python environment (backend/requirements.txt).
+
+Usage:
+    python scripts/benchmarks/bench_http_load.py [--requests N] [--concurrency C] [--latency-ms MS]
+    python scripts/benchmarks/bench_http_load.py --mix upload=1,scans=4 --save-baseline
+    python scripts/benchmarks/bench_http_load.py --fail-on-regression
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlencode
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+FAKE_SCRIPT = Path(__file__).resolve().parent / "fake_supabase.py"
+INI_DIR = PROJECT_ROOT / "data" / "test_ini"
+BENCH_DIR = PROJECT_ROOT / "data" / "processed" / "benchmarks"
+REPORT_FILE = BENCH_DIR / "http_load.json"
+BASELINE_FILE = BENCH_DIR / "http_load_baseline.json"
+
+REPORT_VERSION = 1
+HOST = "127.0.0.1"
+# Any JWT-shaped string passes the supabase client's key check
+FAKE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.loadtest"
+DEFAULT_MIX = "upload=2,compare-upload=1,scans=3,patients=2,predict=2"
+PREDICT_FIELDS = [
+    "Age", "WTW", "ACD_internal", "ICL_Power", "AC_shape_ratio",
+    "SimK_steep", "ACV", "TCRP_Km", "TCRP_Astigmatism",
+]
+ICL_POWER = -10.0
+# Entered by hand in the frontend when the INI lacks it; filled in so
+# uploads take the prediction path (typical white-to-white, mm)
+WTW_KEY = "Cornea Dia Horizontal"
+DEFAULT_WTW = 11.8
+SEED_UPLOADS = 2          # per user, before the first profile
+PROFILE_REPEATS = 3
+STARTUP_TIMEOUT = 120
+REGRESSION_THRESHOLD = 0.20
+MIN_FLAG_SAMPLES = 20     # p50 of fewer requests is too noisy to flag
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, path, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=5)
+            conn.request("GET", path)
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} not ready after {timeout}s")
+
+
+class Process:
+    """A child server process, stopped on exit."""
+
+    def __init__(self, args, port, ready_path, env=None):
+        self.args, self.port, self.ready_path, self.env = args, port, ready_path, env
+
+    def __enter__(self):
+        self.proc = subprocess.Popen(self.args, cwd=PROJECT_ROOT, env=self.env)
+        try:
+            wait_for(self.port, self.ready_path, STARTUP_TIMEOUT)
+        except RuntimeError:
+            self.proc.kill()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class Client:
+    """One keep-alive connection to the app (one virtual user session)."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, seconds, parsed JSON or None); reconnects once on a dropped connection."""
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(HOST, self.port, timeout=120)
+            start = time.perf_counter()
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+                continue
+            elapsed = time.perf_counter() - start
+            try:
+                payload = json.loads(data) if data else None
+            except ValueError:
+                payload = None
+            return response.status, elapsed, payload
+
+
+def fake_call(port, method, path):
+    conn = http.client.HTTPConnection(HOST, port, timeout=30)
+    conn.request(method, path)
+    return json.loads(conn.getresponse().read())
+
+
+def multipart(filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Workload:
+    """Builds the HTTP request for each operation from the test INIs."""
+
+    def __init__(self, inis, predict_payloads, users):
+        self.inis = inis                        # [(filename, bytes)]
+        self.predict_payloads = predict_payloads
+        self.users = users                      # bearer tokens
+
+    def build(self, op, seq, token=None):
+        """(method, path, body, headers) of request `seq` of type `op` (users take turns)."""
+        token = token or self.users[seq % len(self.users)]
+        auth = {"Authorization": f"Bearer {token}"}
+        if op in ("upload", "compare-upload"):
+            filename, content = self.inis[seq % len(self.inis)]
+            body, content_type = multipart(filename, content)
+            query = urlencode({"anonymous_id": f"LT-{seq:05d}", "icl_power": ICL_POWER})
+            return "POST", f"/beta/{op}?{query}", body, {**auth, "Content-Type": content_type}
+        if op in ("scans", "patients"):
+            return "GET", f"/beta/{op}", None, auth
+        if op == "predict":
+            payload = self.predict_payloads[seq % len(self.predict_payloads)]
+            return "POST", "/predict", json.dumps(payload), {"Content-Type": "application/json"}
+        raise ValueError(f"unknown operation '{op}'")
+
+
+def load_inis(directory, wtw=DEFAULT_WTW):
+    """(filename, bytes) of every INI, with a WTW line added where it has no value."""
+    inis = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() != ".ini":
+            continue
+        content = path.read_bytes()
+        if wtw and not re.search(rf"^{WTW_KEY}=[ \t]*\S".encode(), content, re.MULTILINE):
+            content = content.rstrip(b"\r\n") + f"\n{WTW_KEY}={wtw}\n".encode()
+        inis.append((path.name, content))
+    if not inis:
+        raise SystemExit(f"No INI files in {directory}")
+    return inis
+
+
+def predict_payloads(client, inis):
+    """/predict bodies from the INIs, parsed by the app's own /parse-ini."""
+    payloads = []
+    for filename, content in inis:
+        body, content_type = multipart(filename, content)
+        status, _, parsed = client.request("POST", "/parse-ini", body, {"Content-Type": content_type})
+        if status != 200:
+            continue
+        features = {**parsed["extracted"], "ICL_Power": ICL_POWER}
+        if all(features.get(field) is not None for field in PREDICT_FIELDS):
+            payloads.append({field: features[field] for field in PREDICT_FIELDS})
+    return payloads
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(","):
+        op, _, weight = item.partition("=")
+        mix[op.strip()] = float(weight or 1)
+    unknown = set(mix) - {"upload", "compare-upload", "scans", "patients", "predict"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown operations: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_stats(samples, wall_seconds):
+    times = [seconds for _, seconds in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(status >= 400 for status, _ in samples),
+        "p50_ms": percentile(times, 50) * 1000,
+        "p95_ms": percentile(times, 95) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "max_ms": max(times) * 1000,
+        "rps": len(samples) / wall_seconds,
+    }
+
+
+def run_load(port, workload, ops, concurrency):
+    """Replay `ops` with `concurrency` clients; returns ({op: [(status, s)]}, wall s)."""
+    samples = {op: [] for op in set(ops)}
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def worker():
+        client = Client(port)
+        while True:
+            with lock:
+                seq = next(counter)
+            if seq >= len(ops):
+                return
+            op = ops[seq]
+            method, path, body, headers = workload.build(op, seq)
+            try:
+                status, seconds, _ = client.request(method, path, body, headers)
+            except (http.client.HTTPException, OSError):
+                status, seconds = 599, 0.0
+            with lock:
+                samples[op].append((status, seconds))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def profile(port, fake_port, workload, ops, seq):
+    """
+    Supabase round trips / connections of each op, run one at a time as users[0].
+
+    Reads go first, so they see the user_rows recorded here.
+    """
+    ops = sorted(ops, key=lambda op: op in ("upload", "compare-upload"))
+    client = Client(port)
+    token = workload.users[0]
+    rows = fake_call(fake_port, "GET", f"/_fake/stats?user={token}").get("user_rows", {})
+    result = {"user_rows": {table: rows.get(table, 0) for table in ("patients", "scans")}}
+    for op in ops:
+        runs = []
+        for _ in range(PROFILE_REPEATS):
+            seq += 1
+            method, path, body, headers = workload.build(op, seq, token)
+            fake_call(fake_port, "POST", "/_fake/reset")
+            status, seconds, _ = client.request(method, path, body, headers)
+            stats = fake_call(fake_port, "GET", "/_fake/stats")
+            runs.append((stats["round_trips"], stats["connections"], seconds, status, stats["requests"]))
+        result[op] = {
+            "round_trips": statistics.median(run[0] for run in runs),
+            "connections": statistics.median(run[1] for run in runs),
+            "ms": statistics.median(run[2] for run in runs) * 1000,
+            "status": runs[-1][3],
+            "calls": runs[-1][4],
+        }
+    return result, seq
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """p50 deltas and round-trip changes against a baseline report."""
+    deltas, regressions = {}, []
+    for op, stats in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(op)
+        if old and old["p50_ms"]:
+            delta = stats["p50_ms"] / old["p50_ms"] - 1
+            deltas[f"{op}/p50_ms"] = delta
+            if delta > threshold and min(stats["requests"], old["requests"]) >= MIN_FLAG_SAMPLES:
+                regressions.append(f"{op} p50 {old['p50_ms']:.1f} → {stats['p50_ms']:.1f}ms ({delta:+.0%})")
+    for phase in ("before", "after"):
+        for op, stats in report["profile"][phase].items():
+            old = baseline.get("profile", {}).get(phase, {}).get(op)
+            if op == "user_rows" or not old:
+                continue
+            for key in ("round_trips", "connections"):
+                if stats[key] > old[key]:
+                    regressions.append(f"{op} {key} ({phase} load) {old[key]:g} → {stats[key]:g}")
+    return {
+        "created": baseline.get("created"),
+        "git_commit": baseline.get("git_commit"),
+        "same_config": baseline.get("config") == report["config"],
+        "deltas": deltas,
+        "regressions": regressions,
+    }
+
+
+def print_report(report):
+    print("\n" + "=" * 70)
+    print(f"LOAD: {report['total']['requests']} requests, concurrency {report['config']['concurrency']}, "
+          f"Supabase latency {report['config']['latency_ms']}ms")
+    print("=" * 70)
+    print(f"{'Request':<16} {'n':>5} {'err':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'req/s':>7}")
+    for op, stats in sorted(report["endpoints"].items()):
+        print(f"{op:<16} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>7.1f}ms "
+              f"{stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms {stats['max_ms']:>7.1f}ms "
+              f"{stats['rps']:>7.1f}")
+    total = report["total"]
+    print(f"\nThroughput: {total['rps']:.1f} req/s over {total['wall_seconds']:.1f}s; "
+          f"{total['round_trips_per_request']:.1f} Supabase round trips and "
+          f"{total['connections_per_request']:.1f} new connections per request")
+
+    print("\nSupabase calls per request (one at a time, before → after the load):")
+    before, after = report["profile"]["before"], report["profile"]["after"]
+    print(f"  user rows: {before['user_rows']} → {after['user_rows']}")
+    for op in report["config"]["mix"]:
+        b, a = before[op], after[op]
+        growth = " ⚠️  grows with rows (N+1)" if a["round_trips"] > b["round_trips"] else ""
+        print(f"  {op:<16} round trips {b['round_trips']:>5g} → {a['round_trips']:<5g} "
+              f"connections {b['connections']:>3g} → {a['connections']:<3g}{growth}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test against a local fake Supabase")
+    parser.add_argument("--requests", type=int, default=300, help="requests in the load phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=4, help="distinct bearer tokens")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--latency-ms", default="20",
+                        help="injected Supabase latency: MS, or rest=MS,auth=MS,storage=MS")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--ini-dir", type=Path, default=INI_DIR)
+    parser.add_argument("--wtw", type=float, default=DEFAULT_WTW,
+                        help="WTW (mm) added to INIs without one; 0 leaves them as they are")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=REPORT_FILE)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="also save this report as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 on a flagged regression")
+    args = parser.parse_args()
+
+    inis = load_inis(args.ini_dir, args.wtw)
+    fake_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": f"http://{HOST}:{fake_port}",
+        "SUPABASE_SERVICE_KEY": FAKE_KEY,
+        "SUPABASE_ANON_KEY": FAKE_KEY,
+    }
+    fake_cmd = [sys.executable, str(FAKE_SCRIPT), "--port", str(fake_port),
+                "--latency-ms", args.latency_ms, "--jitter-ms", str(args.jitter_ms)]
+    app_cmd = [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--host", HOST,
+               "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"]
+
+    print("=" * 70)
+    print(f"HTTP load test: {len(inis)} INIs, {args.users} users, mix {args.mix}")
+    print("=" * 70)
+    with Process(fake_cmd, fake_port, "/_fake/stats"), Process(app_cmd, app_port, "/health", env):
+        client = Client(app_port)
+        workload = Workload(inis, predict_payloads(client, inis),
+                            [f"loadtest-user-{i}" for i in range(args.users)])
+        if not workload.predict_payloads:
+            args.mix.pop("predict", None)
+            print("⚠️  No INI has every /predict field; predict left out of the mix")
+
+        seq = 10**6             # profile / seed requests get their own anonymous ids
+        for _ in range(SEED_UPLOADS * args.users):
+            seq += 1
+            client.request(*workload.build("upload", seq))
+        before, seq = profile(app_port, fake_port, workload, list(args.mix), seq)
+
+        rng = random.Random(args.seed)
+        ops = rng.choices(list(args.mix), weights=list(args.mix.values()), k=args.requests)
+        fake_call(fake_port, "POST", "/_fake/reset")
+        print(f"  replaying {len(ops)} requests...")
+        samples, wall = run_load(app_port, workload, ops, args.concurrency)
+        totals = fake_call(fake_port, "GET", "/_fake/stats")
+
+        after, seq = profile(app_port, fake_port, workload, list(args.mix), seq)
+
+    all_samples = [sample for op_samples in samples.values() for sample in op_samples]
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "environment": {"host": platform.node(), "python": platform.python_version(),
+                        "cpus": os.cpu_count()},
+        "config": {"requests": args.requests, "concurrency": args.concurrency, "users": args.users,
+                   "mix": args.mix, "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                   "workers": args.workers, "seed": args.seed, "inis": len(inis), "wtw": args.wtw},
+        "total": {
+            **latency_stats(all_samples, wall),
+            "wall_seconds": wall,
+            "round_trips_per_request": totals["round_trips"] / len(all_samples),
+            "connections_per_request": totals["connections"] / len(all_samples),
+            "supabase_calls": totals["requests"],
+        },
+        "endpoints": {op: latency_stats(op_samples, wall) for op, op_samples in samples.items()},
+        "profile": {"before": before, "after": after},
+    }
+    print_report(report)
+
+    comparison = None
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("version") == REPORT_VERSION:
+            comparison = compare(report, baseline, args.threshold)
+            report["baseline"] = comparison
+            print(f"\nCompared with baseline {comparison['created']} ({comparison['git_commit']}):")
+            if not comparison["same_config"]:
+                print("  ⚠️  baseline used a different configuration")
+            for key, delta in comparison["deltas"].items():
+                print(f"  {key:<28} {delta:+7.1%}")
+            for line in comparison["regressions"]:
+                print(f"  ⚠️  {line}")
+            if not comparison["regressions"]:
+                print("  ✅ No regressions")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2))
+    print(f"\n✅ Report written to {args.out}")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"✅ Saved as baseline {args.baseline}")
+
+    if args.fail_on_regression and comparison and comparison["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Benchmark inference for every model archive.
+
+For each complete archive in models/archives/ this measures
+- cold load: seconds and RSS growth to unpickle the archive in a fresh
+  interpreter (median of --load-repeats), plus its size on disk,
+- predict: p50/p99 latency and throughput for one patient through both
+  scalers and models, the path /predict and /predict-compare take,
+- batch predict: the same for batches of 1 to 1024 patients,
+and, when the backend's dependencies are installed, the /predict and
+/predict-compare handlers themselves (validation, feature engineering,
+every archive).
+
+Inputs are rows sampled with replacement (fixed seed) from the training
+dataset, so feature values follow real patients.
+
+The report is versioned JSON in data/processed/benchmarks/. If a baseline
+report exists it is compared metric by metric and slowdowns beyond
+--threshold are flagged. Timings depend on the machine, so baselines are
+kept locally: save one before a model or code change, rerun after it.
+
+Usage:
+    python scripts/benchmarks/bench_inference.py [--only TAG ...] [--calls N]
+    python scripts/benchmarks/bench_inference.py --save-baseline
+    python scripts/benchmarks/bench_inference.py --fail-on-regression
+"""
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
+sys.path.append(str(PROJECT_ROOT))
+
+from training_dataset import ENGINEERED_FEATURES, complete_cases, load_training_data  # noqa: E402
+
+try:
+    from backend.app import main as api
+except ImportError:  # FastAPI / backend requirements not installed
+    api = None
+
+warnings.filterwarnings("ignore")
+
+REPORT_VERSION = 1
+ARCHIVES_DIR = PROJECT_ROOT / "models" / "archives"
+BENCH_DIR = PROJECT_ROOT / "data" / "processed" / "benchmarks"
+REPORT_FILE = BENCH_DIR / "inference.json"
+BASELINE_FILE = BENCH_DIR / "inference_baseline.json"
+
+# Same archive layout backend/app/main.py loads
+PKL_FILES = [
+    "lens_size_model.pkl",
+    "lens_size_scaler.pkl",
+    "vault_model.pkl",
+    "vault_scaler.pkl",
+    "feature_names.pkl",
+]
+# Request fields of the /predict payload
+API_FIELDS = [
+    "Age", "WTW", "ACD_internal", "ICL_Power", "AC_shape_ratio",
+    "SimK_steep", "ACV", "TCRP_Km", "TCRP_Astigmatism",
+]
+BATCH_SIZES = [1, 8, 64, 256, 1024]
+BATCH_ROWS = 4096         # rows predicted per batch size (at least MIN_REPEATS batches)
+MIN_REPEATS = 5
+WARMUP = 3
+REGRESSION_THRESHOLD = 0.20
+# Compared against the baseline; p99 is reported but too noisy to flag
+FLAGGED_METRICS = ("p50_ms", "seconds", "rss_mb")
+
+
+def archive_dirs(archives_dir=ARCHIVES_DIR, only=None):
+    """Complete archives (all PKL_FILES present), by tag."""
+    dirs = {}
+    for folder in sorted(Path(archives_dir).iterdir()):
+        if not folder.is_dir() or folder.name.startswith("."):
+            continue
+        if only and folder.name not in only:
+            continue
+        if all((folder / f).exists() for f in PKL_FILES):
+            dirs[folder.name] = folder
+    return dirs
+
+
+def load_archive(folder):
+    archive = {}
+    for filename in PKL_FILES:
+        with (folder / filename).open("rb") as f:
+            archive[filename[:-4]] = pickle.load(f)
+    return archive
+
+
+def current_rss_mb():
+    """Resident memory of this process now (Linux), else its peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def probe_load(folder):
+    """Run in a fresh interpreter: time and memory to unpickle one archive."""
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    load_archive(Path(folder))
+    seconds = time.perf_counter() - start
+    rss_after = current_rss_mb()
+    rss = None if rss_before is None else rss_after - rss_before
+    print(json.dumps({"seconds": seconds, "rss_mb": rss}))
+
+
+def cold_load(folder, repeats):
+    """Median cold-load seconds and RSS growth over `repeats` fresh interpreters."""
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, __file__, "--probe-load", str(folder)],
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    rss = [run["rss_mb"] for run in runs if run["rss_mb"] is not None]
+    return {
+        "seconds": float(np.median([run["seconds"] for run in runs])),
+        "rss_mb": float(np.median(rss)) if rss else None,
+        "repeats": repeats,
+    }
+
+
+def sample_inputs(n, seed):
+    """n patients sampled from the training data, with engineered features."""
+    df = load_training_data(API_FIELDS + ENGINEERED_FEATURES)
+    pool = complete_cases(df, API_FIELDS).reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    return pool, pool.iloc[rng.integers(0, len(pool), n)].reset_index(drop=True)
+
+
+def predict_rows(archive, X):
+    """Lens size probabilities and vault for the rows of X, as the API computes them."""
+    lens_probs = archive["lens_size_model"].predict_proba(archive["lens_size_scaler"].transform(X))
+    vault = archive["vault_model"].predict(archive["vault_scaler"].transform(X))
+    return lens_probs, vault
+
+
+def time_calls(fn, inputs, rows_per_call=1):
+    """p50/p99/mean latency and rows/s of fn over `inputs` (after WARMUP calls)."""
+    for arg in inputs[:WARMUP]:
+        fn(arg)
+    times = []
+    for arg in inputs:
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+    times = np.array(times)
+    return {
+        "calls": len(times),
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p99_ms": float(np.percentile(times, 99) * 1000),
+        "mean_ms": float(times.mean() * 1000),
+        "rows_per_s": float(rows_per_call * len(times) / times.sum()),
+    }
+
+
+def bench_archive(folder, inputs, calls, load_repeats, rng):
+    """Load, single-row and batch figures for one archive, or {'error': ...}."""
+    try:
+        archive = load_archive(folder)
+        X = inputs[archive["feature_names"]]
+        predict_rows(archive, X.head(1))
+    except Exception as exc:  # e.g. pickled with an incompatible library version
+        return {"error": f"{type(exc).__name__}: {exc}".splitlines()[0]}
+    result = {
+        "disk_bytes": sum((folder / f).stat().st_size for f in PKL_FILES),
+        "feature_count": len(archive["feature_names"]),
+        "lens_model": type(archive["lens_size_model"]).__name__,
+        "vault_model": type(archive["vault_model"]).__name__,
+        "cold_load": cold_load(folder, load_repeats),
+    }
+
+    rows = [X.iloc[[i % len(X)]] for i in range(calls)]
+    result["predict"] = time_calls(lambda row: predict_rows(archive, row), rows)
+
+    result["batch"] = {}
+    for size in BATCH_SIZES:
+        repeats = max(MIN_REPEATS, min(calls, BATCH_ROWS // size))
+        batches = [X.iloc[rng.integers(0, len(X), size)] for _ in range(repeats)]
+        result["batch"][str(size)] = time_calls(lambda batch: predict_rows(archive, batch),
+                                                batches, rows_per_call=size)
+    return result
+
+
+def bench_endpoints(inputs, calls):
+    """The /predict and /predict-compare handlers, models already loaded."""
+    payloads = [
+        {field: (int(value) if field == "Age" else float(value)) for field, value in row.items()}
+        for row in inputs[API_FIELDS].head(calls).to_dict("records")
+    ]
+    valid = []
+    for payload in payloads:
+        try:
+            api.PredictionInput(**payload)
+            valid.append(payload)
+        except ValueError:
+            pass
+    if not valid:
+        return {"skipped": "no sampled payload is within the API's input ranges",
+                "skipped_payloads": len(payloads)}
+    api.load_models()
+    api.load_all_models()
+    return {
+        "predict": time_calls(lambda p: api.predict(api.PredictionInput(**p)), valid),
+        "predict_compare": time_calls(lambda p: api.predict_compare(api.CompareInput(**p)), valid),
+        "skipped_payloads": len(payloads) - len(valid),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    libraries = {"numpy": np.__version__, "pandas": pd.__version__, "scikit-learn": sklearn.__version__}
+    for name in ("lightgbm", "xgboost"):
+        try:
+            libraries[name] = __import__(name).__version__
+        except ImportError:
+            pass
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "libraries": libraries,
+    }
+
+
+def flatten(report):
+    """{metric path: value} for every lower-is-better figure in a report."""
+    metrics = {}
+    for tag, result in report.get("archives", {}).items():
+        if "error" in result:
+            continue
+        for key, value in result["cold_load"].items():
+            metrics[f"{tag}/cold_load/{key}"] = value
+        for key in ("p50_ms", "p99_ms"):
+            metrics[f"{tag}/predict/{key}"] = result["predict"][key]
+            for size, stats in result["batch"].items():
+                metrics[f"{tag}/batch/{size}/{key}"] = stats[key]
+    for name, stats in report.get("endpoints", {}).items():
+        if isinstance(stats, dict):
+            for key in ("p50_ms", "p99_ms"):
+                metrics[f"endpoint/{name}/{key}"] = stats[key]
+    return {key: value for key, value in metrics.items()
+            if isinstance(value, (int, float)) and not key.endswith("/repeats")}
+
+
+def compare(report, baseline, threshold):
+    """Relative change of every shared metric, plus the flagged regressions."""
+    new, old = flatten(report), flatten(baseline)
+    deltas = {key: new[key] / old[key] - 1 for key in new if key in old and old[key]}
+    regressions = [key for key, delta in deltas.items()
+                   if delta > threshold and key.rsplit("/", 1)[-1] in FLAGGED_METRICS]
+    return {
+        "created": baseline.get("created"),
+        "git_commit": baseline.get("git_commit"),
+        "same_host": baseline.get("environment", {}).get("host") == report["environment"]["host"],
+        "threshold": threshold,
+        "deltas": deltas,
+        "regressions": regressions,
+    }
+
+
+def print_report(report):
+    print()
+    print(f"{'Archive':<20} {'Disk':>8} {'Load':>8} {'RSS':>7} {'p50':>8} {'p99':>8} "
+          f"{'1024 rows/s':>12}")
+    for tag, result in report["archives"].items():
+        if "error" in result:
+            print(f"{tag:<20} ❌ {result['error']}")
+            continue
+        load = result["cold_load"]
+        rss = f"{load['rss_mb']:.1f}M" if load["rss_mb"] is not None else "-"
+        print(f"{tag:<20} {result['disk_bytes'] / 1024:>7.0f}K {load['seconds']:>7.3f}s {rss:>7} "
+              f"{result['predict']['p50_ms']:>6.2f}ms {result['predict']['p99_ms']:>6.2f}ms "
+              f"{result['batch'][str(BATCH_SIZES[-1])]['rows_per_s']:>12,.0f}")
+
+    print("\nBatch p50 latency (ms) by batch size:")
+    print(f"{'Archive':<20} " + " ".join(f"{size:>9}" for size in BATCH_SIZES))
+    for tag, result in report["archives"].items():
+        if "error" in result:
+            continue
+        print(f"{tag:<20} " + " ".join(f"{result['batch'][str(size)]['p50_ms']:>9.2f}"
+                                       for size in BATCH_SIZES))
+
+    endpoints = report["endpoints"]
+    if "skipped" in endpoints:
+        print(f"\n⚠️  /predict and /predict-compare not measured: {endpoints['skipped']} "
+              f"({endpoints['skipped_payloads']} skipped)")
+    elif endpoints:
+        print(f"\nHandlers ({endpoints['skipped_payloads']} payloads outside the API's ranges skipped):")
+        for name in ("predict", "predict_compare"):
+            stats = endpoints[name]
+            print(f"  {name:<18} p50 {stats['p50_ms']:7.2f}ms  p99 {stats['p99_ms']:7.2f}ms  "
+                  f"{stats['rows_per_s']:8.1f} req/s")
+    else:
+        print("\n⚠️  Backend dependencies not installed: /predict and /predict-compare not measured")
+
+
+def print_comparison(comparison):
+    print("\n" + "=" * 70)
+    print(f"COMPARISON WITH BASELINE ({comparison['created']}, {comparison['git_commit']})")
+    print("=" * 70)
+    if not comparison["same_host"]:
+        print("⚠️  Baseline was recorded on another host; deltas include hardware differences")
+    changed = sorted(comparison["deltas"].items(), key=lambda item: -abs(item[1]))
+    for key, delta in changed[:15]:
+        print(f"  {key:<44} {delta:+7.1%}")
+    if comparison["regressions"]:
+        print(f"\n⚠️  {len(comparison['regressions'])} metrics slower than baseline by more than "
+              f"{comparison['threshold']:.0%}:")
+        for key in comparison["regressions"]:
+            print(f"   - {key}: {comparison['deltas'][key]:+.1%}")
+    else:
+        print(f"\n✅ No p50 / load regressions beyond {comparison['threshold']:.0%}")
+
+
+def write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2))
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference for every model archive")
+    parser.add_argument("--archives", type=Path, default=ARCHIVES_DIR, help="archive directory")
+    parser.add_argument("--only", nargs="+", metavar="TAG", help="only these archives")
+    parser.add_argument("--calls", type=int, default=500, help="single-row calls per archive / handler")
+    parser.add_argument("--load-repeats", type=int, default=3, help="fresh interpreters per cold load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-endpoints", action="store_true", help="skip the API handlers")
+    parser.add_argument("--out", type=Path, default=REPORT_FILE)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="also save this report as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 on a flagged regression")
+    parser.add_argument("--probe-load", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe_load:
+        probe_load(args.probe_load)
+        return
+
+    archives = archive_dirs(args.archives, args.only)
+    if not archives:
+        print(f"No complete archives found in {args.archives}")
+        sys.exit(1)
+
+    pool, inputs = sample_inputs(max(args.calls, BATCH_SIZES[-1]), args.seed)
+    print("=" * 70)
+    print(f"Inference benchmark: {len(archives)} archives, {args.calls} calls, "
+          f"inputs sampled from {len(pool)} patients")
+    print("=" * 70)
+
+    rng = np.random.default_rng(args.seed)
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "environment": environment(),
+        "inputs": {"patients": len(pool), "calls": args.calls, "seed": args.seed,
+                   "batch_sizes": BATCH_SIZES},
+        "archives": {},
+        "endpoints": {},
+    }
+    for tag, folder in archives.items():
+        print(f"  {tag}...")
+        report["archives"][tag] = bench_archive(folder, inputs, args.calls,
+                                                args.load_repeats, rng)
+    if api is not None and not args.no_endpoints:
+        print("  /predict, /predict-compare...")
+        report["endpoints"] = bench_endpoints(inputs, args.calls)
+
+    print_report(report)
+
+    comparison = None
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("version") != REPORT_VERSION:
+            print(f"\n⚠️  Baseline {args.baseline} is report version {baseline.get('version')}; "
+                  f"not compared")
+        else:
+            comparison = compare(report, baseline, args.threshold)
+            report["baseline"] = comparison
+            print_comparison(comparison)
+
+    write_json(args.out, report)
+    print(f"\n✅ Report written to {args.out}")
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"✅ Saved as baseline {args.baseline}")
+
+    if args.fail_on_regression and comparison and comparison["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
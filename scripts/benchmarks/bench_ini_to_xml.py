@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark INI -> XML conversion.
+
+Rebuilds INI files from the existing XML corpus, converts them with the
+old ElementTree + minidom round trip and with the streaming writer
+(serial and with a process pool), and checks every output is
+byte-identical to the original XML.
+
+Usage:
+    python scripts/benchmarks/bench_ini_to_xml.py [--limit N] [--jobs N]
+"""
+
+import argparse
+import configparser
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from xml.dom import minidom
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
+
+import ini_to_xml  # noqa: E402
+
+
+def xml_to_ini(xml_path, ini_path):
+    """Write the INI that would have produced this XML."""
+    root = ET.parse(xml_path).getroot()
+    with open(ini_path, "w", encoding="utf-8") as f:
+        for section in root.findall("section"):
+            f.write(f"[{section.get('name')}]\n")
+            for entry in section.findall("entry"):
+                f.write(f"{entry.get('key')}={entry.text or ''}\n")
+
+
+def read_config(ini_path):
+    config = configparser.ConfigParser(allow_no_value=True, strict=False)
+    config.optionxform = str
+    config.read(ini_path, encoding="utf-8")
+    return config
+
+
+def legacy_convert(ini_path, xml_path):
+    """The pre-streaming implementation: build a tree, re-parse with minidom."""
+    config = read_config(ini_path)
+    root = ET.Element("configuration")
+    for section_name in config.sections():
+        section_elem = ET.SubElement(root, "section", name=section_name)
+        for key, value in config.items(section_name):
+            entry = ET.SubElement(section_elem, "entry", key=key)
+            entry.text = value
+    pretty_xml = minidom.parseString(ET.tostring(root, encoding="unicode")).toprettyxml(indent="  ")
+    with open(xml_path, "w", encoding="utf-8") as f:
+        f.write(pretty_xml)
+
+
+def time_it(label, fn, n_files):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed:8.3f}s  {n_files / elapsed:8.1f} files/s")
+    return elapsed
+
+
+def count_mismatches(sources, out_dir):
+    bad = 0
+    for src in sources:
+        if Path(src).read_bytes() != (out_dir / Path(src).name).read_bytes():
+            bad += 1
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark INI -> XML conversion")
+    parser.add_argument("--xml-dir", default=str(PROJECT_ROOT / "XML files"))
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N XML files")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    sources = sorted(str(p) for p in Path(args.xml_dir).glob("*.xml"))
+    if args.limit:
+        sources = sources[:args.limit]
+    if not sources:
+        print(f"No XML files found in {args.xml_dir}")
+        sys.exit(1)
+
+    print("=" * 70)
+    print(f"INI -> XML benchmark: {len(sources)} files, jobs={args.jobs}")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        ini_dir = tmp / "ini"
+        ini_dir.mkdir()
+        ini_paths = []
+        for src in sources:
+            ini_path = ini_dir / (Path(src).stem + ".INI")
+            xml_to_ini(src, ini_path)
+            ini_paths.append(str(ini_path))
+
+        results = {}
+        for label in ("legacy", "streaming", "streaming_pool"):
+            (tmp / label).mkdir()
+
+        results["legacy"] = time_it(
+            "minidom (legacy)",
+            lambda: [legacy_convert(p, tmp / "legacy" / (Path(p).stem + ".xml")) for p in ini_paths],
+            len(ini_paths),
+        )
+
+        def run_streaming(label, jobs):
+            devnull = open(os.devnull, "w")
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                for _ in ini_to_xml.convert_ini_files(ini_paths, jobs, output_dir=str(tmp / label)):
+                    pass
+            finally:
+                sys.stdout = stdout
+                devnull.close()
+
+        results["streaming"] = time_it(
+            "streaming (serial)", lambda: run_streaming("streaming", 1), len(ini_paths)
+        )
+        results["streaming_pool"] = time_it(
+            f"streaming (--jobs {args.jobs})",
+            lambda: run_streaming("streaming_pool", args.jobs),
+            len(ini_paths),
+        )
+
+        print()
+        for label in results:
+            bad = count_mismatches(sources, tmp / label)
+            status = "✅ identical" if bad == 0 else f"❌ {bad} files differ"
+            print(f"  {label:<28} {status}")
+
+        print()
+        print(f"  Speedup streaming vs legacy:  {results['legacy'] / results['streaming']:.2f}x")
+        print(f"  Speedup pool vs legacy:       {results['legacy'] / results['streaming_pool']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
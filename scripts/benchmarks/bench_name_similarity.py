@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark batch fuzzy name scoring against plain difflib.
+
+For every XML patient, scores all name variations against every roster
+name (no blocking, the worst case) and takes the top-k candidates, once
+with nested difflib loops and once with NameScorer. Checks that the top-k
+lists and the accept/reject decisions at the pipeline's 0.8 and 0.9
+thresholds are identical.
+
+Usage:
+    python scripts/benchmarks/bench_name_similarity.py [--limit N] [--k K]
+"""
+
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
+
+import match_xml_csv  # noqa: E402
+from match_xml_csv import create_name_variations, load_csv_data  # noqa: E402
+from name_similarity import NameScorer  # noqa: E402
+from xml_reader import read_patient_info  # noqa: E402
+
+
+def difflib_top_k(names, queries, k, threshold):
+    """Reference: every (query, candidate) pair through SequenceMatcher."""
+    scored = []
+    for row, name in enumerate(names):
+        score = 0.0
+        for query in queries:
+            ratio = difflib.SequenceMatcher(None, query.upper(), name.upper()).ratio()
+            if ratio > score:
+                score = ratio
+        if score > threshold:
+            scored.append((-score, row))
+    scored.sort()
+    return [(row, -neg) for neg, row in scored[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch fuzzy name scoring")
+    parser.add_argument("--xml-dir", default=str(PROJECT_ROOT / "XML files"))
+    parser.add_argument("--csv", default=str(PROJECT_ROOT / "data" / "excel" / "VAULT 3.0.csv"))
+    parser.add_argument("--limit", type=int, default=200, help="XML patients to score (0 = all)")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    match_xml_csv.CSV_FILE = args.csv
+    lookup = load_csv_data()
+    if lookup is None:
+        sys.exit(1)
+    names = sorted({key[0] for key in lookup})
+
+    xml_files = sorted(Path(args.xml_dir).glob("*.xml"))
+    if args.limit:
+        xml_files = xml_files[:args.limit]
+    queries = [
+        sorted(create_name_variations(read_patient_info(p)['full_name'], assume_surname_first=True))
+        for p in xml_files
+    ]
+
+    print("=" * 70)
+    print(f"Name similarity benchmark: {len(queries)} XML patients x {len(names)} roster names, k={args.k}")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    scorer = NameScorer(names)
+    print(f"Scorer build: {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    all_identical = True
+    for label, threshold in (("top-k (no threshold)", 0.0), ("ratio > 0.8", 0.8), ("ratio > 0.9", 0.9)):
+        start = time.perf_counter()
+        expected = [difflib_top_k(names, q, args.k, threshold) for q in queries]
+        difflib_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = [scorer.top_k(q, k=args.k, threshold=threshold) for q in queries]
+        scorer_time = time.perf_counter() - start
+
+        identical = expected == actual
+        all_identical &= identical
+        status = "✅ identical" if identical else \
+            f"❌ {sum(e != a for e, a in zip(expected, actual))} differ"
+        print(f"  {label:<22} difflib {difflib_time:8.3f}s   scorer {scorer_time:7.3f}s   "
+              f"{difflib_time / max(scorer_time, 1e-9):6.1f}x  {status}")
+
+    sys.exit(0 if all_identical else 1)
+
+
+if __name__ == "__main__":
+    main()
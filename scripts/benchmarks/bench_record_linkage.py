@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark the indexed record linkage used by match_xml_csv.
+
+Runs every fallback strategy for every XML patient against the roster
+lookup, once with the original linear scans over the whole lookup and once
+with LinkageIndex, checks both pick the same roster key, and reports timings.
+
+Usage:
+    python scripts/benchmarks/bench_record_linkage.py [--limit N]
+"""
+
+import argparse
+import difflib
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
+
+import match_xml_csv  # noqa: E402
+from match_xml_csv import create_name_variations, normalize_dob, load_csv_data  # noqa: E402
+from record_linkage import LinkageIndex  # noqa: E402
+from xml_reader import read_patient_info  # noqa: E402
+
+
+# --- Original linear scans (reference implementation) ----------------------
+
+def scan_name_dob(lookup, name_variations, dob):
+    for name_var in name_variations:
+        for csv_key in lookup:
+            if name_var == csv_key[0] and dob == csv_key[1]:
+                return csv_key
+    return None
+
+
+def scan_name(lookup, name_variations):
+    for name_var in name_variations:
+        for csv_key in lookup:
+            if name_var == csv_key[0]:
+                return csv_key
+    return None
+
+
+def scan_fuzzy_same_dob(lookup, name_variations, dob):
+    if not dob:
+        return None
+    best_ratio = 0
+    best_key = None
+    for csv_key in lookup:
+        if dob == csv_key[1]:
+            for name_var in name_variations:
+                ratio = difflib.SequenceMatcher(None, name_var.upper(), csv_key[0].upper()).ratio()
+                if ratio > best_ratio:
+                    best_ratio = ratio
+                    best_key = csv_key
+    return best_key if best_ratio > 0.8 else None
+
+
+def scan_fuzzy_near_dob(lookup, name_variations, dob):
+    if not dob:
+        return None
+    try:
+        xml_dob_date = datetime.strptime(dob, '%Y-%m-%d')
+    except ValueError:
+        return None
+    best_ratio = 0
+    best_key = None
+    for csv_key in lookup:
+        try:
+            csv_dob_date = datetime.strptime(csv_key[1], '%Y-%m-%d')
+        except ValueError:
+            continue
+        dob_diff = abs((xml_dob_date - csv_dob_date).days)
+        if 0 < dob_diff <= 7:
+            for name_var in name_variations:
+                ratio = difflib.SequenceMatcher(None, name_var.upper(), csv_key[0].upper()).ratio()
+                if ratio > best_ratio and ratio > 0.9:
+                    best_ratio = ratio
+                    best_key = csv_key
+    return best_key
+
+
+def scan_compound_surname(lookup, name_variations):
+    for name_var in name_variations:
+        name_parts = name_var.split()
+        if len(name_parts) < 2:
+            continue
+        for order_reversed in [False, True]:
+            if order_reversed:
+                first_name, surname = name_parts[-1], ' '.join(name_parts[:-1])
+            else:
+                first_name, surname = name_parts[0], ' '.join(name_parts[1:])
+            for csv_key in lookup:
+                csv_parts = csv_key[0].split()
+                if len(csv_parts) < 2:
+                    continue
+                for csv_order_reversed in [False, True]:
+                    if csv_order_reversed:
+                        csv_first_name, csv_surname = csv_parts[-1], ' '.join(csv_parts[:-1])
+                    else:
+                        csv_first_name, csv_surname = csv_parts[0], ' '.join(csv_parts[1:])
+                    if (first_name == csv_first_name and
+                        (surname in csv_surname or csv_surname in surname or
+                         surname.split()[0] == csv_surname.split()[0])):
+                        return csv_key
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexed record linkage")
+    parser.add_argument("--xml-dir", default=str(PROJECT_ROOT / "XML files"))
+    parser.add_argument("--csv", default=str(PROJECT_ROOT / "data" / "excel" / "VAULT 3.0.csv"))
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N XML files")
+    args = parser.parse_args()
+
+    match_xml_csv.CSV_FILE = args.csv
+    lookup = load_csv_data()
+    if lookup is None:
+        sys.exit(1)
+
+    xml_files = sorted(Path(args.xml_dir).glob("*.xml"))
+    if args.limit:
+        xml_files = xml_files[:args.limit]
+
+    patients = []
+    for xml_path in xml_files:
+        info = read_patient_info(xml_path)
+        variations = create_name_variations(info['full_name'], assume_surname_first=True)
+        patients.append((variations, normalize_dob(info['dob'])))
+
+    print("=" * 70)
+    print(f"Record linkage benchmark: {len(patients)} XML patients x {len(lookup)} roster keys")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    index = LinkageIndex(lookup)
+    print(f"Index build: {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    strategies = [
+        ("name + DOB", lambda v, d: scan_name_dob(lookup, v, d), index.match_name_dob),
+        ("name only", lambda v, d: scan_name(lookup, v), lambda v, d: index.match_name(v)),
+        ("fuzzy name, same DOB", lambda v, d: scan_fuzzy_same_dob(lookup, v, d),
+         index.match_fuzzy_same_dob),
+        ("fuzzy name, DOB ±7 days", lambda v, d: scan_fuzzy_near_dob(lookup, v, d),
+         index.match_fuzzy_near_dob),
+        ("compound surname", lambda v, d: scan_compound_surname(lookup, v),
+         lambda v, d: index.match_compound_surname(v)),
+    ]
+
+    print(f"  {'Strategy':<26} {'linear':>10} {'indexed':>10} {'speedup':>9}  result")
+    total_linear = total_indexed = 0.0
+    all_identical = True
+    for label, linear, indexed in strategies:
+        start = time.perf_counter()
+        expected = [linear(v, d) for v, d in patients]
+        linear_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = [indexed(v, d) for v, d in patients]
+        indexed_time = time.perf_counter() - start
+
+        identical = expected == actual
+        all_identical &= identical
+        total_linear += linear_time
+        total_indexed += indexed_time
+        status = "✅ identical" if identical else \
+            f"❌ {sum(e != a for e, a in zip(expected, actual))} differ"
+        print(f"  {label:<26} {linear_time:9.3f}s {indexed_time:9.3f}s "
+              f"{linear_time / max(indexed_time, 1e-9):8.1f}x  {status}")
+
+    print(f"\n  {'Total':<26} {total_linear:9.3f}s {total_indexed:9.3f}s "
+          f"{total_linear / max(total_indexed, 1e-9):8.1f}x")
+    sys.exit(0 if all_identical else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Supabase APIs the backend calls, for load tests.
+
+Serves the subset of PostgREST (/rest/v1), GoTrue (/auth/v1/user) and
+Storage (/storage/v1/object) that backend/app uses, from in-memory tables,
+with configurable injected latency per API. Every request and every new
+TCP connection is counted, so round trips and connection churn per app
+request can be measured (GET /_fake/stats[?user=TOKEN], POST /_fake/reset).
+
+Any bearer token is accepted; its user id is derived from the token, so
+distinct tokens act as distinct users. Embedded selects such as
+"*, patients(anonymous_id)" follow the schema's <table>_id foreign keys.
+
+Usage:
+    python scripts/benchmarks/fake_supabase.py [--port 54321] [--latency-ms 20]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+SERVICES = ("rest", "auth", "storage")
+# Unique constraints of supabase/migrations, so concurrent inserts race as in production
+UNIQUE = {"patients": ("user_id", "anonymous_id"), "outcomes": ("scan_id",)}
+USER_NAMESPACE = uuid.UUID("6f1d6a52-3c1e-4a8e-9a43-1b7f0c2d5e11")
+
+
+class Conflict(Exception):
+    """Insert violates a UNIQUE constraint (PostgREST answers 409)."""
+
+
+def singular(table):
+    return table[:-1] if table.endswith("s") else table
+
+
+def split_top_level(text):
+    """Split on commas outside parentheses: 'a, b(c, d)' -> ['a', 'b(c, d)']."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+def parse_value(raw):
+    if raw == "null":
+        return None
+    if raw in ("true", "false"):
+        return raw == "true"
+    return raw
+
+
+def file_content(body, content_type):
+    """The uploaded file of a multipart/form-data body (storage uploads), else body."""
+    if not content_type.startswith("multipart/form-data"):
+        return body
+    message = BytesParser(policy=policy.default).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    for part in message.iter_parts():
+        return part.get_payload(decode=True)
+    return b""
+
+
+def matches(row, column, expression):
+    op, _, raw = expression.partition(".")
+    value = row.get(column)
+    if op == "eq":
+        return value is not None and str(value) == raw
+    if op == "neq":
+        return value is None or str(value) != raw
+    if op == "is":
+        return value is parse_value(raw)
+    if op == "in":
+        return str(value) in {item.strip('"') for item in raw.strip("()").split(",")}
+    raise ValueError(f"unsupported filter operator: {op}")
+
+
+class FakeSupabase:
+    """In-memory tables, storage objects and request counters."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, seed=0):
+        # latency_ms: one value for every API, or {service: ms}
+        if not isinstance(latency_ms, dict):
+            latency_ms = {service: latency_ms for service in SERVICES}
+        self.latency_ms = {service: float(latency_ms.get(service, 0.0)) for service in SERVICES}
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.objects = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = Counter()
+            self.connections = 0
+
+    def stats(self, token=None):
+        """Counters since the last reset; with `token`, also that user's row counts."""
+        with self.lock:
+            stats = {
+                "requests": dict(self.requests),
+                "round_trips": sum(self.requests.values()),
+                "connections": self.connections,
+                "rows": {table: len(rows) for table, rows in self.tables.items()},
+            }
+            if token:
+                user_id = self.user_for(token)["id"]
+                stats["user_rows"] = {table: sum(row.get("user_id") == user_id for row in rows)
+                                      for table, rows in self.tables.items()}
+            return stats
+
+    def delay(self, service):
+        ms = self.latency_ms[service]
+        if self.jitter_ms:
+            with self.lock:
+                ms += self.random.uniform(0, self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    # -- PostgREST ----------------------------------------------------------
+
+    def _filtered(self, table, params):
+        rows = self.tables.get(table, [])
+        for column, expression in params:
+            if column in ("select", "order", "limit", "offset", "columns"):
+                continue
+            rows = [row for row in rows if matches(row, column, expression)]
+        return rows
+
+    def _embed(self, table, row, name, columns):
+        child_table = self.tables.get(name, [])
+        fk = f"{singular(name)}_id"
+        if fk in row:
+            # Many-to-one, e.g. scans -> patients via scans.patient_id
+            target = next((other for other in child_table if other["id"] == row[fk]), None)
+            return self._project(name, target, columns) if target else None
+        back = f"{singular(table)}_id"
+        return [self._project(name, child, columns) for child in child_table
+                if child.get(back) == row["id"]]
+
+    def _project(self, table, row, select):
+        fields = split_top_level(select or "*")
+        out = {}
+        for field in fields:
+            if "(" in field:
+                name, _, inner = field.partition("(")
+                name = name.split(":")[-1].split("!")[0].strip()
+                out[name] = self._embed(table, row, name, inner[:-1])
+            elif field == "*":
+                out.update(row)
+            else:
+                out[field] = row.get(field)
+        return out
+
+    def select(self, table, params):
+        with self.lock:
+            rows = self._filtered(table, params)
+            query = dict(params)
+            for order in reversed(query.get("order", "").split(",") if query.get("order") else []):
+                column, *flags = order.split(".")
+                rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column) or ""),
+                              reverse="desc" in flags)
+            if "limit" in query:
+                rows = rows[int(query.get("offset", 0)):int(query.get("offset", 0)) + int(query["limit"])]
+            return [self._project(table, row, query.get("select")) for row in rows]
+
+    def insert(self, table, body):
+        records = body if isinstance(body, list) else [body]
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            created = []
+            for record in records:
+                row = {"id": str(uuid.uuid4()), "created_at": now, **record}
+                key = UNIQUE.get(table)
+                if key and any(all(other.get(col) == row.get(col) for col in key)
+                               for other in self.tables.get(table, [])):
+                    raise Conflict(f'duplicate key value violates unique constraint "{table}_'
+                                   f'{"_".join(key)}_key"')
+                self.tables.setdefault(table, []).append(row)
+                created.append(dict(row))
+            return created
+
+    def update(self, table, params, body):
+        with self.lock:
+            rows = self._filtered(table, params)
+            for row in rows:
+                row.update(body)
+            return [dict(row) for row in rows]
+
+    def delete(self, table, params):
+        with self.lock:
+            doomed = self._filtered(table, params)
+            ids = {row["id"] for row in doomed}
+            self.tables[table] = [row for row in self.tables.get(table, []) if row["id"] not in ids]
+            # on delete cascade: children reference <table>_id
+            fk = f"{singular(table)}_id"
+            for name, rows in self.tables.items():
+                self.tables[name] = [row for row in rows if row.get(fk) not in ids]
+            return [dict(row) for row in doomed]
+
+    # -- Auth ---------------------------------------------------------------
+
+    @staticmethod
+    def user_for(token):
+        return {
+            "id": str(uuid.uuid5(USER_NAMESPACE, token)),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": f"{token[:24]}@loadtest.local",
+            "app_metadata": {"provider": "email"},
+            "user_metadata": {},
+            "created_at": "2026-01-01T00:00:00Z",
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeSupabase/1"
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def setup(self):
+        super().setup()
+        self.counted = False            # connections only count once they call an API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, payload=None, content_type="application/json"):
+        if isinstance(payload, bytes):
+            data = payload
+        else:
+            data = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        params = parse_qsl(url.query, keep_blank_values=True)
+        body = self._body()
+
+        if parts[0] == "_fake":
+            if parts[1:] == ["stats"]:
+                return self._send(200, self.fake.stats(dict(params).get("user")))
+            if parts[1:] == ["reset"]:
+                self.fake.reset_stats()
+                return self._send(200, {"ok": True})
+            return self._send(404, {"message": "unknown fake endpoint"})
+
+        service = {"rest": "rest", "auth": "auth", "storage": "storage"}.get(parts[0])
+        if service is None:
+            return self._send(404, {"message": f"no route for {url.path}"})
+        with self.fake.lock:
+            if not self.counted:
+                self.fake.connections += 1
+                self.counted = True
+            target = parts[2] if len(parts) > 2 else ""
+            if service == "storage" and target == "object" and len(parts) > 3 and parts[3] == "sign":
+                target = "object/sign"
+            self.fake.requests[f"{method} {service}/{target}"] += 1
+        self.fake.delay(service)
+
+        try:
+            if service == "rest":
+                return self._rest(method, parts[2], params, body)
+            if service == "auth":
+                return self._auth(parts[2:])
+            return self._storage(method, parts[3:], body)
+        except Conflict as exc:
+            return self._send(409, {"code": "23505", "message": str(exc), "details": None, "hint": None})
+        except (ValueError, KeyError) as exc:
+            return self._send(400, {"message": str(exc)})
+
+    def _rest(self, method, table, params, body):
+        payload = json.loads(body) if body else None
+        if method == "GET":
+            return self._send(200, self.fake.select(table, params))
+        if method == "POST":
+            rows = self.fake.insert(table, payload)
+        elif method == "PATCH":
+            rows = self.fake.update(table, params, payload)
+        elif method == "DELETE":
+            rows = self.fake.delete(table, params)
+        else:
+            return self._send(405, {"message": method})
+        if "return=minimal" in (self.headers.get("Prefer") or ""):
+            return self._send(201 if method == "POST" else 204)
+        return self._send(201 if method == "POST" else 200, rows)
+
+    def _auth(self, parts):
+        if parts != ["user"]:
+            return self._send(404, {"msg": "not implemented in fake"})
+        scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+        if scheme.lower() != "bearer" or not token or token == "invalid":
+            return self._send(401, {"code": 401, "msg": "invalid JWT"})
+        return self._send(200, FakeSupabase.user_for(token))
+
+    def _storage(self, method, parts, body):
+        if parts and parts[0] == "sign":
+            bucket, path = parts[1], "/".join(parts[2:])
+            return self._send(200, {"signedURL": f"/object/sign/{bucket}/{path}?token=fake"})
+        bucket, path = parts[0], "/".join(parts[1:])
+        with self.fake.lock:
+            if method == "POST" or method == "PUT":
+                if (bucket, path) in self.fake.objects and method == "POST" \
+                        and self.headers.get("x-upsert", "false") != "true":
+                    conflict = {"statusCode": "409", "error": "Duplicate",
+                                "message": "The resource already exists"}
+                    return self._send(400, conflict)
+                self.fake.objects[(bucket, path)] = file_content(
+                    body, self.headers.get("Content-Type") or "")
+                return self._send(200, {"Key": f"{bucket}/{path}", "Id": str(uuid.uuid4())})
+            if method == "GET":
+                data = self.fake.objects.get((bucket, path))
+                if data is None:
+                    return self._send(404, {"statusCode": "404", "error": "not_found",
+                                            "message": "Object not found"})
+                return self._send(200, data, "application/octet-stream")
+            if method == "DELETE":
+                prefixes = json.loads(body or b"{}").get("prefixes", [])
+                removed = [self.fake.objects.pop((bucket, prefix), None) for prefix in prefixes]
+                return self._send(200, [{"name": p} for p, data in zip(prefixes, removed) if data])
+        return self._send(405, {"message": method})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+
+def parse_latency(spec):
+    """'20' -> 20.0 for every API; 'rest=5,auth=30' -> per API (others 0)."""
+    if "=" not in spec:
+        return float(spec)
+    latency = {}
+    for item in spec.split(","):
+        service, _, ms = item.partition("=")
+        if service.strip() not in SERVICES:
+            raise ValueError(f"unknown service '{service}' (expected one of {', '.join(SERVICES)})")
+        latency[service.strip()] = float(ms)
+    return latency
+
+
+def serve(fake, host="127.0.0.1", port=0):
+    """Start the fake on a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake of the Supabase REST/auth/storage APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=parse_latency, default=0.0,
+                        help="added to every request: MS, or per API as rest=MS,auth=MS,storage=MS")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform random extra latency")
+    args = parser.parse_args()
+
+    fake = FakeSupabase(args.latency_ms, args.jitter_ms)
+    server, url = serve(fake, args.host, args.port)
+    print(f"Fake Supabase at {url} (latency {fake.latency_ms}ms + up to {args.jitter_ms}ms jitter)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,25 +3,34 @@
 Export Beta Data from Supabase
 Joins all tables into clean, sortable reports for analysis.
 
+Rows are mirrored into a local SQLite cache (data/exports/beta_cache.sqlite).
+Each run only pulls rows changed since the last watermark per table, so
+nightly exports fetch deltas instead of whole tables.
+
 Usage:
     python scripts/export_beta_data.py                  # Export all
     python scripts/export_beta_data.py --user gurpal    # Filter by user
     python scripts/export_beta_data.py --csv            # Save to CSV files
+    python scripts/export_beta_data.py --full           # Rebuild cache from scratch
 """
 
 import os
 import sys
 import json
+import sqlite3
 import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 EXPORT_DIR = "data/exports"
+CACHE_DB = os.path.join(EXPORT_DIR, "beta_cache.sqlite")
+PAGE_SIZE = 1000
 
 HEADERS = {
     "apikey": SERVICE_KEY,
@@ -29,24 +38,158 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# Column used as the incremental watermark for each table. scans and
+# predictions are insert-only, so created_at is enough for them.
+TABLE_WATERMARKS = {
+    "profiles": "updated_at",
+    "patients": "updated_at",
+    "scans": "created_at",
+    "predictions": "created_at",
+    "outcomes": "updated_at",
+}
+
+_session = None
+
+
+def get_session():
+    """Shared requests session so every page reuses pooled connections."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=3)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
 
 def query(table, select="*", filters=None):
     """Query Supabase REST API."""
     url = f"{SUPABASE_URL}/rest/v1/{table}?select={select}"
     if filters:
         url += f"&{filters}"
-    resp = requests.get(url, headers=HEADERS)
+    resp = get_session().get(url)
     resp.raise_for_status()
     return resp.json()
 
 
-def fetch_all_data():
-    """Fetch and join all tables."""
-    profiles = {p["id"]: p for p in query("profiles")}
-    patients = query("patients")
-    scans = query("scans")
-    predictions = query("predictions")
-    outcomes = query("outcomes")
+def fetch_changed_rows(table, since=None):
+    """
+    Fetch rows of `table` whose watermark column is >= `since`.
+
+    Pages through the result with PostgREST `Range` headers, ordered by the
+    watermark so an interrupted run can resume from the last stored value.
+    """
+    column = TABLE_WATERMARKS[table]
+    params = {"select": "*", "order": f"{column}.asc,id.asc"}
+    if since:
+        params[column] = f"gte.{since}"
+
+    url = f"{SUPABASE_URL}/rest/v1/{table}"
+    session = get_session()
+    rows = []
+    start = 0
+    while True:
+        headers = {"Range-Unit": "items", "Range": f"{start}-{start + PAGE_SIZE - 1}"}
+        resp = session.get(url, params=params, headers=headers)
+        resp.raise_for_status()
+        page = resp.json()
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return rows
+
+
+# =============================================================================
+# Local cache
+# =============================================================================
+
+def open_cache(path=CACHE_DB):
+    """Open (and initialise) the local SQLite mirror of the beta tables."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS rows ("
+        " table_name TEXT NOT NULL,"
+        " id TEXT NOT NULL,"
+        " watermark TEXT,"
+        " payload TEXT NOT NULL,"
+        " PRIMARY KEY (table_name, id))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS watermarks ("
+        " table_name TEXT PRIMARY KEY,"
+        " value TEXT,"
+        " synced_at TEXT)"
+    )
+    return conn
+
+
+def sync_cache(conn, full=False):
+    """
+    Pull changed rows for every table into the cache.
+
+    Returns a dict of table -> number of rows fetched this run. A full sync
+    also drops cached rows, which is the only way to pick up deletions.
+    """
+    fetched = {}
+    for table, column in TABLE_WATERMARKS.items():
+        since = None
+        if full:
+            conn.execute("DELETE FROM rows WHERE table_name = ?", (table,))
+        else:
+            row = conn.execute(
+                "SELECT value FROM watermarks WHERE table_name = ?", (table,)
+            ).fetchone()
+            since = row[0] if row else None
+
+        changed = fetch_changed_rows(table, since)
+        conn.executemany(
+            "INSERT OR REPLACE INTO rows (table_name, id, watermark, payload) VALUES (?, ?, ?, ?)",
+            [(table, str(r["id"]), r.get(column), json.dumps(r)) for r in changed],
+        )
+
+        marks = [r.get(column) for r in changed if r.get(column)]
+        if marks:
+            new_mark = max(marks)
+        else:
+            new_mark = since
+        conn.execute(
+            "INSERT OR REPLACE INTO watermarks (table_name, value, synced_at) VALUES (?, ?, ?)",
+            (table, new_mark, datetime.now().isoformat(timespec="seconds")),
+        )
+        conn.commit()
+        fetched[table] = len(changed)
+    return fetched
+
+
+def load_cached_table(conn, table):
+    """Return every cached row of `table`, oldest watermark first."""
+    cursor = conn.execute(
+        "SELECT payload FROM rows WHERE table_name = ? ORDER BY watermark, id", (table,)
+    )
+    return [json.loads(payload) for (payload,) in cursor]
+
+
+def fetch_all_data(full=False):
+    """Sync the local cache, then join all tables from it."""
+    conn = open_cache()
+    try:
+        fetched = sync_cache(conn, full=full)
+        delta = ", ".join(f"{t}={n}" for t, n in fetched.items())
+        print(f"Synced {'full' if full else 'delta'} from Supabase: {delta}")
+
+        tables = {table: load_cached_table(conn, table) for table in TABLE_WATERMARKS}
+    finally:
+        conn.close()
+
+    return join_tables(**tables)
+
+
+def join_tables(profiles, patients, scans, predictions, outcomes):
+    """Join the raw tables into one report row per scan."""
+    profiles = {p["id"]: p for p in profiles}
 
     pred_by_scan = {}
     for p in predictions:
@@ -281,9 +424,10 @@ def main():
     parser.add_argument("--features", action="store_true", help="Show extracted features table")
     parser.add_argument("--probs", action="store_true", help="Show lens probabilities table")
     parser.add_argument("--all", action="store_true", help="Show all tables")
+    parser.add_argument("--full", action="store_true", help="Ignore watermarks and rebuild the local cache")
     args = parser.parse_args()
 
-    rows = fetch_all_data()
+    rows = fetch_all_data(full=args.full)
 
     if args.user:
         term = args.user.lower()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Command-line helpers shared by the pipeline scripts.
+"""
+
+import os
+import sys
+
+
+def pop_jobs_arg(argv):
+    """
+    Remove a `--jobs N` / `-j N` option from argv and return N.
+
+    `--jobs 0` means one worker per CPU. Defaults to 1 (serial).
+    """
+    for flag in ('--jobs', '-j'):
+        if flag in argv:
+            idx = argv.index(flag)
+            try:
+                jobs = int(argv[idx + 1])
+            except (IndexError, ValueError):
+                print(f"Error: {flag} expects an integer.")
+                sys.exit(1)
+            del argv[idx:idx + 2]
+            return jobs if jobs > 0 else (os.cpu_count() or 1)
+    return 1
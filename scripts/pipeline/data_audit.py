@@ -2,13 +2,21 @@
 """
 Comprehensive Data Audit for ICL Repository
 Calculates and reports data pipeline statistics to ensure accuracy.
+
+Duplicate-candidate XMLs are hashed in a thread pool and the hashes are
+cached in data/processed/cache/xml_hashes.json keyed on (path, size, mtime),
+so repeated audits only hash new or changed files. Exams the exam store
+keeps without an XML file are counted too, hashed from the XML it renders.
 """
 
 import os
 import re
+import json
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from pathlib import Path
+from exam_store import default_store, exam_name, list_xml_names
 from feature_config import TRAINING_FEATURES
 
 # Paths
@@ -27,12 +35,12 @@ TRAINING_CSV_CANDIDATES = [
 ]
 EXCEL_CSV = "data/excel/VAULT 3.0.csv"
 FLAGGED_CSV = "data/processed/flagged_incomplete_cases.csv"
+HASH_CACHE_FILE = "data/processed/cache/xml_hashes.json"
+HASH_WORKERS = min(8, (os.cpu_count() or 1) + 4)
 
 def get_xml_count():
-    if not os.path.exists(XML_FOLDER):
-        return 0, []
-    files = [f for f in os.listdir(XML_FOLDER) if f.lower().endswith('.xml')]
-    return len(files), sorted(files)
+    files = list_xml_names(XML_FOLDER)
+    return len(files), files
 
 def pick_latest_path(paths):
     existing = [p for p in paths if os.path.exists(p)]
@@ -51,6 +59,58 @@ def file_sha256(path):
             hasher.update(chunk)
     return hasher.hexdigest()
 
+def load_hash_cache(path=HASH_CACHE_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable hash cache {path}: {e}")
+        return {}
+
+def save_hash_cache(cache, path=HASH_CACHE_FILE):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write hash cache {path}: {e}")
+
+def hash_files(paths, cache_file=HASH_CACHE_FILE, workers=HASH_WORKERS):
+    """
+    SHA-256 of each existing path ({path: hexdigest}).
+
+    Hashes whose (size, mtime) still match the cache are reused; the rest
+    are computed in a thread pool and written back to the cache.
+    """
+    cache = load_hash_cache(cache_file)
+    hashes, stats, to_hash = {}, {}, []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        stats[path] = (stat.st_size, stat.st_mtime_ns)
+        entry = cache.get(path)
+        if entry and (entry['size'], entry['mtime_ns']) == stats[path]:
+            hashes[path] = entry['sha256']
+        else:
+            to_hash.append(path)
+
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, digest in zip(to_hash, pool.map(file_sha256, to_hash)):
+                hashes[path] = digest
+                size, mtime_ns = stats[path]
+                cache[path] = {'size': size, 'mtime_ns': mtime_ns, 'sha256': digest}
+        # Forget files that are gone so the cache doesn't grow forever
+        for path in [p for p in cache if not os.path.exists(p)]:
+            del cache[path]
+        save_hash_cache(cache, cache_file)
+    return hashes
+
 def analyze_xml_filenames(xml_list):
     numeric_ids = []
     invalid_names = []
@@ -72,7 +132,14 @@ def analyze_xml_filenames(xml_list):
     duplicates = {num: files for num, files in id_to_files.items() if len(files) > 1}
     return numeric_ids, invalid_names, duplicates
 
-def audit():
+def audit(matched_df=None, training_df=None):
+    """
+    Audit XML files on disk and the matching / extraction outputs.
+
+    matched_df / training_df let an in-process caller pass the frames it
+    just produced instead of re-reading the newest CSVs. Returns a dict of
+    headline counts.
+    """
     print("\n" + "="*80)
     print("ICL DATA PIPELINE AUDIT")
     print("="*80)
@@ -118,14 +185,17 @@ def audit():
     dup_rows = []
     identical_groups = 0
     differing_groups = 0
-    for num, files in sorted(duplicates.items()):
-        file_hashes = {}
+    hashes = hash_files([os.path.join(XML_FOLDER, name)
+                         for files in duplicates.values() for name in files])
+    store = default_store()
+    for files in duplicates.values():
         for name in files:
             path = os.path.join(XML_FOLDER, name)
-            if os.path.exists(path):
-                file_hashes[name] = file_sha256(path)
-            else:
-                file_hashes[name] = "missing_on_disk"
+            if path not in hashes and store.has_exam(path):
+                hashes[path] = store.xml_sha256(exam_name(name))
+    for num, files in sorted(duplicates.items()):
+        file_hashes = {name: hashes.get(os.path.join(XML_FOLDER, name), "missing_on_disk")
+                       for name in files}
         unique_hashes = set(file_hashes.values())
         group_status = "identical" if len(unique_hashes) == 1 else "different"
         if group_status == "identical":
@@ -150,11 +220,13 @@ def audit():
         print(f"  -> Details saved to: {DUPLICATE_XML_FILE}")
     
     # 2. Matched Data
-    matched_csv = pick_latest_path(MATCHED_CSV_CANDIDATES)
-    if matched_csv:
-        df_matched = pd.read_csv(matched_csv)
+    summary = {'xml_files': total_xmls}
+    matched_csv = pick_latest_path(MATCHED_CSV_CANDIDATES) if matched_df is None else None
+    if matched_df is not None or matched_csv:
+        df_matched = matched_df if matched_df is not None else pd.read_csv(matched_csv)
         matched_xmls = set(df_matched['XML File'].unique())
         unmatched_count = total_xmls - len(matched_xmls)
+        summary['matched'] = len(matched_xmls)
         
         print(f"\n[EXCEL MATCHING]")
         print(f"  Matched to Excel: {len(matched_xmls)}")
@@ -172,11 +244,12 @@ def audit():
         print(f"\n[EXCEL MATCHING] Matched file not found.")
 
     # 3. Feature Extraction
-    training_csv = pick_latest_path(TRAINING_CSV_CANDIDATES)
-    if training_csv:
-        df_train = pd.read_csv(training_csv)
+    training_csv = pick_latest_path(TRAINING_CSV_CANDIDATES) if training_df is None else None
+    if training_df is not None or training_csv:
+        df_train = training_df if training_df is not None else pd.read_csv(training_csv)
         extracted_xmls = set(df_train['XML_File'].unique())
         failed_count = total_xmls - len(extracted_xmls)
+        summary['extracted'] = len(extracted_xmls)
         
         print(f"\n[FEATURE EXTRACTION]")
         print(f"  Successfully extracted: {len(extracted_xmls)}")
@@ -216,6 +289,7 @@ def audit():
         if available_features:
             print(f"  Fully Trainable ({len(available_features)} features + outcomes): {trainable.sum()}")
             print(f"  Incomplete (outcomes exist, but features missing): {len(df_train_outcomes) - trainable.sum()}")
+            summary['trainable'] = int(trainable.sum())
         else:
             print("  Fully Trainable: 0 (no core feature columns found)")
         
@@ -225,6 +299,7 @@ def audit():
     print("\n" + "="*80)
     print("AUDIT COMPLETE")
     print("="*80 + "\n")
+    return summary
 
 if __name__ == "__main__":
     audit()
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+Columnar store for parsed Pentacam exams.
+
+Every exam's INI entries live in one zstd-compressed Parquet file,
+data/processed/exams.parquet, one row per (section, key, value) in
+document order:
+
+    exam     exam name, the XML file stem (e.g. 00000042)
+    section  INI section
+    key      entry key (null on the marker row of an empty section)
+    num      the value as a float when it is numeric
+    text     the value as written, unless num already renders to it exactly
+
+The exam XMLs take ~100 KB each; here an exam is a few KB, and reading a
+handful of keys for every exam is one filtered column scan instead of one
+XML parse per file. xml_reader.iter_xml_entries() serves exams from the
+store when it has them, so the pipeline stages read it without changes,
+and write_xml() reproduces an exam's XML byte for byte for anything that
+still wants the file.
+
+The store stands in for one directory, "XML files", recorded in the
+file's metadata; paths anywhere else are always read from disk. An exam
+is served from the store while its XML exists, or after the XML was
+removed on purpose (--prune-xml, or ini_to_xml.py --no-xml, which never
+writes it): such exams are recorded as detached. A stored exam whose XML
+was deleted otherwise is dropped at the next sync.
+
+ini_to_xml.py adds exams as it converts INIs and imports XMLs the store
+does not have yet. Without pyarrow the store is unavailable and readers
+fall back to the XML files.
+
+Usage:
+    python scripts/pipeline/exam_store.py                 # summary
+    python scripts/pipeline/exam_store.py --import        # sync with the XML directory
+    python scripts/pipeline/exam_store.py --import --full # re-import every XML
+    python scripts/pipeline/exam_store.py --verify        # check XMLs match the store
+    python scripts/pipeline/exam_store.py --export-xml [NAME ...]
+    python scripts/pipeline/exam_store.py --prune-xml     # delete XMLs the store reproduces
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+
+EXAM_STORE = "data/processed/exams.parquet"
+XML_DIR = "XML files"
+
+# Bump when the columns or their meaning change
+STORE_VERSION = 1
+STORE_VERSION_KEY = b"vault.exam_store_version"
+STORE_XML_DIR_KEY = b"vault.exam_store_xml_dir"
+STORE_DETACHED_KEY = b"vault.exam_store_detached"
+STORE_DIGESTS_KEY = b"vault.exam_store_xml_sha256"
+
+NUMERIC_CHARS = frozenset("0123456789.-+eE")
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    return pa, pc, pq
+
+
+def _schema(pa):
+    return pa.schema([
+        ("exam", pa.string()),
+        ("section", pa.string()),
+        ("key", pa.string()),
+        ("num", pa.float64()),
+        ("text", pa.string()),
+    ])
+
+
+# =============================================================================
+# Values
+# =============================================================================
+
+def render_number(num):
+    """Canonical text of a stored number: repr() without a trailing '.0'."""
+    text = repr(num)
+    return text[:-2] if text.endswith('.0') else text
+
+
+def split_value(text):
+    """(num, text) columns for an entry: text is kept only when num can't reproduce it."""
+    if not text:
+        return None, None
+    if NUMERIC_CHARS.issuperset(text):
+        try:
+            num = float(text)
+        except ValueError:
+            return None, text
+        if math.isfinite(num):
+            return num, (None if render_number(num) == text else text)
+    return None, text
+
+
+def join_value(num, text):
+    """The entry text as written in the INI (None for empty entries)."""
+    if text is not None:
+        return text
+    if num is not None:
+        return render_number(num)
+    return None
+
+
+# =============================================================================
+# XML
+# =============================================================================
+
+def _escape_text(value):
+    # minidom escapes '"' in text nodes as well
+    return (value.replace("&", "&amp;").replace("<", "&lt;")
+            .replace('"', "&quot;").replace(">", "&gt;"))
+
+
+def _escape_attr(value):
+    return _escape_text(value).replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#9;")
+
+
+def write_sections_xml(sections, handle):
+    """
+    Write [(section, [(key, value), ...]), ...] to `handle` as exam XML.
+
+    Same bytes minidom's toprettyxml(indent="  ") gave ini_to_xml.py, except
+    that tabs / newlines in attribute values are written as character
+    references (as minidom does from Python 3.13) so they survive parsing.
+    """
+    handle.write('<?xml version="1.0" ?>\n')
+    if not sections:
+        handle.write('<configuration/>\n')
+        return
+
+    handle.write('<configuration>\n')
+    for section_name, items in sections:
+        if not items:
+            handle.write(f'  <section name="{_escape_attr(section_name)}"/>\n')
+            continue
+        handle.write(f'  <section name="{_escape_attr(section_name)}">\n')
+        for key, value in items:
+            if value:
+                handle.write(f'    <entry key="{_escape_attr(key)}">{_escape_text(value)}</entry>\n')
+            else:
+                handle.write(f'    <entry key="{_escape_attr(key)}"/>\n')
+        handle.write('  </section>\n')
+    handle.write('</configuration>\n')
+
+
+def read_xml_sections(xml_file_path):
+    """An exam XML as [(section, [(key, value), ...]), ...], empty sections included."""
+    sections = []
+    for _, elem in ET.iterparse(xml_file_path, events=('end',)):
+        if elem.tag == 'section':
+            items = [(entry.get('key', ''), entry.text or None) for entry in elem.iter('entry')]
+            sections.append((elem.get('name', ''), items))
+            elem.clear()
+    return sections
+
+
+def exam_name(path):
+    """Exam name for an XML path or file name (its stem)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# =============================================================================
+# Store
+# =============================================================================
+
+class ExamStore:
+    """
+    The exam Parquet file, loaded into memory, plus exams added or removed
+    since. Changes are written back by save().
+    """
+
+    def __init__(self, path=EXAM_STORE, xml_dir=XML_DIR):
+        self.path = path
+        self.arrow = _pyarrow()
+        self.available = self.arrow is not None
+        self._pending = {}          # exam -> sections added since load
+        self._removed = set()
+        self._detached_changed = False
+        self._default_xml_dir = xml_dir
+        self._load()
+
+    def _load(self):
+        self._table = None
+        self._ranges = {}           # exam -> (start, stop) rows in _table
+        self._scans = {}            # frozenset(keys) -> {exam: [(section, key, text), ...]}
+        self._detached = set()      # exams kept without an XML file
+        self._digests = {}          # exam -> SHA-256 of its XML
+        self._digests_missing = False
+        self.mtime = None
+        self._set_xml_dir(self._default_xml_dir)
+        if not self.available or not os.path.exists(self.path):
+            return
+        pa, pc, pq = self.arrow
+        metadata = pq.read_schema(self.path).metadata or {}
+        version = metadata.get(STORE_VERSION_KEY, b'').decode()
+        if version != str(STORE_VERSION):
+            print(f"⚠️  {self.path} has store version {version or '?'} "
+                  f"(expected {STORE_VERSION}) - ignoring it, re-run with --import --full")
+            return
+        if STORE_XML_DIR_KEY in metadata:
+            self._set_xml_dir(metadata[STORE_XML_DIR_KEY].decode())
+        self._detached = set(json.loads(metadata.get(STORE_DETACHED_KEY, b'[]')))
+        self._digests = json.loads(metadata.get(STORE_DIGESTS_KEY, b'{}'))
+        self.mtime = os.path.getmtime(self.path)
+        self._table = pq.read_table(self.path)
+
+        exams = self._table.column('exam').combine_chunks()
+        if not pa.types.is_dictionary(exams.type):
+            exams = exams.dictionary_encode()
+        indices = exams.indices.to_numpy(zero_copy_only=False)
+        names = exams.dictionary.to_pylist()
+        # Written before digests were recorded: the next save() adds them
+        self._digests_missing = bool(set(names) - set(self._digests))
+        if len(indices):
+            import numpy as np
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(indices)) + 1))
+            stops = np.append(starts[1:], len(indices))
+            self._ranges = {names[indices[s]]: (int(s), int(e)) for s, e in zip(starts, stops)}
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+
+    def _set_xml_dir(self, xml_dir):
+        self.xml_dir = xml_dir
+        self._xml_dir_real = os.path.realpath(xml_dir)
+
+    def __contains__(self, name):
+        return name in self._pending or (name in self._ranges and name not in self._removed)
+
+    def serves(self, xml_dir):
+        """Whether the store stands in for XMLs in `xml_dir`."""
+        return self.available and os.path.realpath(xml_dir) == self._xml_dir_real
+
+    def is_detached(self, name):
+        """Whether exam `name` is kept without an XML file (pruned or never written)."""
+        return name in self._detached and name in self
+
+    def detached_names(self):
+        return sorted(name for name in self._detached if name in self)
+
+    def has_exam(self, xml_file_path):
+        """
+        Whether the store holds the exam at `xml_file_path`: the path is in
+        the store's directory and the XML exists or the exam is detached.
+        """
+        name = exam_name(xml_file_path)
+        if name not in self or not self.serves(os.path.dirname(xml_file_path) or '.'):
+            return False
+        return name in self._detached or os.path.exists(xml_file_path)
+
+    def names(self):
+        return sorted((set(self._ranges) - self._removed) | set(self._pending))
+
+    def __len__(self):
+        return len(self.names())
+
+    def _rows(self, name):
+        start, stop = self._ranges[name]
+        rows = self._table.slice(start, stop - start)
+        return zip(*(rows.column(col).to_pylist() for col in ('section', 'key', 'num', 'text')))
+
+    def sections(self, name):
+        """Exam `name` as [(section, [(key, value), ...]), ...] in document order."""
+        if name in self._pending:
+            return self._pending[name]
+        if name not in self:
+            raise KeyError(name)
+        sections = []
+        for section, key, num, text in self._rows(name):
+            if section is None:
+                continue            # marker row of an exam without sections
+            if not sections or sections[-1][0] != section:
+                sections.append((section, []))
+            if key is not None:
+                sections[-1][1].append((key, join_value(num, text)))
+        return sections
+
+    def entries(self, name, keys=None):
+        """(section, key, value) for each entry of exam `name`, like xml_reader.iter_xml_entries()."""
+        if name in self._pending or keys is None:
+            wanted = None if keys is None else frozenset(keys)
+            return [(section, key, value or None)
+                    for section, items in self.sections(name)
+                    for key, value in items
+                    if wanted is None or key in wanted]
+        if name not in self:
+            raise KeyError(name)
+        return self.scan(keys).get(name, [])
+
+    def scan(self, keys):
+        """
+        {exam: [(section, key, value), ...]} for `keys`, from one pass over
+        the key column. Results are kept for the next call with the same keys.
+        """
+        keys = frozenset(keys)
+        cached = self._scans.get(keys)
+        if cached is not None:
+            return cached
+        result = {}
+        if self._table is not None:
+            pa, pc, _ = self.arrow
+            column = self._table.column('key').combine_chunks()
+            if pa.types.is_dictionary(column.type):
+                # Test each distinct key once, then expand to rows
+                wanted = pc.is_in(column.dictionary, value_set=pa.array(sorted(keys), pa.string()))
+                mask = pc.take(wanted, column.indices)
+            else:
+                mask = pc.is_in(column, value_set=pa.array(sorted(keys), pa.string()))
+            rows = self._table.filter(pc.fill_null(mask, False))
+            columns = [rows.column(col).to_pylist() for col in ('exam', 'section', 'key', 'num', 'text')]
+            for exam, section, key, num, text in zip(*columns):
+                result.setdefault(exam, []).append((section, key, join_value(num, text)))
+        self._scans[keys] = result
+        return result
+
+    def xml_bytes(self, name):
+        handle = io.StringIO()
+        write_sections_xml(self.sections(name), handle)
+        return handle.getvalue().encode('utf-8')
+
+    def xml_sha256(self, name):
+        """SHA-256 of the exam's XML, comparable with hashing the XML file."""
+        digest = self._digests.get(name)
+        if digest is None:
+            # Normally recorded by add(); rendering the XML takes a few ms
+            digest = self._digests[name] = hashlib.sha256(self.xml_bytes(name)).hexdigest()
+        return digest
+
+    def write_xml(self, name, xml_file_path):
+        tmp_path = xml_file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.xml_bytes(name))
+        os.replace(tmp_path, xml_file_path)
+        return xml_file_path
+
+    # -------------------------------------------------------------------------
+    # Writing
+    # -------------------------------------------------------------------------
+
+    @property
+    def dirty(self):
+        return bool(self._pending or self._removed or self._detached_changed
+                    or self._digests_missing)
+
+    def add(self, name, sections, detached=False, sha256=None):
+        """
+        Add or replace exam `name` ([(section, [(key, value), ...]), ...]).
+        Pass detached=True when its XML file is not written.
+        """
+        self._pending[name] = [(section, list(items)) for section, items in sections]
+        self._removed.discard(name)
+        self.set_detached(name, detached)
+        self._digests[name] = sha256 or hashlib.sha256(self.xml_bytes(name)).hexdigest()
+
+    def add_xml(self, xml_file_path):
+        with open(xml_file_path, 'rb') as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        self.add(exam_name(xml_file_path), read_xml_sections(xml_file_path), sha256=sha256)
+
+    def set_detached(self, name, detached=True):
+        """Record whether exam `name` is kept without its XML file."""
+        if detached != (name in self._detached):
+            (self._detached.add if detached else self._detached.discard)(name)
+            self._detached_changed = True
+
+    def remove(self, name):
+        self._pending.pop(name, None)
+        self._digests.pop(name, None)
+        self.set_detached(name, False)
+        if name in self._ranges:
+            self._removed.add(name)
+
+    def _pending_table(self, name):
+        pa = self.arrow[0]
+        columns = {col: [] for col in ('exam', 'section', 'key', 'num', 'text')}
+
+        def row(section, key, num, text):
+            for col, value in zip(columns, (name, section, key, num, text)):
+                columns[col].append(value)
+
+        sections = self._pending[name]
+        if not sections:
+            row(None, None, None, None)
+        for section, items in sections:
+            if not items:
+                row(section, None, None, None)
+            for key, value in items:
+                row(section, key, *split_value(value))
+        return pa.table(columns, schema=_schema(pa))
+
+    def save(self):
+        """Write the store (sorted by exam name) if anything changed."""
+        if not self.available or not self.dirty:
+            return False
+        pa, pc, pq = self.arrow
+        schema = _schema(pa)
+        parts = []
+        for name in self.names():
+            if name in self._pending:
+                parts.append(self._pending_table(name))
+            else:
+                start, stop = self._ranges[name]
+                parts.append(self._table.slice(start, stop - start).cast(schema))
+        table = pa.concat_tables(parts) if parts else schema.empty_table()
+        # Names and keys repeat on every row: dictionary pages keep them tiny
+        table = pa.table({col: (pc.dictionary_encode(table.column(col))
+                                if col in ('exam', 'section', 'key') else table.column(col))
+                          for col in schema.names})
+        table = table.replace_schema_metadata({
+            STORE_VERSION_KEY: str(STORE_VERSION).encode(),
+            STORE_XML_DIR_KEY: self.xml_dir.encode(),
+            STORE_DETACHED_KEY: json.dumps(self.detached_names()).encode(),
+            STORE_DIGESTS_KEY: json.dumps({name: self.xml_sha256(name) for name in self.names()}).encode(),
+        })
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        pq.write_table(table, tmp_path, compression='zstd', row_group_size=256 * 1024)
+        os.replace(tmp_path, self.path)
+        self._pending.clear()
+        self._removed.clear()
+        self._detached_changed = False
+        self._load()
+        return True
+
+
+_default_store = None
+
+
+def default_store():
+    """
+    The process-wide store, shared by xml_reader and ini_to_xml so exams
+    added in this process are visible to readers before save(). Reloaded
+    if another process rewrote the file and nothing is pending here.
+    """
+    global _default_store
+    store = _default_store
+    if store is None:
+        store = _default_store = ExamStore()
+    elif not store.dirty and store.available:
+        mtime = os.path.getmtime(store.path) if os.path.exists(store.path) else None
+        if mtime != store.mtime:
+            store = _default_store = ExamStore(store.path)
+    return store
+
+
+def list_xml_names(xml_dir=XML_DIR):
+    """XML file names in `xml_dir`, plus detached exams if the store serves `xml_dir`."""
+    names = set()
+    if os.path.isdir(xml_dir):
+        names.update(f for f in os.listdir(xml_dir) if f.lower().endswith('.xml'))
+    store = default_store()
+    if store.serves(xml_dir):
+        on_disk = {exam_name(f) for f in names}
+        names.update(f"{name}.xml" for name in store.detached_names() if name not in on_disk)
+    return sorted(names)
+
+
+def import_xml_dir(store, xml_dir=XML_DIR, full=False):
+    """
+    Add XMLs in `xml_dir` the store does not have, or that were modified
+    after it was written (every XML with full=True).
+    """
+    if not store.serves(xml_dir) or not os.path.isdir(xml_dir):
+        return 0
+    imported = 0
+    for xml_file in sorted(f for f in os.listdir(xml_dir) if f.lower().endswith('.xml')):
+        xml_path = os.path.join(xml_dir, xml_file)
+        if not full and exam_name(xml_file) in store and (
+                store.mtime is None or os.path.getmtime(xml_path) <= store.mtime):
+            continue
+        try:
+            store.add_xml(xml_path)
+            imported += 1
+        except ET.ParseError as e:
+            print(f"Warning: Could not import {xml_file}: {e}")
+    return imported
+
+
+def stored_sha256(xml_file_path):
+    """
+    Manifest key for an exam the store serves without its XML file (the
+    XML's SHA-256), or None when the file exists and is keyed as usual.
+    """
+    if os.path.exists(xml_file_path):
+        return None
+    store = default_store()
+    if not store.has_exam(xml_file_path):
+        return None
+    return store.xml_sha256(exam_name(xml_file_path))
+
+
+def drop_deleted_xml(store, xml_dir=XML_DIR):
+    """Remove stored exams whose XML was deleted from `xml_dir` (not pruned) and return how many."""
+    if not store.serves(xml_dir):
+        return 0
+    on_disk = set()
+    if os.path.isdir(xml_dir):
+        on_disk = {exam_name(f) for f in os.listdir(xml_dir) if f.lower().endswith('.xml')}
+    deleted = [name for name in store.names()
+               if name not in on_disk and not store.is_detached(name)]
+    for name in deleted:
+        store.remove(name)
+    return len(deleted)
+
+
+def verify_xml_dir(store, xml_dir=XML_DIR):
+    """(matching, differing, missing-from-store) XML file names."""
+    same, different, missing = [], [], []
+    for xml_file in sorted(f for f in os.listdir(xml_dir) if f.lower().endswith('.xml')):
+        name = exam_name(xml_file)
+        if name not in store:
+            missing.append(xml_file)
+            continue
+        with open(os.path.join(xml_dir, xml_file), 'rb') as f:
+            (same if f.read() == store.xml_bytes(name) else different).append(xml_file)
+    return same, different, missing
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+               if f.lower().endswith('.xml'))
+
+
+def main():
+    args = sys.argv[1:]
+    store = default_store()
+    if not store.available:
+        print("Error: pyarrow is not installed - the exam store needs it (pip install pyarrow).")
+        sys.exit(1)
+
+    if '--import' in args:
+        imported = import_xml_dir(store, full='--full' in args)
+        dropped = drop_deleted_xml(store)
+        store.save()
+        print(f"Imported {imported} XML file(s) from {XML_DIR} into {EXAM_STORE}")
+        if dropped:
+            print(f"Dropped {dropped} exam(s) whose XML file was deleted")
+
+    if '--export-xml' in args:
+        names = [a for a in args[args.index('--export-xml') + 1:] if not a.startswith('--')]
+        os.makedirs(XML_DIR, exist_ok=True)
+        written = 0
+        for name in names or store.names():
+            name = exam_name(name)
+            xml_path = os.path.join(XML_DIR, f"{name}.xml")
+            if names or not os.path.exists(xml_path):
+                store.write_xml(name, xml_path)
+                store.set_detached(name, False)
+                written += 1
+        store.save()
+        print(f"Wrote {written} XML file(s) to {XML_DIR}")
+
+    if '--verify' in args or '--prune-xml' in args:
+        same, different, missing = verify_xml_dir(store)
+        print(f"XML files matching the store: {len(same)}")
+        if different:
+            print(f"⚠️  XML files differing from the store ({len(different)}): {different[:10]}")
+        if missing:
+            print(f"⚠️  XML files not in the store ({len(missing)}): {missing[:10]} - run --import")
+        if '--prune-xml' in args:
+            # Record the exams as detached before deleting, so a sync keeps them
+            for xml_file in same:
+                store.set_detached(exam_name(xml_file))
+            store.save()
+            for xml_file in same:
+                os.remove(os.path.join(XML_DIR, xml_file))
+            print(f"Removed {len(same)} XML file(s); --export-xml recreates them")
+        if '--verify' in args and (different or missing):
+            sys.exit(1)
+
+    exams = store.names()
+    print(f"\nExam store: {EXAM_STORE}")
+    print(f"  Exams: {len(exams)} ({len(store.detached_names())} without an XML file)")
+    if os.path.exists(EXAM_STORE):
+        print(f"  Size:  {os.path.getsize(EXAM_STORE) / 1e6:.1f} MB")
+    if os.path.isdir(XML_DIR):
+        print(f"  XML files on disk: {_dir_size(XML_DIR) / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
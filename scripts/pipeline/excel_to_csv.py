@@ -2,15 +2,106 @@
 """
 Excel to CSV Converter
 Converts Excel (.xlsx) files to CSV format.
+
+Conversions are recorded in the stage manifest with the workbook's hash,
+so an unchanged workbook whose CSVs are still in place is not re-parsed.
+The workbook is opened once, read-only (pandas' openpyxl reader), and
+every sheet is parsed from that one open workbook; --all with --jobs N
+splits the sheets between N processes, each opening the workbook once. Each CSV written also
+gets a typed copy (data/processed/cache/<csv>.pkl, the DataFrame exactly
+as pd.read_csv returns it) that read_converted_csv() hands to downstream
+readers such as the roster loader.
 """
 
 import pandas as pd
+import pickle
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from cli_args import pop_jobs_arg
+from manifest import StageManifest, file_sha256
+
+# Bump when the CSV output or the typed cache changes shape/meaning
+EXCEL_CONVERT_VERSION = 1
+TYPED_CACHE_DIR = "data/processed/cache"
+
+
+def typed_cache_path(csv_file_path):
+    return os.path.join(TYPED_CACHE_DIR, os.path.basename(csv_file_path) + '.pkl')
+
 
-def excel_to_csv(excel_file_path, csv_file_path=None, sheet_name=None):
+def _write_csv(df, csv_file_path):
+    """Write the CSV plus its typed cache; returns the CSV's SHA-256."""
+    df.to_csv(csv_file_path, index=False, encoding='utf-8')
+    csv_hash = file_sha256(csv_file_path)
+    try:
+        os.makedirs(TYPED_CACHE_DIR, exist_ok=True)
+        cache_file = typed_cache_path(csv_file_path)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({
+                'version': EXCEL_CONVERT_VERSION,
+                'csv_sha256': csv_hash,
+                'frame': pd.read_csv(csv_file_path),
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Warning: Could not write typed cache for {csv_file_path}: {e}")
+    return csv_hash
+
+
+def read_converted_csv(csv_file_path, csv_hash=None):
+    """
+    pd.read_csv(csv_file_path), served from the typed cache when the CSV
+    still has the hash it was written with.
+    """
+    cache_file = typed_cache_path(csv_file_path)
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            csv_hash = csv_hash or file_sha256(csv_file_path)
+            if cached.get('version') == EXCEL_CONVERT_VERSION and cached.get('csv_sha256') == csv_hash:
+                return cached['frame']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable typed cache {cache_file}: {e}")
+    return pd.read_csv(csv_file_path)
+
+
+def _outputs_current(outputs):
+    """True if every recorded CSV still exists with the content we wrote."""
+    return all(os.path.exists(out['csv']) and file_sha256(out['csv']) == out['csv_sha256']
+               for out in outputs)
+
+
+def _cached_outputs(manifest, excel_file_path, key):
+    """The recorded outputs for this workbook/request, or None if they must be rebuilt."""
+    if not manifest.is_current(excel_file_path):
+        return None
+    entry = manifest.entries[os.path.basename(excel_file_path)]
+    result = entry.get('result') or {}
+    if result.get('key') != key or not _outputs_current(result.get('outputs', [])):
+        return None
+    return result['outputs']
+
+
+def _convert_sheet(excel_file, sheet_name, csv_path):
+    """Convert one sheet of an open pd.ExcelFile, return its output record."""
+    df = excel_file.parse(sheet_name)
+    csv_hash = _write_csv(df, csv_path)
+    return {'sheet': sheet_name, 'csv': csv_path, 'csv_sha256': csv_hash,
+            'rows': len(df), 'columns': len(df.columns)}
+
+
+def _convert_sheets(excel_file_path, sheets):
+    """Process-pool worker: open the workbook once and convert [(sheet, csv_path), ...]."""
+    with pd.ExcelFile(excel_file_path) as excel_file:
+        return [_convert_sheet(excel_file, sheet, csv_path) for sheet, csv_path in sheets]
+
+
+def excel_to_csv(excel_file_path, csv_file_path=None, sheet_name=None, full=False):
     """
     Convert an Excel file to CSV format.
     
@@ -18,6 +109,7 @@ def excel_to_csv(excel_file_path, csv_file_path=None, sheet_name=None):
         excel_file_path: Path to the input Excel file
         csv_file_path: Path to the output CSV file (optional)
         sheet_name: Name of the sheet to convert (optional, defaults to first sheet)
+        full: Convert even if the workbook and CSV are unchanged since the last run
     
     Returns:
         Path to the created CSV file
@@ -27,13 +119,6 @@ def excel_to_csv(excel_file_path, csv_file_path=None, sheet_name=None):
         return None
     
     try:
-        # Read the Excel file
-        if sheet_name:
-            df = pd.read_excel(excel_file_path, sheet_name=sheet_name)
-        else:
-            # Read first sheet by default
-            df = pd.read_excel(excel_file_path, sheet_name=0)
-        
         # Set default output filename if not provided
         if csv_file_path is None:
             excel_basename = os.path.splitext(os.path.basename(excel_file_path))[0]
@@ -44,12 +129,24 @@ def excel_to_csv(excel_file_path, csv_file_path=None, sheet_name=None):
                 csv_file_path = os.path.join(excel_dir, csv_file_path)
             else:
                 csv_file_path = csv_file_path
-        
-        # Write to CSV
-        df.to_csv(csv_file_path, index=False, encoding='utf-8')
+
+        # Unchanged workbook and CSV: nothing to do
+        manifest = StageManifest('excel_to_csv', EXCEL_CONVERT_VERSION, full=full)
+        key = [sheet_name or 0, os.path.abspath(csv_file_path)]
+        cached = _cached_outputs(manifest, excel_file_path, key)
+        if cached:
+            print(f"✓ {os.path.basename(excel_file_path)} unchanged - keeping {csv_file_path}")
+            print(f"Rows: {cached[0]['rows']}, Columns: {cached[0]['columns']}")
+            return csv_file_path
+
+        # Read the Excel file (first sheet by default)
+        with pd.ExcelFile(excel_file_path) as excel_file:
+            output = _convert_sheet(excel_file, sheet_name or 0, csv_file_path)
+        manifest.record(excel_file_path, {'key': key, 'outputs': [output]}, outputs=[csv_file_path])
+        manifest.save()
         
         print(f"Successfully converted {os.path.basename(excel_file_path)} to {csv_file_path}")
-        print(f"Rows: {len(df)}, Columns: {len(df.columns)}")
+        print(f"Rows: {output['rows']}, Columns: {output['columns']}")
         
         return csv_file_path
         
@@ -58,45 +155,68 @@ def excel_to_csv(excel_file_path, csv_file_path=None, sheet_name=None):
         return None
 
 
-def convert_all_sheets(excel_file_path, output_dir=None):
+def convert_all_sheets(excel_file_path, output_dir=None, jobs=1, full=False):
     """
     Convert all sheets in an Excel file to separate CSV files.
     
     Args:
         excel_file_path: Path to the input Excel file
         output_dir: Directory to save CSV files (optional, defaults to same as Excel file)
+        jobs: Number of sheets to convert in parallel (separate processes)
+        full: Convert even if the workbook and CSVs are unchanged since the last run
     """
     if not os.path.exists(excel_file_path):
         print(f"Error: Excel file '{excel_file_path}' not found.")
         return
     
     try:
-        # Read all sheets
-        excel_file = pd.ExcelFile(excel_file_path)
-        
         # Set output directory
         if output_dir is None:
             output_dir = os.path.dirname(excel_file_path) or '.'
         
-        excel_basename = os.path.splitext(os.path.basename(excel_file_path))[0]
-        
-        print(f"Found {len(excel_file.sheet_names)} sheet(s) in {os.path.basename(excel_file_path)}\n")
-        
-        converted_files = []
-        for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(excel_file_path, sheet_name=sheet_name)
+        manifest = StageManifest('excel_to_csv_all', EXCEL_CONVERT_VERSION, full=full)
+        key = os.path.abspath(output_dir)
+        cached = _cached_outputs(manifest, excel_file_path, key)
+        if cached:
+            print(f"✓ {os.path.basename(excel_file_path)} unchanged - keeping {len(cached)} sheet CSV(s)")
+            return [out['csv'] for out in cached]
+
+        # The workbook is opened read-only once; serial conversion reuses it
+        with pd.ExcelFile(excel_file_path) as excel_file:
+            sheet_names = excel_file.sheet_names
             
-            # Create CSV filename from sheet name (sanitize it)
-            safe_sheet_name = "".join(c for c in sheet_name if c.isalnum() or c in (' ', '-', '_')).strip()
-            csv_filename = f"{excel_basename}_{safe_sheet_name}.csv"
-            csv_path = os.path.join(output_dir, csv_filename)
+            excel_basename = os.path.splitext(os.path.basename(excel_file_path))[0]
             
-            df.to_csv(csv_path, index=False, encoding='utf-8')
-            print(f"  ✓ Sheet '{sheet_name}': {len(df)} rows × {len(df.columns)} columns → {csv_filename}")
-            converted_files.append(csv_path)
+            print(f"Found {len(sheet_names)} sheet(s) in {os.path.basename(excel_file_path)}\n")
+            
+            csv_paths = []
+            for sheet_name in sheet_names:
+                # Create CSV filename from sheet name (sanitize it)
+                safe_sheet_name = "".join(c for c in sheet_name if c.isalnum() or c in (' ', '-', '_')).strip()
+                csv_filename = f"{excel_basename}_{safe_sheet_name}.csv"
+                csv_paths.append(os.path.join(output_dir, csv_filename))
+
+            sheets = list(zip(sheet_names, csv_paths))
+            if jobs > 1 and len(sheets) > 1:
+                # One chunk of sheets per worker, so each opens the workbook once
+                workers = min(jobs, len(sheets))
+                chunks = [sheets[i::workers] for i in range(workers)]
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    by_csv = {out['csv']: out
+                              for chunk in pool.map(_convert_sheets, [excel_file_path] * workers, chunks)
+                              for out in chunk}
+                outputs = [by_csv[csv_path] for csv_path in csv_paths]
+            else:
+                outputs = [_convert_sheet(excel_file, sheet, csv_path) for sheet, csv_path in sheets]
+
+        for out in outputs:
+            print(f"  ✓ Sheet '{out['sheet']}': {out['rows']} rows × {out['columns']} columns → {os.path.basename(out['csv'])}")
+
+        manifest.record(excel_file_path, {'key': key, 'outputs': outputs}, outputs=csv_paths)
+        manifest.save()
         
-        print(f"\nSuccessfully converted {len(converted_files)} sheet(s) to CSV.")
-        return converted_files
+        print(f"\nSuccessfully converted {len(outputs)} sheet(s) to CSV.")
+        return csv_paths
         
     except Exception as e:
         print(f"Error converting Excel file: {e}")
@@ -105,11 +225,19 @@ def convert_all_sheets(excel_file_path, output_dir=None):
 
 def main():
     """Main function to handle command line arguments."""
+    jobs = pop_jobs_arg(sys.argv)
+    full = '--full' in sys.argv
+    if full:
+        sys.argv.remove('--full')
+
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python excel_to_csv.py <excel_file>              # Convert first sheet to CSV")
         print("  python excel_to_csv.py <excel_file> <csv_file>   # Convert with custom output")
         print("  python excel_to_csv.py <excel_file> --all        # Convert all sheets to separate CSV files")
+        print("\nOptions:")
+        print("  --jobs N   Convert sheets in parallel (with --all)")
+        print("  --full     Convert even if the workbook is unchanged")
         print("\nExample:")
         print("  python excel_to_csv.py data/excel/VAULT 3.0.xlsx")
         print("  python excel_to_csv.py data/excel/VAULT 3.0.xlsx output.csv")
@@ -124,10 +252,10 @@ def main():
     
     # Check for --all flag
     if len(sys.argv) > 2 and sys.argv[2] == '--all':
-        convert_all_sheets(excel_file)
+        convert_all_sheets(excel_file, jobs=jobs, full=full)
     else:
         csv_file = sys.argv[2] if len(sys.argv) > 2 else None
-        excel_to_csv(excel_file, csv_file)
+        excel_to_csv(excel_file, csv_file, full=full)
 
 
 if __name__ == '__main__':
@@ -5,23 +5,31 @@ Extracts core clinical features from XML files and matches with CSV outcomes.
 """
 
 import pandas as pd
-import xml.etree.ElementTree as ET
 import os
 import sys
 from datetime import datetime
 from match_xml_csv import (
     extract_patient_info_from_xml,
-    normalize_name,
     normalize_dob,
     create_name_variations,
     load_csv_data
 )
+from exam_store import list_xml_names, stored_sha256
 from feature_config import TRAINING_FEATURES
+from manifest import StageManifest
+from xml_reader import iter_xml_entries
+from record_linkage import LinkageIndex
+from roster_loader import load_roster, feature_lookup
+from training_dataset import OUTPUT_COLUMNS, write_training_dataset
 
 
 XML_DIR = "XML files"
 CSV_FILE = "data/excel/VAULT 3.0.csv"
 OUTPUT_FILE = "data/processed/training_data.csv"
+DATASET_FILE = "data/processed/training_data.parquet"
+
+# Bump when extract_xml_features() output changes so cached results are redone
+EXTRACT_VERSION = 1
 
 # Clinical ranges for validation
 FEATURE_RANGES = {
@@ -81,6 +89,29 @@ def calculate_age(dob_str, exam_date_str):
         return None
 
 
+# XML entry key -> feature, read from the first "Test Data OD/OS" section
+TEST_DATA_KEYS = {
+    'Eye': 'Eye',
+    'Test Date': 'Exam_Date',
+    'Central Corneal Thickness': 'CCT',
+    'SimK steep D': 'SimK_steep',
+    'Cornea Dia Horizontal': 'WTW',
+    'Pupil diameter mm': 'Pupil_diameter',
+}
+
+# XML entry key -> feature, first non-empty value in any section
+OVERVIEW_KEYS = {
+    'ACV': 'ACV',
+    'BAD D': 'BAD_D',
+    'ACD (Int.) [mm]': 'ACD_internal',
+    'ACA (180°) [°]': 'ACA_global',
+    'TCRP 3mm zone pupil Km [D]': 'TCRP_Km',
+    'TCRP 3mm zone pupil Asti [D]': 'TCRP_Astigmatism',
+}
+
+XML_FEATURE_KEYS = {'Name', 'Surname', 'DOB'} | set(TEST_DATA_KEYS) | set(OVERVIEW_KEYS)
+
+
 def extract_xml_features(xml_file_path):
     """
     Extract core features from a single XML file.
@@ -88,9 +119,6 @@ def extract_xml_features(xml_file_path):
     Returns dict with features or None if extraction fails.
     """
     try:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-        
         features = {
             'XML_File': os.path.basename(xml_file_path),
             'Name': None,
@@ -111,21 +139,52 @@ def extract_xml_features(xml_file_path):
             'validation_warnings': []
         }
         
-        # Extract patient info
+        # Single streaming pass over the XML:
+        # - Patient Data: name and DOB
+        # - first "Test Data OD/OS" section with an Eye: eye-specific measurements
+        # - any section: first non-empty value of each overview key
         surname = ''
         first_name = ''
-        
-        for section in root.findall('section[@name="Patient Data"]'):
-            for entry in section.findall('entry'):
-                key = entry.get('key', '')
-                value = entry.text or ''
-                
+        patient_seen = False
+        test_section = None
+        test_done = False
+        current_section = None
+        overview_missing = set(OVERVIEW_KEYS.values())
+        
+        for section_name, key, value in iter_xml_entries(xml_file_path, XML_FEATURE_KEYS):
+            value = value or ''
+            
+            if section_name != current_section:
+                # The eye-specific section is final once it has given us an eye
+                if current_section == test_section and features['Eye']:
+                    test_done = True
+                current_section = section_name
+            
+            # Stop once nothing later in the file can change the result
+            if (patient_seen and test_done and not overview_missing
+                    and section_name != 'Patient Data'):
+                break
+            
+            if section_name == 'Patient Data':
+                patient_seen = True
                 if key == 'Name':
                     first_name = value.strip()
                 elif key == 'Surname':
                     surname = value.strip()
                 elif key == 'DOB':
                     features['DOB'] = normalize_dob(value.strip())
+            
+            if (not test_done and 'Test Data' in section_name
+                    and ('OD' in section_name or 'OS' in section_name)):
+                test_section = section_name
+                if key in TEST_DATA_KEYS:
+                    features[TEST_DATA_KEYS[key]] = value.strip()
+            
+            feature = OVERVIEW_KEYS.get(key)
+            if feature and not features[feature]:
+                features[feature] = value.strip()
+                if features[feature]:
+                    overview_missing.discard(feature)
         
         # Combine surname and first name (surname first for matching)
         if surname and first_name:
@@ -135,53 +194,6 @@ def extract_xml_features(xml_file_path):
         elif first_name:
             features['Name'] = first_name
         
-        # Extract features from all sections
-        # First pass: get eye-specific data from Test Data section
-        for section in root.findall('section'):
-            section_name = section.get('name', '')
-            
-            if 'Test Data' in section_name and ('OD' in section_name or 'OS' in section_name):
-                # Extract eye, exam date, and measurements
-                for entry in section.findall('entry'):
-                    key = entry.get('key', '')
-                    value = entry.text or ''
-                    
-                    if key == 'Eye':
-                        features['Eye'] = value.strip()
-                    elif key == 'Test Date':
-                        features['Exam_Date'] = value.strip()
-                    elif key == 'Central Corneal Thickness':
-                        features['CCT'] = value.strip()
-                    elif key == 'SimK steep D':
-                        features['SimK_steep'] = value.strip()
-                    elif key == 'Cornea Dia Horizontal':
-                        features['WTW'] = value.strip()
-                    elif key == 'Pupil diameter mm':
-                        features['Pupil_diameter'] = value.strip()
-                
-                # Only process first test data section found
-                if features['Eye']:
-                    break
-        
-        # Second pass: get fields from General Overview section
-        for section in root.findall('section'):
-            for entry in section.findall('entry'):
-                key = entry.get('key', '')
-                value = entry.text or ''
-                
-                if key == 'ACV' and not features['ACV']:
-                    features['ACV'] = value.strip()
-                elif key == 'BAD D' and not features['BAD_D']:
-                    features['BAD_D'] = value.strip()
-                elif key == 'ACD (Int.) [mm]' and not features['ACD_internal']:
-                    features['ACD_internal'] = value.strip()
-                elif key == 'ACA (180°) [°]' and not features['ACA_global']:
-                    features['ACA_global'] = value.strip()
-                elif key == 'TCRP 3mm zone pupil Km [D]' and not features['TCRP_Km']:
-                    features['TCRP_Km'] = value.strip()
-                elif key == 'TCRP 3mm zone pupil Asti [D]' and not features['TCRP_Astigmatism']:
-                    features['TCRP_Astigmatism'] = value.strip()
-        
         # Calculate age
         if features['DOB'] and features['Exam_Date']:
             features['Age'] = calculate_age(features['DOB'], features['Exam_Date'])
@@ -282,87 +294,32 @@ def merge_with_csv(xml_features, csv_lookup):
 def load_csv_with_seq():
     """
     Load CSV and create lookup with SEQ included.
-    Modified version of load_csv_data to include SEQ.
+    Same roster as load_csv_data (shared via roster_loader), with SEQ and
+    numeric ICL power.
     """
     if not os.path.exists(CSV_FILE):
         print(f"Error: CSV file '{CSV_FILE}' not found.")
         return None
     
     try:
-        df = pd.read_csv(CSV_FILE)
-        
-        lookup = {}
-        
-        for idx, row in df.iterrows():
-            name = normalize_name(row.get('NAME', ''))
-            dob = normalize_dob(row.get('DOB', ''))
-            eye = str(row.get('Eye', '')).strip().upper()
-            
-            # Get exchange status
-            exchange = str(row.get('Exchange?', '')).strip().upper() == 'YES'
-            
-            # Get lens size and vault (use exchanged if applicable)
-            if exchange:
-                lens_size = row.get('Exchanged Size', '')
-                vault = row.get('Exchanged Vault', '')
-            else:
-                lens_size = row.get('ICL Size', '')
-                vault = row.get('Vault', '')
-            
-            # Get Sphere and Cyl to calculate SEQ
-            sphere = row.get('Sphere', '')
-            cyl = row.get('Cyl', '')
-            
-            # Calculate SEQ = Sphere + (Cyl/2)
-            seq = None
-            if pd.notna(sphere) and pd.notna(cyl):
-                try:
-                    seq = float(sphere) + (float(cyl) / 2.0)
-                except:
-                    pass
-            elif pd.notna(sphere) and not pd.notna(cyl):
-                # If only sphere available, use it as SEQ
-                try:
-                    seq = float(sphere)
-                except:
-                    pass
-            
-            # Get ICL Power (use exchanged if applicable)
-            if exchange:
-                icl_power = row.get('Exchanged Power', '')
-            else:
-                icl_power = row.get('ICL Power', '')
-            
-            data_entry = {
-                'name': name,
-                'dob': dob,
-                'eye': eye,
-                'lens_size': lens_size if pd.notna(lens_size) else None,
-                'vault': vault if pd.notna(vault) else None,
-                'exchange': exchange,
-                'seq': seq,
-                'icl_power': float(icl_power) if pd.notna(icl_power) and icl_power != '' else None,
-            }
-            
-            # Create name variations
-            name_variations = create_name_variations(name)
-            for name_var in name_variations:
-                key = (name_var, dob, eye)
-                lookup[key] = data_entry
-        
-        return lookup
-        
+        records, variations = load_roster(CSV_FILE)
+        return feature_lookup(records, variations)
     except Exception as e:
         print(f"Error loading CSV: {e}")
         return None
 
 
-def extract_all_features():
+def extract_all_features(full=False):
     """
     Extract features from all XML files and merge with CSV data.
+
+    Per-XML features are cached in the stage manifest and only re-extracted
+    for new or changed XMLs; pass full=True to ignore the cache.
     """
-    if not os.path.exists(XML_DIR):
-        print(f"Error: {XML_DIR} directory not found.")
+    # XML files on disk plus exams only in the exam store
+    xml_files = list_xml_names(XML_DIR)
+    if not xml_files:
+        print(f"Error: no XML files in {XML_DIR} or the exam store.")
         return None
     
     # Load CSV lookup
@@ -372,20 +329,25 @@ def extract_all_features():
         return None
     
     print(f"Loaded CSV with {len(set([(v['name'], v['dob'], v['eye']) for v in csv_lookup.values()]))} unique patients\n")
+    linkage = LinkageIndex(csv_lookup)
     
     # Process all XML files
-    xml_files = sorted([f for f in os.listdir(XML_DIR) if f.endswith('.xml')])
-    
     print(f"Processing {len(xml_files)} XML files...\n")
     
+    feature_manifest = StageManifest('extract_features', EXTRACT_VERSION, full=full)
     all_features = []
     warnings_list = []
     
     for xml_file in xml_files:
         xml_path = os.path.join(XML_DIR, xml_file)
         
-        # Extract XML features
-        features = extract_xml_features(xml_path)
+        # Extract XML features (reuse the cached result if the XML is unchanged)
+        xml_sha256 = stored_sha256(xml_path)
+        features = feature_manifest.lookup(xml_path, xml_sha256)
+        if features is None:
+            features = extract_xml_features(xml_path)
+            if features:
+                feature_manifest.record(xml_path, features, sha256=xml_sha256)
         if not features:
             continue
         
@@ -410,64 +372,16 @@ def extract_all_features():
                 break
         
         # Strategy 2: Name + DOB only (ignore eye)
-        if not matched_data:
-            for name_var in name_variations:
-                for csv_key, csv_data in csv_lookup.items():
-                    csv_name, csv_dob, csv_eye = csv_key
-                    if name_var == csv_name and dob == csv_dob:
-                        matched_data = csv_data
-                        break
-                if matched_data:
-                    break
-        
         # Strategy 3: Fuzzy name match with exact DOB
-        if not matched_data and dob:
-            import difflib
-            best_ratio = 0
-            best_candidate = None
-            
-            for csv_key, csv_data in csv_lookup.items():
-                csv_name, csv_dob, csv_eye = csv_key
-                if dob == csv_dob:
-                    for name_var in name_variations:
-                        ratio = difflib.SequenceMatcher(None, name_var.upper(), csv_name.upper()).ratio()
-                        if ratio > best_ratio:
-                            best_ratio = ratio
-                            best_candidate = csv_data
-            
-            if best_ratio > 0.8:
-                matched_data = best_candidate
-        
         # Strategy 4: Fuzzy DOB (±7 days) with high name similarity (>0.9)
-        if not matched_data and dob:
-            import difflib
-            best_ratio = 0
-            best_candidate = None
-            
-            try:
-                xml_dob_date = datetime.strptime(dob, '%Y-%m-%d')
-            except:
-                xml_dob_date = None
-            
-            if xml_dob_date:
-                for csv_key, csv_data in csv_lookup.items():
-                    csv_name, csv_dob, csv_eye = csv_key
-                    
-                    try:
-                        csv_dob_date = datetime.strptime(csv_dob, '%Y-%m-%d')
-                    except:
-                        continue
-                    
-                    dob_diff = abs((xml_dob_date - csv_dob_date).days)
-                    if dob_diff <= 7 and dob_diff > 0:
-                        for name_var in name_variations:
-                            ratio = difflib.SequenceMatcher(None, name_var.upper(), csv_name.upper()).ratio()
-                            if ratio > best_ratio and ratio > 0.9:
-                                best_ratio = ratio
-                                best_candidate = csv_data
-                
-                if best_ratio > 0.9 and best_candidate:
-                    matched_data = best_candidate
+        if not matched_data:
+            matched_key = (
+                linkage.match_name_dob(name_variations, dob)
+                or linkage.match_fuzzy_same_dob(name_variations, dob, threshold=0.8)
+                or linkage.match_fuzzy_near_dob(name_variations, dob, max_days=7, threshold=0.9)
+            )
+            if matched_key:
+                matched_data = csv_lookup[matched_key]
         
         if not matched_data:
             print(f"⚠️  {xml_file}: No CSV match for {name}")
@@ -503,8 +417,12 @@ def extract_all_features():
         
         all_features.append(features)
     
+    feature_manifest.prune(xml_files)
+    feature_manifest.save()
+    
     print(f"\n{'='*60}")
     print(f"Extracted features from {len(all_features)} XML files")
+    print(f"XML parsing: {feature_manifest.summary()}")
     print(f"{'='*60}\n")
     
     # Convert to DataFrame
@@ -532,19 +450,15 @@ def extract_all_features():
         print(warnings_df.to_string(index=False))
     
     # Save complete training data
-    output_columns = [
-        'XML_File', 'Name', 'DOB', 'Eye', 'Exam_Date',
-        'Age', 'WTW', 'ACD_internal', 'ACV', 'ACA_global', 'Pupil_diameter',
-        'AC_shape_ratio', 'TCRP_Km', 'TCRP_Astigmatism', 'SEQ', 'ICL_Power',
-        'SimK_steep', 'CCT', 'BAD_D',
-        'Lens_Size', 'Vault', 'Exchange'
-    ]
-    
-    df_output = df[output_columns].copy()
+    df_output = df[OUTPUT_COLUMNS].copy()
     df_output.to_csv(OUTPUT_FILE, index=False)
     
     print(f"\n✅ Training data saved to: {OUTPUT_FILE}")
     
+    # Typed copy with engineered features precomputed, for the trainers
+    if write_training_dataset(df_output, DATASET_FILE):
+        print(f"✅ Typed dataset saved to: {DATASET_FILE}")
+    
     # Save flagged incomplete cases (have outcomes but missing features)
     both_outcomes = df[['Vault', 'Lens_Size']].notna().all(axis=1)
     # Flag based on configurable training feature list
@@ -577,7 +491,7 @@ def main():
     print("="*60)
     print()
     
-    df = extract_all_features()
+    df = extract_all_features(full='--full' in sys.argv)
     
     if df is not None:
         print("\n" + "="*60)
@@ -2,23 +2,43 @@
 """
 INI to XML Converter with Roster Generation
 Converts INI files to XML format and maintains a roster of processed files.
+
+Every converted INI is also added to the exam store (exam_store.py), which
+the pipeline stages read instead of the XMLs. With --no-xml only the store
+is written; exam_store.py --export-xml produces the XML files on demand.
 """
 
 import configparser
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import multiprocessing
 import sys
 import os
+import threading
 import zipfile
 import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from cli_args import pop_jobs_arg
+from exam_store import (
+    default_store, drop_deleted_xml, exam_name, import_xml_dir, list_xml_names, write_sections_xml,
+)
+from manifest import StageManifest
+from xml_reader import read_patient_info
 
 
 XML_OUTPUT_DIR = "XML files"
 ROSTER_FILE = "data/processed/roster.md"
+ROSTER_INDEX = "data/processed/roster_index.sqlite"
 IMAGES_DIR = "data/images"
 
+# Bump when the XML output format changes so every INI is reconverted
+INI_STAGE_VERSION = 1
+
+# --no-xml: only add converted INIs to the exam store
+WRITE_XML = True
+
 def is_copy_filename(filename):
     return " - Copy" in filename
 
@@ -31,49 +51,7 @@ def extract_patient_info(xml_file_path):
         dict with keys: name, surname, full_name, eye, dob, xml_filename
     """
     try:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-        
-        info = {
-            'name': '',
-            'surname': '',
-            'full_name': '',
-            'eye': '',
-            'dob': '',
-            'xml_filename': os.path.basename(xml_file_path)
-        }
-        
-        # Extract from Patient Data section
-        for section in root.findall('section[@name="Patient Data"]'):
-            for entry in section.findall('entry'):
-                key = entry.get('key', '')
-                value = entry.text or ''
-                
-                if key == 'Name':
-                    info['name'] = value.strip()
-                elif key == 'Surname':
-                    info['surname'] = value.strip()
-                elif key == 'DOB':
-                    info['dob'] = value.strip()
-        
-        # Build full name
-        parts = [info['surname'], info['name']]
-        info['full_name'] = ' '.join([p for p in parts if p]).strip() or 'Unknown'
-        
-        # Extract eye laterality from Test Data sections
-        # Look for sections like "Test Data OD 0" or "Test Data OS 0"
-        for section in root.findall('section'):
-            section_name = section.get('name', '')
-            if 'Test Data' in section_name:
-                for entry in section.findall('entry[@key="Eye"]'):
-                    eye_value = entry.text or ''
-                    if eye_value:
-                        info['eye'] = eye_value.strip()
-                        break
-                if info['eye']:
-                    break
-        
-        return info
+        return read_patient_info(xml_file_path)
     except Exception as e:
         print(f"Warning: Could not extract patient info from {xml_file_path}: {e}")
         return {
@@ -84,67 +62,170 @@ def extract_patient_info(xml_file_path):
         }
 
 
-def update_roster(xml_file_path):
+def roster_line(full_name, eye, dob, xml_filename):
+    return f"| {full_name} | {eye} | {dob} | {xml_filename} |\n"
+
+
+def _seed_index_from_roster(conn):
+    """Import rows from an existing roster.md so entries are not lost."""
+    if not os.path.exists(ROSTER_FILE):
+        return
+    rows = []
+    with open(ROSTER_FILE, 'r', encoding='utf-8') as f:
+        # Skip header lines (title, empty line, table header, separator)
+        for line in f.readlines()[4:]:
+            if line.strip() and '|' in line and not line.strip().startswith('|--'):
+                parts = [p.strip() for p in line.split('|')]
+                if len(parts) >= 5:
+                    rows.append((parts[4], parts[1], parts[2], parts[3]))
+    conn.executemany(
+        "INSERT OR IGNORE INTO roster (xml_filename, full_name, eye, dob) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+def open_roster_index():
     """
-    Update the roster.md file with patient information from the XML file.
+    Open the persistent roster index, creating it if needed.
+
+    The index holds one row per XML plus the file's size/mtime, so
+    rebuild_roster() only re-parses XMLs that changed. On first use it is
+    seeded from the current roster.md.
     """
-    info = extract_patient_info(xml_file_path)
-    
-    # Read existing roster if it exists
-    roster_entries = {}
-    if os.path.exists(ROSTER_FILE):
-        with open(ROSTER_FILE, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            # Skip header lines (title, empty line, table header, separator)
-            for line in lines[4:]:  # Skip first 4 lines (header, blank, table header, separator)
-                if line.strip() and '|' in line and not line.strip().startswith('|--'):
-                    # Extract XML filename from the line to use as key
-                    parts = [p.strip() for p in line.split('|')]
-                    if len(parts) >= 5:
-                        xml_filename = parts[4].strip()
-                        roster_entries[xml_filename] = line
-    
-    # Update or add entry
-    xml_basename = os.path.basename(xml_file_path)
-    roster_entries[xml_basename] = f"| {info['full_name']} | {info['eye']} | {info['dob']} | {xml_basename} |\n"
-    
-    # Sort entries by name
-    sorted_entries = sorted(roster_entries.values(), key=lambda x: x.split('|')[1].strip() if '|' in x else x)
-    
-    # Write roster file
+    os.makedirs(os.path.dirname(ROSTER_INDEX), exist_ok=True)
+    conn = sqlite3.connect(ROSTER_INDEX)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS roster (
+               xml_filename TEXT PRIMARY KEY,
+               full_name TEXT NOT NULL,
+               eye TEXT NOT NULL,
+               dob TEXT NOT NULL,
+               size INTEGER,
+               mtime REAL
+           )"""
+    )
+    if conn.execute("SELECT COUNT(*) FROM roster").fetchone()[0] == 0:
+        _seed_index_from_roster(conn)
+        conn.commit()
+    return conn
+
+
+def _xml_stat(xml_file_path):
+    """(size, mtime) of an XML, or (None, None) for exams only in the exam store."""
+    if not os.path.exists(xml_file_path):
+        return None, None
+    stat = os.stat(xml_file_path)
+    return stat.st_size, stat.st_mtime
+
+
+def index_xml(conn, xml_file_path, info=None):
+    """Upsert one XML's patient info into the roster index."""
+    if info is None:
+        info = extract_patient_info(xml_file_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO roster VALUES (?, ?, ?, ?, ?, ?)",
+        (os.path.basename(xml_file_path), info['full_name'], info['eye'], info['dob'],
+         *_xml_stat(xml_file_path)),
+    )
+    return info
+
+
+def render_roster(conn):
+    """Write roster.md from the index, sorted by name."""
+    rows = conn.execute(
+        "SELECT full_name, eye, dob, xml_filename FROM roster ORDER BY full_name, xml_filename"
+    ).fetchall()
     with open(ROSTER_FILE, 'w', encoding='utf-8') as f:
         f.write("# Patient Roster\n\n")
         f.write("| Name | Eye | DOB | XML File |\n")
         f.write("|------|-----|-----|----------|\n")
-        f.writelines(sorted_entries)
+        f.writelines(roster_line(*row) for row in rows)
+    return len(rows)
+
+
+@contextmanager
+def roster_batch():
+    """
+    Collect roster updates for a batch and render roster.md once at the end.
+
+        with roster_batch() as conn:
+            update_roster(xml_path, conn)
+    """
+    conn = open_roster_index()
+    try:
+        yield conn
+        conn.commit()
+        render_roster(conn)
+    finally:
+        conn.close()
+
+
+def update_roster(xml_file_path, conn=None):
+    """
+    Update the roster with patient information from the XML file.
+
+    With `conn` (from roster_batch()) the entry is only added to the index;
+    roster.md is rendered when the batch closes. Without it, roster.md is
+    re-rendered immediately.
+    """
+    if conn is None:
+        with roster_batch() as batch_conn:
+            return update_roster(xml_file_path, batch_conn)
     
+    info = index_xml(conn, xml_file_path)
     print(f"Updated roster: {info['full_name']} ({info['eye']}) - {info['dob']}")
 
 
-def ini_to_xml(ini_file_path, xml_file_path=None):
+def config_sections(config):
+    """A parsed INI config as [(section, [(key, value), ...]), ...], as written to the XML."""
+    sections = [(name, config.items(name)) for name in config.sections()]
+    if config.defaults():
+        sections.append(('DEFAULT', list(config.defaults().items())))
+    return sections
+
+
+def write_config_xml(config, handle):
+    """
+    Stream a parsed INI config to `handle` as pretty-printed XML.
+
+    Produces the same bytes minidom's toprettyxml(indent="  ") gave us
+    (see write_sections_xml), without building the tree and re-parsing it.
+    """
+    write_sections_xml(config_sections(config), handle)
+
+
+def convert_ini(ini_file_path, xml_file_path=None, log=print):
     """
     Convert an INI file to XML format.
-    
-    Args:
-        ini_file_path: Path to the input INI file
-        xml_file_path: Path to the output XML file (optional)
-    
-    Returns:
-        Path to the created XML file
+
+    Same as ini_to_xml() but reports progress through `log`, so worker
+    processes can hand their messages back to the parent in order.
+    """
+    return _convert(ini_file_path, xml_file_path, log)[0]
+
+
+def _convert(ini_file_path, xml_file_path=None, log=print, write_xml=True, output_dir=None):
+    """
+    convert_ini() that also returns the parsed sections for the exam store.
+
+    Returns (xml_path, sections); sections is None when the INI was not
+    read (unreadable, or its XML already exists). With write_xml=False the
+    XML is not written and xml_path is where it would go. Without
+    xml_file_path the XML goes to output_dir (default XML_OUTPUT_DIR).
     """
-    # Create XML output directory if it doesn't exist
-    os.makedirs(XML_OUTPUT_DIR, exist_ok=True)
-    
     # Set default output filename if not provided
     if xml_file_path is None:
+        # Create XML output directory if it doesn't exist
+        output_dir = output_dir or XML_OUTPUT_DIR
+        os.makedirs(output_dir, exist_ok=True)
         ini_basename = os.path.basename(ini_file_path)
         xml_basename = os.path.splitext(ini_basename)[0] + '.xml'
-        xml_file_path = os.path.join(XML_OUTPUT_DIR, xml_basename)
+        xml_file_path = os.path.join(output_dir, xml_basename)
     
     # NEW: Check if XML already exists to avoid redundant processing
     if os.path.exists(xml_file_path):
-        print(f"  - {os.path.basename(xml_file_path)} already exists, skipping.")
-        return xml_file_path
+        log(f"  - {os.path.basename(xml_file_path)} already exists, skipping.")
+        return xml_file_path, None
     
     # Read the INI file (tolerate stray lines without '=')
     config = configparser.ConfigParser(allow_no_value=True, strict=False)
@@ -159,54 +240,177 @@ def ini_to_xml(ini_file_path, xml_file_path=None):
         try:
             config.read(ini_file_path, encoding=encoding)
             read_success = True
-            print(f"Successfully read {os.path.basename(ini_file_path)} with {encoding} encoding")
+            log(f"Successfully read {os.path.basename(ini_file_path)} with {encoding} encoding")
             break
         except UnicodeDecodeError:
             continue
         except Exception as e:
-            print(f"Error reading INI file with {encoding} encoding: {e}")
+            log(f"Error reading INI file with {encoding} encoding: {e}")
             continue
     
     if not read_success:
-        print(f"Error: Could not read INI file {ini_file_path} with any supported encoding")
-        return None
-    
-    # Create root XML element
-    root = ET.Element('configuration')
-    
-    # Convert each section to XML
-    for section_name in config.sections():
-        section_elem = ET.SubElement(root, 'section', name=section_name)
-        
-        # Add all key-value pairs in this section
-        for key, value in config.items(section_name):
-            entry = ET.SubElement(section_elem, 'entry', key=key)
-            entry.text = value
-    
-    # Also handle items not in any section (rare but possible)
-    if config.defaults():
-        default_section = ET.SubElement(root, 'section', name='DEFAULT')
-        for key, value in config.defaults().items():
-            entry = ET.SubElement(default_section, 'entry', key=key)
-            entry.text = value
-    
-    # Create ElementTree and convert to string with pretty formatting
-    tree = ET.ElementTree(root)
-    
-    # Pretty print the XML
-    xml_string = ET.tostring(root, encoding='unicode')
-    dom = minidom.parseString(xml_string)
-    pretty_xml = dom.toprettyxml(indent="  ")
+        log(f"Error: Could not read INI file {ini_file_path} with any supported encoding")
+        return None, None
     
+    sections = config_sections(config)
+    if not write_xml:
+        log(f"Successfully parsed {os.path.basename(ini_file_path)} for the exam store")
+        return xml_file_path, sections
+
     # Write to file
     try:
         with open(xml_file_path, 'w', encoding='utf-8') as f:
-            f.write(pretty_xml)
-        print(f"Successfully converted to {xml_file_path}")
-        return xml_file_path
+            write_sections_xml(sections, f)
+        log(f"Successfully converted to {xml_file_path}")
+        return xml_file_path, sections
     except Exception as e:
-        print(f"Error writing XML file: {e}")
-        return None
+        log(f"Error writing XML file: {e}")
+        return None, None
+
+
+def ini_to_xml(ini_file_path, xml_file_path=None):
+    """
+    Convert an INI file to XML format.
+    
+    Args:
+        ini_file_path: Path to the input INI file
+        xml_file_path: Path to the output XML file (optional)
+    
+    Returns:
+        Path to the created XML file
+    """
+    return convert_ini(ini_file_path, xml_file_path)
+
+
+def _convert_worker(ini_file_path, write_xml, output_dir):
+    """
+    Process-pool entry point: convert one INI and return its log lines.
+
+    output_dir is passed in because spawned / forkserver workers re-import
+    this module and would not see a changed XML_OUTPUT_DIR.
+    """
+    messages = []
+    xml_path, sections = _convert(ini_file_path, log=messages.append, write_xml=write_xml,
+                                  output_dir=output_dir)
+    return xml_path, sections, messages
+
+
+def _store_exam(store, xml_path, sections):
+    """Add a converted exam to the store (or its existing XML, if the store lacks it)."""
+    if store is None or not xml_path:
+        return
+    if sections is not None:
+        store.add(exam_name(xml_path), sections, detached=not os.path.exists(xml_path))
+    elif exam_name(xml_path) not in store and os.path.exists(xml_path):
+        store.add_xml(xml_path)
+
+
+def _pool_context():
+    """
+    Start method for the conversion pool. Forking while other threads run
+    (a run_pipeline.py stage) can copy a lock another thread holds into the
+    child, so start workers from a clean forkserver process then.
+    """
+    if threading.active_count() > 1 and 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+
+def convert_ini_files(ini_paths, jobs=1, store=None, output_dir=None):
+    """
+    Convert INI files to XML in output_dir (default XML_OUTPUT_DIR), using
+    a process pool when jobs > 1.
+
+    Yields (ini_path, xml_path) in the order of `ini_paths` regardless of
+    which worker finishes first, and prints each file's messages in that
+    same order so logs stay deterministic. With `store` (an ExamStore) each
+    exam is added to it before it is yielded; the caller saves the store.
+    """
+    write_xml = WRITE_XML or store is None
+    output_dir = output_dir or XML_OUTPUT_DIR
+    if jobs <= 1 or len(ini_paths) <= 1:
+        for ini_path in ini_paths:
+            print(f"\nProcessing: {os.path.basename(ini_path)}")
+            xml_path, sections = _convert(ini_path, write_xml=write_xml, output_dir=output_dir)
+            _store_exam(store, xml_path, sections)
+            yield ini_path, xml_path
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    chunksize = max(1, len(ini_paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context()) as pool:
+        results = pool.map(_convert_worker, ini_paths, [write_xml] * len(ini_paths),
+                           [output_dir] * len(ini_paths), chunksize=chunksize)
+        for ini_path, (xml_path, sections, messages) in zip(ini_paths, results):
+            print(f"\nProcessing: {os.path.basename(ini_path)}")
+            for message in messages:
+                print(message)
+            _store_exam(store, xml_path, sections)
+            yield ini_path, xml_path
+
+
+def _is_converted(xml_file_path):
+    """The XML exists, or the exam store keeps its exam without one (--no-xml, --prune-xml)."""
+    return os.path.exists(xml_file_path) or default_store().has_exam(xml_file_path)
+
+
+def is_up_to_date(ini_path, xml_file_path, ini_manifest):
+    """
+    Check whether xml_file_path exists and came from this INI's current content.
+
+    INIs converted before the manifest existed are adopted as-is. If a known
+    INI's content changed, or it was converted by an older INI_STAGE_VERSION,
+    its stale XML is removed so it gets regenerated.
+    """
+    if not _is_converted(xml_file_path):
+        return False
+    if ini_manifest.is_outdated(ini_path):
+        print(f"\n{os.path.basename(ini_path)} was converted by an older version, regenerating XML")
+    elif not ini_manifest.knows(ini_path):
+        ini_manifest.record(ini_path, outputs=[os.path.basename(xml_file_path)])
+        return True
+    elif ini_manifest.is_current(ini_path):
+        return True
+    else:
+        print(f"\n{os.path.basename(ini_path)} changed since last conversion, regenerating XML")
+    if os.path.exists(xml_file_path):
+        os.remove(xml_file_path)
+    return False
+
+
+def convert_and_record(to_convert, jobs, ini_manifest):
+    """
+    Convert INIs, add them to the roster and record them in the manifest.
+
+    Yields (ini_path, xml_path) like convert_ini_files(); the manifest and
+    exam store are saved and roster.md rendered once the batch is done.
+    """
+    store = default_store()
+    with roster_batch() as roster:
+        for ini_path, xml_path in convert_ini_files(to_convert, jobs,
+                                                    store if store.serves(XML_OUTPUT_DIR) else None):
+            if xml_path:
+                update_roster(xml_path, roster)
+                ini_manifest.record(ini_path, outputs=[os.path.basename(xml_path)])
+            yield ini_path, xml_path
+    store.save()
+    ini_manifest.save()
+
+
+def sync_exam_store():
+    """
+    Import XMLs the exam store lacks or that changed after it was written,
+    and drop stored exams whose XML was deleted.
+    """
+    store = default_store()
+    if not store.available:
+        return
+    imported = import_xml_dir(store, XML_OUTPUT_DIR)
+    dropped = drop_deleted_xml(store, XML_OUTPUT_DIR)
+    if imported or dropped:
+        store.save()
+        print(f"Exam store: imported {imported} XML file(s), dropped {dropped} deleted "
+              f"({len(store)} exams)")
 
 
 def find_ini_files(directory):
@@ -224,12 +428,13 @@ def find_ini_files(directory):
     return ini_files
 
 
-def extract_zip_and_process(zip_file_path):
+def extract_zip_and_process(zip_file_path, jobs=1):
     """
     Extract a zip file, find all INI files, and process them.
     
     Args:
         zip_file_path: Path to the zip file
+        jobs: Number of worker processes for conversion
     """
     if not os.path.exists(zip_file_path):
         print(f"Error: Zip file '{zip_file_path}' not found.")
@@ -258,7 +463,8 @@ def extract_zip_and_process(zip_file_path):
         print(f"Found {len(ini_files)} INI file(s) in the zip archive.\n")
         
         # Process each INI file
-        processed = 0
+        ini_manifest = StageManifest('ini_to_xml', INI_STAGE_VERSION)
+        to_convert = []
         skipped = 0
         for ini_path in sorted(ini_files):
             ini_filename = os.path.basename(ini_path)
@@ -267,18 +473,18 @@ def extract_zip_and_process(zip_file_path):
                 skipped += 1
                 continue
             
-            # Check if XML already exists before processing
+            # Skip INIs whose XML is already up to date
             xml_basename = os.path.splitext(ini_filename)[0] + '.xml'
             xml_file_path = os.path.join(XML_OUTPUT_DIR, xml_basename)
             
-            if os.path.exists(xml_file_path):
+            if is_up_to_date(ini_path, xml_file_path, ini_manifest):
                 skipped += 1
                 continue
-                
-            print(f"\nProcessing: {ini_filename}")
-            xml_path = ini_to_xml(ini_path)
+            to_convert.append(ini_path)
+        
+        processed = 0
+        for ini_path, xml_path in convert_and_record(to_convert, jobs, ini_manifest):
             if xml_path:
-                update_roster(xml_path)
                 processed += 1
         
         print(f"\n{'='*50}")
@@ -301,7 +507,7 @@ def extract_zip_and_process(zip_file_path):
             shutil.rmtree(extract_dir, ignore_errors=True)
 
 
-def process_all_ini_files():
+def process_all_ini_files(jobs=1):
     """
     Process all INI files in the images directory.
     """
@@ -317,7 +523,8 @@ def process_all_ini_files():
     
     print(f"Found {len(ini_files)} INI file(s) to process.\n")
     
-    processed = 0
+    ini_manifest = StageManifest('ini_to_xml', INI_STAGE_VERSION)
+    to_convert = []
     skipped = 0
     for ini_file in sorted(ini_files):
         if is_copy_filename(ini_file):
@@ -326,18 +533,18 @@ def process_all_ini_files():
             continue
         ini_path = os.path.join(IMAGES_DIR, ini_file)
         
-        # Check if XML already exists
+        # Skip INIs whose XML is already up to date
         xml_basename = os.path.splitext(ini_file)[0] + '.xml'
         xml_file_path = os.path.join(XML_OUTPUT_DIR, xml_basename)
         
-        if os.path.exists(xml_file_path):
+        if is_up_to_date(ini_path, xml_file_path, ini_manifest):
             skipped += 1
             continue
-            
-        print(f"\nProcessing: {ini_file}")
-        xml_path = ini_to_xml(ini_path)
+        to_convert.append(ini_path)
+    
+    processed = 0
+    for ini_path, xml_path in convert_and_record(to_convert, jobs, ini_manifest):
         if xml_path:
-            update_roster(xml_path)
             processed += 1
     
     print(f"\n{'='*50}")
@@ -351,38 +558,39 @@ def rebuild_roster():
     """
     Rebuild the roster from all XML files in the XML files directory.
     """
-    if not os.path.exists(XML_OUTPUT_DIR):
-        print(f"Error: {XML_OUTPUT_DIR} directory not found.")
-        return
-    
-    xml_files = [f for f in os.listdir(XML_OUTPUT_DIR) if f.lower().endswith('.xml')]
+    xml_files = list_xml_names(XML_OUTPUT_DIR)
     
     if not xml_files:
-        print(f"No XML files found in {XML_OUTPUT_DIR} directory.")
+        print(f"No XML files found in {XML_OUTPUT_DIR} directory or the exam store.")
         return
     
     print(f"Rebuilding roster from {len(xml_files)} XML file(s)...\n")
     
-    roster_entries = {}
-    for xml_file in sorted(xml_files):
-        xml_path = os.path.join(XML_OUTPUT_DIR, xml_file)
-        info = extract_patient_info(xml_path)
-        roster_entries[xml_file] = f"| {info['full_name']} | {info['eye']} | {info['dob']} | {xml_file} |\n"
-    
-    # Sort entries by name
-    sorted_entries = sorted(roster_entries.values(), key=lambda x: x.split('|')[1].strip() if '|' in x else x)
-    
-    # Write roster file
-    with open(ROSTER_FILE, 'w', encoding='utf-8') as f:
-        f.write("# Patient Roster\n\n")
-        f.write("| Name | Eye | DOB | XML File |\n")
-        f.write("|------|-----|-----|----------|\n")
-        f.writelines(sorted_entries)
+    with roster_batch() as conn:
+        # Only re-parse XMLs whose size/mtime changed since they were indexed
+        # (exams only in the store have no file stats and are always re-read)
+        indexed = {
+            name: (size, mtime)
+            for name, size, mtime in conn.execute("SELECT xml_filename, size, mtime FROM roster")
+        }
+        parsed = 0
+        for xml_file in sorted(xml_files):
+            xml_path = os.path.join(XML_OUTPUT_DIR, xml_file)
+            stat = _xml_stat(xml_path)
+            if stat[0] is not None and indexed.get(xml_file) == stat:
+                continue
+            index_xml(conn, xml_path)
+            parsed += 1
+        
+        # Drop entries whose XML no longer exists
+        stale = set(indexed) - set(xml_files)
+        conn.executemany("DELETE FROM roster WHERE xml_filename = ?", [(name,) for name in stale])
     
-    print(f"Roster rebuilt successfully with {len(sorted_entries)} entries.")
+    print(f"Roster rebuilt successfully with {len(xml_files)} entries "
+          f"({parsed} parsed, {len(xml_files) - parsed} unchanged, {len(stale)} removed).")
 
 
-def process_all_zip_files():
+def process_all_zip_files(jobs=1):
     """
     Find and process all zip files in the images directory.
     """
@@ -405,11 +613,11 @@ def process_all_zip_files():
         print(f"{'='*60}")
         print(f"Processing zip file: {zip_file}")
         print(f"{'='*60}")
-        extract_zip_and_process(zip_path)
+        extract_zip_and_process(zip_path, jobs)
         print()
 
 
-def auto_process():
+def auto_process(jobs=1):
     """
     Automatically detect and process zip files and INI files in the images directory.
     Also processes loose INI files in the XML files directory.
@@ -424,15 +632,21 @@ def auto_process():
         manual_inis = [f for f in os.listdir(XML_OUTPUT_DIR) if f.upper().endswith('.INI')]
         if manual_inis:
             print(f"\nFound {len(manual_inis)} loose INI file(s) in {XML_OUTPUT_DIR}. Processing...\n")
-            processed = 0
+            ini_manifest = StageManifest('ini_to_xml', INI_STAGE_VERSION)
+            to_convert = []
             for ini_file in sorted(manual_inis):
                 if is_copy_filename(ini_file):
                     print(f"  - Skipping copy INI: {ini_file}")
                     continue
                 ini_path = os.path.join(XML_OUTPUT_DIR, ini_file)
-                xml_path = ini_to_xml(ini_path)
+                # Drops the XML if this INI changed since it was converted
+                is_up_to_date(ini_path, os.path.join(XML_OUTPUT_DIR, os.path.splitext(ini_file)[0] + '.xml'),
+                              ini_manifest)
+                to_convert.append(ini_path)
+            processed = 0
+            for ini_path, xml_path in convert_and_record(to_convert, jobs, ini_manifest):
+                ini_file = os.path.basename(ini_path)
                 if xml_path:
-                    update_roster(xml_path)
                     processed += 1
                     # Remove the INI file after conversion to clean up
                     try:
@@ -468,7 +682,7 @@ def auto_process():
                 print(f"    Removed: {ini_file}")
         
         print(f"\nFound {len(zip_files)} zip file(s). Processing...\n")
-        process_all_zip_files()
+        process_all_zip_files(jobs)
     
     # Then check for any remaining INI files (if no ZIP files were found)
     elif not zip_files:
@@ -477,13 +691,33 @@ def auto_process():
         
         if ini_files:
             print(f"\nFound {len(ini_files)} INI file(s). Processing...\n")
-            process_all_ini_files()
+            process_all_ini_files(jobs)
         else:
             print(f"No zip files or INI files found in {IMAGES_DIR} directory.")
 
 
+def pop_no_xml_arg(argv):
+    """Remove a `--no-xml` option from argv; converted INIs then only go to the exam store."""
+    if '--no-xml' not in argv:
+        return False
+    argv.remove('--no-xml')
+    if not default_store().serves(XML_OUTPUT_DIR):
+        print("⚠️  --no-xml needs pyarrow for the exam store; writing XML files instead.")
+        return False
+    return True
+
+
 def main():
     """Main function to handle command line arguments."""
+    global WRITE_XML
+    jobs = pop_jobs_arg(sys.argv)
+    WRITE_XML = not pop_no_xml_arg(sys.argv)
+    run_mode(jobs)
+    sync_exam_store()
+
+
+def run_mode(jobs):
+    """Dispatch on the command line mode (argv with --jobs/--no-xml removed)."""
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python ini_to_xml.py <ini_file>              # Process single file")
@@ -492,26 +726,29 @@ def main():
         print("  python ini_to_xml.py --unzip                 # Extract and process all zip files in images/")
         print("  python ini_to_xml.py --auto                  # Auto-detect and process zip/INI files")
         print("  python ini_to_xml.py --rebuild               # Rebuild roster from all XML files")
+        print("  Add --jobs N to convert with N worker processes (--jobs 0 = all CPUs)")
+        print("  Add --no-xml to write converted INIs only to the exam store")
         print("\nExample:")
         print("  python ini_to_xml.py images/00000000.INI")
         print("  python ini_to_xml.py --batch")
         print("  python ini_to_xml.py --unzip")
         print("  python ini_to_xml.py --auto")
+        print("  python ini_to_xml.py --auto --jobs 8")
         sys.exit(1)
     
     # Check for batch mode
     if sys.argv[1] == '--batch' or sys.argv[1] == '-b':
-        process_all_ini_files()
+        process_all_ini_files(jobs)
         return
     
     # Check for unzip mode
     if sys.argv[1] == '--unzip' or sys.argv[1] == '-u':
-        process_all_zip_files()
+        process_all_zip_files(jobs)
         return
     
     # Check for auto mode
     if sys.argv[1] == '--auto' or sys.argv[1] == '-a':
-        auto_process()
+        auto_process(jobs)
         return
     
     # Check for rebuild mode
@@ -522,7 +759,7 @@ def main():
     # Single file mode - check if it's a zip file
     input_file = sys.argv[1]
     if input_file.lower().endswith(('.zip', '.ZIP')):
-        extract_zip_and_process(input_file)
+        extract_zip_and_process(input_file, jobs)
         return
     
     # Single INI file mode
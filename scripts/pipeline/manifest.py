@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Content-hash manifest for incremental pipeline stages.
+
+Each stage keeps data/processed/manifest/<stage>.json with one entry per
+source file: its SHA-256, size/mtime, the stage version that processed it,
+the outputs it produced and (optionally) a cached JSON-serializable result.
+Stages ask the manifest whether an input is unchanged and reuse the cached
+result instead of re-parsing it.
+
+Inputs without a file (exams kept only in the exam store) are keyed by a
+content hash the caller passes as `sha256`.
+
+Bump a stage's version whenever its per-file output changes shape or
+meaning; every entry written by an older version is then treated as stale.
+"""
+
+import copy
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+MANIFEST_DIR = "data/processed/manifest"
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class StageManifest:
+    """
+    Per-stage record of processed inputs, keyed by file basename.
+
+    Usage:
+        manifest = StageManifest('extract_features', version=1)
+        result = manifest.lookup(path)
+        if result is None:
+            result = expensive(path)
+            manifest.record(path, result)
+        manifest.prune(current_names)
+        manifest.save()
+    """
+
+    def __init__(self, stage, version, manifest_dir=MANIFEST_DIR, full=False):
+        self.stage = stage
+        self.version = version
+        self.path = os.path.join(manifest_dir, f"{stage}.json")
+        self.hits = 0
+        self.misses = 0
+        self.entries = {}
+        self.outdated = set()       # inputs recorded by an older stage version
+        if not full and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == version:
+                    self.entries = data.get('files', {})
+                else:
+                    self.outdated = set(data.get('files', {}))
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable manifest {self.path}: {e}")
+
+    def knows(self, path):
+        return os.path.basename(path) in self.entries
+
+    def is_outdated(self, path):
+        """True if `path` was only processed by an older version of the stage."""
+        return os.path.basename(path) in self.outdated
+
+    def is_current(self, path, sha256=None):
+        """
+        True if `path` was processed before and its content has not changed.
+        Pass `sha256` for an input that is not a file on disk.
+        """
+        entry = self.entries.get(os.path.basename(path))
+        if entry is None:
+            return False
+        if sha256 is not None:
+            return entry['sha256'] == sha256
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return True
+        # Size/mtime changed: fall back to the content hash (e.g. a re-copied file)
+        if entry['size'] == stat.st_size and entry['sha256'] == file_sha256(path):
+            entry['mtime'] = stat.st_mtime
+            return True
+        return False
+
+    def lookup(self, path, sha256=None):
+        """Return a copy of the cached result for `path`, or None if stale."""
+        if self.is_current(path, sha256):
+            entry = self.entries[os.path.basename(path)]
+            if 'result' in entry:
+                self.hits += 1
+                return copy.deepcopy(entry['result'])
+        self.misses += 1
+        return None
+
+    def record(self, path, result=None, outputs=(), sha256=None):
+        """Record that `path` has been processed into `outputs` (and `result`)."""
+        if sha256 is not None:
+            size = mtime = None
+        else:
+            stat = os.stat(path)
+            sha256, size, mtime = file_sha256(path), stat.st_size, stat.st_mtime
+        entry = {
+            'sha256': sha256,
+            'size': size,
+            'mtime': mtime,
+            'outputs': list(outputs),
+            'processed_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        if result is not None:
+            entry['result'] = copy.deepcopy(result)
+        self.entries[os.path.basename(path)] = entry
+
+    def forget(self, path):
+        self.entries.pop(os.path.basename(path), None)
+
+    def prune(self, keep_names):
+        """Drop entries for inputs that no longer exist."""
+        keep = set(keep_names)
+        for name in [n for n in self.entries if n not in keep]:
+            del self.entries[name]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            'stage': self.stage,
+            'version': self.version,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+            'files': self.entries,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        return f"{self.hits} cached, {self.misses} (re)processed"
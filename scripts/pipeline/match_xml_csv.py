@@ -6,17 +6,22 @@ For exchanges, uses exchanged lens size and vault.
 """
 
 import pandas as pd
-import xml.etree.ElementTree as ET
 import os
 import sys
-import difflib
 from datetime import datetime
+from exam_store import list_xml_names, stored_sha256
+from manifest import StageManifest
+from xml_reader import read_patient_info
+from record_linkage import LinkageIndex
 
 
 XML_OUTPUT_DIR = "XML files"
 CSV_FILE = "data/excel/VAULT 3.0.csv"
 OUTPUT_FILE = "data/processed/matched_patients.csv"
 
+# Bump when extract_patient_info_from_xml() output changes
+PATIENT_INFO_VERSION = 1
+
 
 def extract_patient_info_from_xml(xml_file_path):
     """
@@ -26,48 +31,7 @@ def extract_patient_info_from_xml(xml_file_path):
         dict with keys: name, surname, full_name, eye, dob, xml_filename
     """
     try:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-        
-        info = {
-            'name': '',
-            'surname': '',
-            'full_name': '',
-            'eye': '',
-            'dob': '',
-            'xml_filename': os.path.basename(xml_file_path)
-        }
-        
-        # Extract from Patient Data section
-        for section in root.findall('section[@name="Patient Data"]'):
-            for entry in section.findall('entry'):
-                key = entry.get('key', '')
-                value = entry.text or ''
-                
-                if key == 'Name':
-                    info['name'] = value.strip()
-                elif key == 'Surname':
-                    info['surname'] = value.strip()
-                elif key == 'DOB':
-                    info['dob'] = value.strip()
-        
-        # Build full name (surname first, then name)
-        parts = [info['surname'], info['name']]
-        info['full_name'] = ' '.join([p for p in parts if p]).strip() or 'Unknown'
-        
-        # Extract eye laterality from Test Data sections
-        for section in root.findall('section'):
-            section_name = section.get('name', '')
-            if 'Test Data' in section_name:
-                for entry in section.findall('entry[@key="Eye"]'):
-                    eye_value = entry.text or ''
-                    if eye_value:
-                        info['eye'] = eye_value.strip()
-                        break
-                if info['eye']:
-                    break
-        
-        return info
+        return read_patient_info(xml_file_path)
     except Exception as e:
         print(f"Warning: Could not extract patient info from {xml_file_path}: {e}")
         return None
@@ -243,6 +207,9 @@ def normalize_dob(dob_str):
 def load_csv_data():
     """
     Load CSV data and create lookup dictionaries.
+
+    The parsed roster is shared with extract_features and cached by
+    roster_loader until the CSV changes.
     
     Returns:
         dict: Dictionary with key (name, dob, eye) -> row data
@@ -251,61 +218,23 @@ def load_csv_data():
         print(f"Error: CSV file '{CSV_FILE}' not found.")
         return None
     
+    from roster_loader import load_roster, match_lookup
     try:
-        df = pd.read_csv(CSV_FILE)
-        
-        # Create lookup dictionary
-        lookup = {}
-        
-        for idx, row in df.iterrows():
-            name = normalize_name(row.get('NAME', ''))
-            dob = normalize_dob(row.get('DOB', ''))
-            eye = str(row.get('Eye', '')).strip().upper()
-            
-            # Determine if exchange happened
-            exchange = str(row.get('Exchange?', '')).strip().upper() == 'YES'
-            
-            # Get lens size and vault (use exchanged if exchange happened)
-            if exchange:
-                lens_size = row.get('Exchanged Size', '')
-                vault = row.get('Exchanged Vault', '')
-            else:
-                lens_size = row.get('ICL Size', '')
-                vault = row.get('Vault', '')
-            
-            # Create data entry
-            data_entry = {
-                'name': name,
-                'dob': dob,
-                'eye': eye,
-                'lens_size': lens_size if pd.notna(lens_size) else '',
-                'vault': vault if pd.notna(vault) else '',
-                'exchange': exchange,
-                'original_lens_size': row.get('ICL Size', ''),
-                'original_vault': row.get('Vault', ''),
-                'exchanged_lens_size': row.get('Exchanged Size', ''),
-                'exchanged_vault': row.get('Exchanged Vault', ''),
-                'dos': row.get('DOS', ''),
-                'target': row.get('Target', ''),
-                'icl_power': row.get('ICL Power', ''),
-            }
-            
-            # Create name variations and add to lookup
-            name_variations = create_name_variations(name)
-            for name_var in name_variations:
-                # Create key for lookup
-                key = (name_var, dob, eye)
-                lookup[key] = data_entry
-        
-        return lookup
+        records, variations = load_roster(CSV_FILE)
+        return match_lookup(records, variations)
     except Exception as e:
         print(f"Error loading CSV: {e}")
         return None
 
 
-def match_xml_to_csv():
+def match_xml_to_csv(full=False):
     """
     Match XML files with CSV data and extract lens size and vault information.
+
+    Patient info parsed from each XML is cached in the stage manifest, so
+    only new or changed XMLs are re-parsed; pass full=True to ignore it.
+
+    Returns the matched DataFrame (also saved to OUTPUT_FILE), or None.
     """
     # Load CSV data
     print("Loading CSV data...")
@@ -314,13 +243,11 @@ def match_xml_to_csv():
         return
     
     print(f"Loaded {len(csv_lookup)} entries from CSV.\n")
+    linkage = LinkageIndex(csv_lookup)
     
     # Process all XML files
-    if not os.path.exists(XML_OUTPUT_DIR):
-        print(f"Error: {XML_OUTPUT_DIR} directory not found.")
-        return
-    
-    xml_files = [f for f in os.listdir(XML_OUTPUT_DIR) if f.lower().endswith('.xml')]
+    # XML files on disk plus exams only in the exam store
+    xml_files = list_xml_names(XML_OUTPUT_DIR)
     
     if not xml_files:
         print(f"No XML files found in {XML_OUTPUT_DIR} directory.")
@@ -328,14 +255,20 @@ def match_xml_to_csv():
     
     print(f"Processing {len(xml_files)} XML file(s)...\n")
     
+    info_manifest = StageManifest('match_xml_csv', PATIENT_INFO_VERSION, full=full)
     matched_results = []
     unmatched_results = []
     
     for xml_file in sorted(xml_files):
         xml_path = os.path.join(XML_OUTPUT_DIR, xml_file)
         
-        # Extract patient info from XML
-        xml_info = extract_patient_info_from_xml(xml_path)
+        # Extract patient info from XML (reuse the cached result if unchanged)
+        xml_sha256 = stored_sha256(xml_path)
+        xml_info = info_manifest.lookup(xml_path, xml_sha256)
+        if xml_info is None:
+            xml_info = extract_patient_info_from_xml(xml_path)
+            if xml_info is not None:
+                info_manifest.record(xml_path, xml_info, sha256=xml_sha256)
         if xml_info is None:
             continue
         
@@ -361,140 +294,24 @@ def match_xml_to_csv():
                 matched = True
                 break
         
-        # If no exact match, try matching by name+DOB (ignoring eye)
-        if not matched:
-            for name_var in name_variations:
-                for csv_key, csv_data_candidate in csv_lookup.items():
-                    csv_name, csv_dob, csv_eye = csv_key
-                    if name_var == csv_name and dob == csv_dob:
-                        csv_data = csv_data_candidate
-                        matched_key = csv_key
-                        matched = True
-                        break
-                if matched:
-                    break
-        
-        # If still no match, try fuzzy matching by name only (for cases with DOB errors)
-        # Only do this if we haven't found a match yet
+        # Fallback strategies, in order of confidence
         if not matched:
-            for name_var in name_variations:
-                for csv_key, csv_data_candidate in csv_lookup.items():
-                    csv_name, csv_dob, csv_eye = csv_key
-                    # Match by name only, if name is very similar
-                    if name_var == csv_name:
-                        csv_data = csv_data_candidate
-                        matched_key = csv_key
-                        matched = True
-                        # Note: DOB mismatch - this will be flagged in the output
-                        break
-                if matched:
-                    break
-        
-        # If still no match, try robust fuzzy matching using DOB as a verifier
-        if not matched and dob:
-            best_ratio = 0
-            best_candidate = None
-            
-            # Look for candidates where DOB matches exactly
-            for csv_key, csv_data_candidate in csv_lookup.items():
-                csv_name, csv_dob, csv_eye = csv_key
-                if dob == csv_dob:
-                    # Check similarity between xml name and csv name
-                    # We check all variations
-                    for name_var in name_variations:
-                        ratio = difflib.SequenceMatcher(None, name_var.upper(), csv_name.upper()).ratio()
-                        if ratio > best_ratio:
-                            best_ratio = ratio
-                            best_candidate = (csv_key, csv_data_candidate)
-            
-            # If we found a very good match with same DOB, accept it
-            # 0.8 is a high threshold for names with same DOB
-            if best_ratio > 0.8:
-                matched_key, csv_data = best_candidate
+            matched_key = (
+                # Name + DOB, ignoring eye
+                linkage.match_name_dob(name_variations, dob)
+                # Name only (for cases with DOB errors; flagged in the output)
+                or linkage.match_name(name_variations)
+                # Fuzzy name with an exactly matching DOB (ratio > 0.8)
+                or linkage.match_fuzzy_same_dob(name_variations, dob, threshold=0.8)
+                # Very similar name (ratio > 0.9) with DOB within ±7 days,
+                # e.g. typos like 1993-07-06 vs 1993-07-09
+                or linkage.match_fuzzy_near_dob(name_variations, dob, max_days=7, threshold=0.9)
+                # Compound surnames, e.g. "Calvetti Kirstin" vs "Kirstin Calvetti-Reyes"
+                or linkage.match_compound_surname(name_variations)
+            )
+            if matched_key:
+                csv_data = csv_lookup[matched_key]
                 matched = True
-                # Note: This is a fuzzy match with verified DOB
-        
-        # If still no match, try fuzzy DOB matching (±7 days) for high-confidence name matches
-        # This handles typos in DOB entry (e.g., 1993-07-06 vs 1993-07-09)
-        if not matched and dob:
-            best_ratio = 0
-            best_candidate = None
-            best_dob_diff = None
-            
-            try:
-                xml_dob_date = datetime.strptime(dob, '%Y-%m-%d')
-            except:
-                xml_dob_date = None
-            
-            if xml_dob_date:
-                for csv_key, csv_data_candidate in csv_lookup.items():
-                    csv_name, csv_dob, csv_eye = csv_key
-                    
-                    # Try to parse CSV DOB
-                    try:
-                        csv_dob_date = datetime.strptime(csv_dob, '%Y-%m-%d')
-                    except:
-                        continue
-                    
-                    # Check if DOB is within 7 days
-                    dob_diff = abs((xml_dob_date - csv_dob_date).days)
-                    if dob_diff <= 7 and dob_diff > 0:  # Only for near-matches, not exact
-                        # Check name similarity - require very high match (>0.9) for DOB tolerance
-                        for name_var in name_variations:
-                            ratio = difflib.SequenceMatcher(None, name_var.upper(), csv_name.upper()).ratio()
-                            if ratio > best_ratio and ratio > 0.9:
-                                best_ratio = ratio
-                                best_candidate = (csv_key, csv_data_candidate)
-                                best_dob_diff = dob_diff
-                
-                # Accept if we found a very high name match with DOB within tolerance
-                if best_ratio > 0.9 and best_candidate:
-                    matched_key, csv_data = best_candidate
-                    matched = True
-                    # Note: This is a fuzzy DOB match (will be flagged in output)
-        
-        # If still no match, try partial surname matching (for compound surnames)
-        # e.g., "Calvetti Kirstin" matches "Kirstin Calvetti-Reyes"
-        if not matched:
-            for name_var in name_variations:
-                name_parts = name_var.split()
-                if len(name_parts) >= 2:
-                    # Try both orders (surname first and first name first)
-                    for order_reversed in [False, True]:
-                        if order_reversed:
-                            first_name = name_parts[-1]
-                            surname = ' '.join(name_parts[:-1])
-                        else:
-                            first_name = name_parts[0]
-                            surname = ' '.join(name_parts[1:])
-                        
-                        for csv_key, csv_data_candidate in csv_lookup.items():
-                            csv_name, csv_dob, csv_eye = csv_key
-                            csv_parts = csv_name.split()
-                            if len(csv_parts) >= 2:
-                                # Try both orders for CSV name too
-                                for csv_order_reversed in [False, True]:
-                                    if csv_order_reversed:
-                                        csv_first_name = csv_parts[-1]
-                                        csv_surname = ' '.join(csv_parts[:-1])
-                                    else:
-                                        csv_first_name = csv_parts[0]
-                                        csv_surname = ' '.join(csv_parts[1:])
-                                    
-                                    # Match if first name matches and surname is contained
-                                    if (first_name == csv_first_name and 
-                                        (surname in csv_surname or csv_surname in surname or
-                                         surname.split()[0] == csv_surname.split()[0])):
-                                        csv_data = csv_data_candidate
-                                        matched_key = csv_key
-                                        matched = True
-                                        break
-                                if matched:
-                                    break
-                        if matched:
-                            break
-                if matched:
-                    break
         
         if matched and csv_data:
             # Check if eye matches
@@ -536,6 +353,10 @@ def match_xml_to_csv():
                 'Eye': eye,
             })
     
+    info_manifest.prune(xml_files)
+    info_manifest.save()
+    print(f"XML parsing: {info_manifest.summary()}")
+    
     # Create output DataFrame
     if matched_results:
         matched_df = pd.DataFrame(matched_results)
@@ -572,14 +393,17 @@ def match_xml_to_csv():
                 print(f"  {item['XML File']}: {item['Name']} ({item['DOB']}, {item['Eye']})")
             if len(unmatched_results) > 10:
                 print(f"  ... and {len(unmatched_results) - 10} more")
+        
+        return matched_df
     
     else:
         print("No matches found.")
+        return None
 
 
 def main():
     """Main function."""
-    match_xml_to_csv()
+    match_xml_to_csv(full='--full' in sys.argv)
 
 
 if __name__ == '__main__':
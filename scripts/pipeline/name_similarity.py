@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Batch fuzzy name scoring with difflib-identical results.
+
+difflib.SequenceMatcher.ratio() is the similarity the matching pipeline
+has always used (with its 0.8 / 0.9 thresholds), but calling it for every
+(name variation, candidate) pair is slow. NameScorer keeps a character
+count matrix of all candidate names and, for a batch of query names,
+computes difflib's quick_ratio() upper bound against every candidate in
+one NumPy operation. Exact ratios are only computed for pairs whose bound
+can still beat the threshold / current top-k, so scores and thresholded
+decisions are exactly what difflib alone would give.
+"""
+
+import difflib
+import heapq
+
+import numpy as np
+
+
+def name_ratio(a, b):
+    """difflib similarity of two names, case-insensitive."""
+    return difflib.SequenceMatcher(None, a.upper(), b.upper()).ratio()
+
+
+class NameScorer:
+    """Score query names against a fixed list of candidate names."""
+
+    def __init__(self, names):
+        self.names = [str(name).upper() for name in names]
+        alphabet = sorted({ch for name in self.names for ch in name})
+        self.columns = {ch: i for i, ch in enumerate(alphabet)}
+        self.counts = np.zeros((len(self.names), len(alphabet)), dtype=np.int32)
+        for row, name in enumerate(self.names):
+            for ch in name:
+                self.counts[row, self.columns[ch]] += 1
+        self.lengths = np.array([len(name) for name in self.names], dtype=np.int32)
+
+    def _query_counts(self, queries):
+        counts = np.zeros((len(queries), len(self.columns)), dtype=np.int32)
+        for i, query in enumerate(queries):
+            for ch in query:
+                col = self.columns.get(ch)
+                if col is not None:
+                    counts[i, col] += 1
+        return counts
+
+    def upper_bounds(self, queries, rows):
+        """
+        quick_ratio() bound for every (query, row) pair, shape (queries, rows).
+
+        This is 2 * |shared characters| / (len(a) + len(b)), which is never
+        below the real ratio.
+        """
+        queries = [str(q).upper() for q in queries]
+        q_counts = self._query_counts(queries)
+        shared = np.minimum(q_counts[:, None, :], self.counts[rows][None, :, :]).sum(axis=2)
+        total = np.array([len(q) for q in queries])[:, None] + self.lengths[rows][None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bounds = np.where(total > 0, 2.0 * shared / np.maximum(total, 1), 1.0)
+        return bounds
+
+    def top_k(self, queries, k=1, threshold=0.0, rows=None):
+        """
+        Best candidates for a group of query names (e.g. name variations).
+
+        A candidate's score is its best ratio against any query. Returns up
+        to k (row, score) pairs with score > threshold, best first; ties go
+        to the row that comes first in `rows`, like a sequential scan.
+        """
+        queries = list(queries)
+        rows = np.arange(len(self.names)) if rows is None else np.asarray(rows, dtype=np.intp)
+        if not queries or len(rows) == 0:
+            return []
+
+        bounds = self.upper_bounds(queries, rows)
+        row_bounds = bounds.max(axis=0)
+        # Visit the most promising candidates first so the k-th best score
+        # rises quickly and prunes the rest.
+        order = sorted(
+            (i for i in range(len(rows)) if row_bounds[i] > threshold),
+            key=lambda i: (-row_bounds[i], i),
+        )
+
+        upper_queries = [str(q).upper() for q in queries]
+        best = []  # min-heap of (score, -order_index, row)
+        for i in order:
+            floor = best[0][0] if len(best) == k else threshold
+            if row_bounds[i] < floor:
+                break
+            candidate = self.names[rows[i]]
+            score = 0.0
+            for q, query in enumerate(upper_queries):
+                if bounds[q, i] > score:
+                    ratio = difflib.SequenceMatcher(None, query, candidate).ratio()
+                    if ratio > score:
+                        score = ratio
+            if score <= threshold:
+                continue
+            entry = (score, -i, int(rows[i]))
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+        return [(row, score) for score, _, row in sorted(best, reverse=True)]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Indexed record linkage for matching XML patients to roster entries.
+
+The roster lookup is a dict keyed by (name variation, dob, eye). The
+fallback strategies in match_xml_csv / extract_features used to scan every
+key of it, per name variation, per strategy. LinkageIndex builds secondary
+indexes once (by name, name+DOB, DOB, name end-token and a sorted DOB
+array), so each strategy only looks at a small block of candidates.
+
+Every strategy visits its candidates in the original lookup order and
+applies the same comparisons as the old scans, so results (including tie
+breaks) are identical.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from name_similarity import NameScorer
+
+
+def parse_dob(dob):
+    try:
+        return datetime.strptime(dob, '%Y-%m-%d').toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def split_name(parts, reversed_order):
+    """Split name parts into (first name, surname) in either order."""
+    if reversed_order:
+        return parts[-1], ' '.join(parts[:-1])
+    return parts[0], ' '.join(parts[1:])
+
+
+class LinkageIndex:
+    """Blocked lookups over a {(name, dob, eye): data} roster lookup."""
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.keys = list(lookup)
+        self.by_name = {}
+        self.by_name_dob = {}
+        self.by_dob = {}
+        self.by_end_token = {}
+        dated = []
+
+        for pos, key in enumerate(self.keys):
+            name, dob, _eye = key
+            self.by_name.setdefault(name, []).append(pos)
+            self.by_name_dob.setdefault((name, dob), []).append(pos)
+            self.by_dob.setdefault(dob, []).append(pos)
+
+            parts = name.split()
+            if len(parts) >= 2:
+                self.by_end_token.setdefault(parts[0], []).append(pos)
+                if parts[-1] != parts[0]:
+                    self.by_end_token.setdefault(parts[-1], []).append(pos)
+
+            ordinal = parse_dob(dob)
+            if ordinal is not None:
+                dated.append((ordinal, pos))
+
+        dated.sort()
+        self.dob_ordinals = [ordinal for ordinal, _ in dated]
+        self.dob_positions = [pos for _, pos in dated]
+        self.scorer = NameScorer([key[0] for key in self.keys])
+
+    def _first(self, positions):
+        return self.keys[positions[0]] if positions else None
+
+    def match_name_dob(self, name_variations, dob):
+        """First key whose name and DOB match, ignoring eye."""
+        for name_var in name_variations:
+            key = self._first(self.by_name_dob.get((name_var, dob)))
+            if key:
+                return key
+        return None
+
+    def match_name(self, name_variations):
+        """First key whose name matches, ignoring DOB and eye."""
+        for name_var in name_variations:
+            key = self._first(self.by_name.get(name_var))
+            if key:
+                return key
+        return None
+
+    def _best_fuzzy(self, positions, name_variations, threshold):
+        """Key with the highest name ratio above threshold (first one on ties)."""
+        best = self.scorer.top_k(name_variations, k=1, threshold=threshold, rows=positions)
+        return self.keys[best[0][0]] if best else None
+
+    def match_fuzzy_same_dob(self, name_variations, dob, threshold=0.8):
+        """Most similar name among keys with exactly this DOB (ratio > threshold)."""
+        if not dob:
+            return None
+        return self._best_fuzzy(self.by_dob.get(dob, ()), name_variations, threshold)
+
+    def match_fuzzy_near_dob(self, name_variations, dob, max_days=7, threshold=0.9):
+        """Most similar name among keys whose DOB is 1..max_days away (ratio > threshold)."""
+        ordinal = parse_dob(dob) if dob else None
+        if ordinal is None:
+            return None
+        lo = bisect_left(self.dob_ordinals, ordinal - max_days)
+        hi = bisect_right(self.dob_ordinals, ordinal + max_days)
+        positions = sorted(
+            pos for pos, other in zip(self.dob_positions[lo:hi], self.dob_ordinals[lo:hi])
+            if other != ordinal
+        )
+        return self._best_fuzzy(positions, name_variations, threshold)
+
+    def match_compound_surname(self, name_variations):
+        """
+        First key with the same first name and an overlapping surname.
+
+        e.g. "Calvetti Kirstin" matches "Kirstin Calvetti-Reyes". Both names
+        are tried in either order; only keys whose first or last token is
+        the first name can match, so only those are compared.
+        """
+        for name_var in name_variations:
+            name_parts = name_var.split()
+            if len(name_parts) < 2:
+                continue
+            for order_reversed in (False, True):
+                first_name, surname = split_name(name_parts, order_reversed)
+                for pos in self.by_end_token.get(first_name, ()):
+                    key = self.keys[pos]
+                    csv_parts = key[0].split()
+                    for csv_order_reversed in (False, True):
+                        csv_first_name, csv_surname = split_name(csv_parts, csv_order_reversed)
+                        if (first_name == csv_first_name and
+                            (surname in csv_surname or csv_surname in surname or
+                             surname.split()[0] == csv_surname.split()[0])):
+                            return key
+        return None
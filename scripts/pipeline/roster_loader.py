@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Shared loader for the VAULT 3.0 CSV roster.
+
+match_xml_csv and extract_features both need the roster as a lookup keyed
+by (name variation, dob, eye). This module reads the CSV once, resolves
+exchanges and SEQ with column operations, normalizes each distinct name
+and DOB once, and builds the name-variation index. The result is cached
+in data/processed/cache/roster.pkl keyed on the CSV's SHA-256, so later
+stages and reruns skip all of it until the CSV changes. Within one process
+(run_pipeline.py runs matching and extraction side by side) the roster is
+loaded once and shared.
+"""
+
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from excel_to_csv import read_converted_csv
+from manifest import file_sha256
+from match_xml_csv import normalize_name, normalize_dob, create_name_variations
+
+
+CSV_FILE = "data/excel/VAULT 3.0.csv"
+CACHE_FILE = "data/processed/cache/roster.pkl"
+
+# Bump when the roster records or variation index change shape/meaning
+ROSTER_CACHE_VERSION = 1
+
+# (csv path, csv sha256) -> (records, variations) already loaded in this process
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def _column(df, name):
+    """Column as a Series, or '' for every row if the CSV lacks it (like row.get(name, ''))."""
+    if name in df.columns:
+        return df[name]
+    return pd.Series([''] * len(df), index=df.index, dtype=object)
+
+
+def _to_float(series):
+    """Numeric values as floats, NaN where a float() conversion would fail."""
+    return pd.to_numeric(series, errors='coerce').astype(float)
+
+
+def _cell(value):
+    """NaN-like cells become None; everything else is kept as a plain Python value."""
+    if pd.isna(value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def build_roster(csv_path=CSV_FILE, csv_hash=None):
+    """
+    Read the roster CSV and return (records, variations).
+
+    `records` has one dict per CSV row; `variations[i]` is the tuple of name
+    variations for records[i], in the order they are added to lookups. The
+    CSV comes from excel_to_csv's typed cache when it is current.
+    """
+    df = read_converted_csv(csv_path, csv_hash)
+
+    # Normalize each distinct value once
+    raw_names = _column(df, 'NAME')
+    names = raw_names.map({v: normalize_name(v) for v in raw_names.unique()})
+    raw_dobs = _column(df, 'DOB')
+    dobs = raw_dobs.map({v: normalize_dob(v) for v in raw_dobs.unique()})
+    eyes = _column(df, 'Eye').map(str).str.strip().str.upper()
+
+    # Exchanged lens size / vault / power replace the originals when an exchange happened
+    exchange = _column(df, 'Exchange?').map(str).str.strip().str.upper().eq('YES')
+    lens_size = _column(df, 'Exchanged Size').where(exchange, _column(df, 'ICL Size'))
+    vault = _column(df, 'Exchanged Vault').where(exchange, _column(df, 'Vault'))
+    icl_power = _to_float(_column(df, 'Exchanged Power').where(exchange, _column(df, 'ICL Power')))
+
+    # SEQ = Sphere + Cyl/2, or Sphere alone when Cyl is missing
+    sphere_raw = _column(df, 'Sphere')
+    cyl_raw = _column(df, 'Cyl')
+    sphere = _to_float(sphere_raw)
+    cyl = _to_float(cyl_raw)
+    seq = pd.Series(np.nan, index=df.index)
+    both = sphere_raw.notna() & cyl_raw.notna()
+    sphere_only = sphere_raw.notna() & cyl_raw.isna()
+    seq[both] = sphere[both] + cyl[both] / 2.0
+    seq[sphere_only] = sphere[sphere_only]
+
+    columns = {
+        'name': names,
+        'dob': dobs,
+        'eye': eyes,
+        'exchange': exchange,
+        'lens_size': lens_size,
+        'vault': vault,
+        'seq': seq,
+        'icl_power': icl_power,
+        'original_lens_size': _column(df, 'ICL Size'),
+        'original_vault': _column(df, 'Vault'),
+        'exchanged_lens_size': _column(df, 'Exchanged Size'),
+        'exchanged_vault': _column(df, 'Exchanged Vault'),
+        'dos': _column(df, 'DOS'),
+        'target': _column(df, 'Target'),
+        'icl_power_raw': _column(df, 'ICL Power'),
+    }
+    # Keep raw cells for the pass-through columns (written back out as-is)
+    raw_fields = {'original_lens_size', 'original_vault', 'exchanged_lens_size',
+                  'exchanged_vault', 'dos', 'target', 'icl_power_raw'}
+    records = []
+    for values in zip(*columns.values()):
+        record = {}
+        for field, value in zip(columns, values):
+            if field in raw_fields:
+                record[field] = value.item() if isinstance(value, np.generic) else value
+            else:
+                record[field] = _cell(value)
+        record['exchange'] = bool(record['exchange'])
+        records.append(record)
+
+    variation_cache = {}
+    variations = []
+    for record in records:
+        name = record['name']
+        if name not in variation_cache:
+            variation_cache[name] = tuple(create_name_variations(name))
+        variations.append(variation_cache[name])
+
+    return records, variations
+
+
+def load_roster(csv_path=CSV_FILE, cache_file=CACHE_FILE, use_cache=True):
+    """
+    Cached build_roster(): reuse the pickled roster if the CSV hash matches.
+    """
+    with _load_lock:
+        csv_hash = file_sha256(csv_path)
+        memo_key = (os.path.abspath(csv_path), csv_hash)
+        if use_cache and memo_key in _loaded:
+            return _loaded[memo_key]
+        roster = _load_roster(csv_path, csv_hash, cache_file, use_cache)
+        _loaded[memo_key] = roster
+        return roster
+
+
+def _load_roster(csv_path, csv_hash, cache_file, use_cache):
+    if use_cache and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('version') == ROSTER_CACHE_VERSION and cached.get('csv_sha256') == csv_hash:
+                return cached['records'], cached['variations']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable roster cache {cache_file}: {e}")
+
+    records, variations = build_roster(csv_path, csv_hash)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({
+                'version': ROSTER_CACHE_VERSION,
+                'csv_sha256': csv_hash,
+                'records': records,
+                'variations': variations,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Warning: Could not write roster cache {cache_file}: {e}")
+    return records, variations
+
+
+def _build_lookup(records, variations, make_entry):
+    lookup = {}
+    for record, name_variations in zip(records, variations):
+        entry = make_entry(record)
+        for name_var in name_variations:
+            lookup[(name_var, record['dob'], record['eye'])] = entry
+    return lookup
+
+
+def match_lookup(records, variations):
+    """Lookup used by match_xml_csv: (name, dob, eye) -> crosswalk fields."""
+    def entry(r):
+        return {
+            'name': r['name'],
+            'dob': r['dob'],
+            'eye': r['eye'],
+            'lens_size': r['lens_size'] if r['lens_size'] is not None else '',
+            'vault': r['vault'] if r['vault'] is not None else '',
+            'exchange': r['exchange'],
+            'original_lens_size': r['original_lens_size'],
+            'original_vault': r['original_vault'],
+            'exchanged_lens_size': r['exchanged_lens_size'],
+            'exchanged_vault': r['exchanged_vault'],
+            'dos': r['dos'],
+            'target': r['target'],
+            'icl_power': r['icl_power_raw'],
+        }
+    return _build_lookup(records, variations, entry)
+
+
+def feature_lookup(records, variations):
+    """Lookup used by extract_features: (name, dob, eye) -> outcomes, SEQ and ICL power."""
+    def entry(r):
+        return {
+            'name': r['name'],
+            'dob': r['dob'],
+            'eye': r['eye'],
+            'lens_size': r['lens_size'],
+            'vault': r['vault'],
+            'exchange': r['exchange'],
+            'seq': r['seq'],
+            'icl_power': r['icl_power'],
+        }
+    return _build_lookup(records, variations, entry)
@@ -150,6 +150,7 @@ print()
 print("Key Files Updated:")
 print("  ✓ data/processed/matched_patients.csv  - Primary matches")
 print("  ✓ data/processed/training_data.csv     - Clean ML dataset")
+print("  ✓ data/processed/training_data.parquet - Typed dataset for trainers")
 print("  ✓ data/processed/unmatched_xmls.csv    - For manual naming fix")
 print("  ✓ data/processed/failed_extractions.csv - Corrupt/format issues")
 print("  ✓ data/processed/missing_outcomes.csv   - Pending surgery data")
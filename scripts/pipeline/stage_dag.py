@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+In-process stage runner for the data pipeline.
+
+A pipeline is a list of Stage objects. Each stage names the stages it
+depends on and receives their results, so stages hand DataFrames and
+caches to each other in memory instead of via files and fresh Python
+processes. Stages whose dependencies are done run concurrently on a
+thread pool; stage output is streamed live with a [stage] prefix.
+
+run_stages() returns a report (status, wall time and row count per stage)
+that can be printed with print_report() and saved with save_report().
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+
+class Stage:
+    """
+    One pipeline step.
+
+    func(results) receives a dict of dependency results keyed by stage name
+    and returns this stage's result. rows(result) gives the row count for
+    the report (default: len(result) when it has one). A stage fails if it
+    raises or calls sys.exit() with a non-zero code; its dependents are
+    then skipped.
+    """
+
+    def __init__(self, name, func, deps=(), rows=None, description=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.rows = rows
+        self.description = description or name
+
+
+class _StageOutput:
+    """sys.stdout replacement that prefixes each line with the running stage's name."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        prefix = getattr(self.local, 'prefix', None)
+        if prefix is None:
+            return self.stream.write(text)
+        pending = getattr(self.local, 'pending', '') + text
+        *lines, self.local.pending = pending.split('\n')
+        if lines:
+            with self.lock:
+                self.stream.write(''.join(f"{prefix}{line}\n" for line in lines))
+        return len(text)
+
+    def flush(self):
+        pending = getattr(self.local, 'pending', '')
+        if pending:
+            with self.lock:
+                self.stream.write(f"{self.local.prefix}{pending}\n")
+            self.local.pending = ''
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _row_count(stage, result):
+    if stage.rows is not None:
+        try:
+            return stage.rows(result)
+        except Exception:
+            return None
+    if result is not None and hasattr(result, '__len__'):
+        return len(result)
+    return None
+
+
+def _run_stage(stage, inputs, output):
+    """Run one stage in a worker thread; returns (status, result, seconds, error)."""
+    output.local.prefix = f"[{stage.name}] "
+    output.local.pending = ''
+    start = time.perf_counter()
+    try:
+        result = stage.func(inputs)
+        status, error = 'ok', None
+    except SystemExit as e:
+        result = None
+        status = 'ok' if e.code in (None, 0) else 'failed'
+        error = None if status == 'ok' else f"exit code {e.code}"
+    except Exception as e:
+        result = None
+        status, error = 'failed', f"{type(e).__name__}: {e}"
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        output.flush()
+        output.local.prefix = None
+    return status, result, time.perf_counter() - start, error
+
+
+def run_stages(stages, max_workers=None):
+    """
+    Run stages in dependency order, independent ones concurrently.
+
+    Returns (results, report): results maps stage name -> result for the
+    stages that succeeded; report is a JSON-serialisable run summary.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {missing}")
+
+    results = {}
+    entries = {stage.name: {'stage': stage.name, 'description': stage.description,
+                            'deps': list(stage.deps), 'status': 'pending',
+                            'seconds': None, 'rows': None, 'error': None}
+               for stage in stages}
+    pending = list(stages)
+    running = {}
+    started = datetime.now()
+    start = time.perf_counter()
+
+    output = _StageOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as pool:
+            while pending or running:
+                # Skip stages whose dependencies failed; start the ready ones
+                for stage in list(pending):
+                    states = [entries[dep]['status'] for dep in stage.deps]
+                    if any(state in ('failed', 'skipped') for state in states):
+                        entries[stage.name]['status'] = 'skipped'
+                        pending.remove(stage)
+                    elif all(state == 'ok' for state in states):
+                        inputs = {dep: results[dep] for dep in stage.deps}
+                        entries[stage.name]['status'] = 'running'
+                        running[pool.submit(_run_stage, stage, inputs, output)] = stage
+                        pending.remove(stage)
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    status, result, seconds, error = future.result()
+                    entry = entries[stage.name]
+                    entry.update(status=status, seconds=round(seconds, 3), error=error)
+                    if status == 'ok':
+                        results[stage.name] = result
+                        entry['rows'] = _row_count(stage, result)
+    finally:
+        sys.stdout = output.stream
+
+    report = {
+        'started': started.isoformat(timespec='seconds'),
+        'seconds': round(time.perf_counter() - start, 3),
+        'ok': all(entry['status'] == 'ok' for entry in entries.values()),
+        'stages': [entries[stage.name] for stage in stages],
+    }
+    return results, report
+
+
+def print_report(report):
+    """Print per-stage status, wall time and row counts."""
+    icons = {'ok': '✅', 'failed': '❌', 'skipped': '⏭️ ', 'pending': '…'}
+    print(f"\n{'='*70}")
+    print("STAGE REPORT")
+    print(f"{'='*70}")
+    print(f"  {'Stage':<28} {'Status':<10} {'Time':>9} {'Rows':>8}")
+    for entry in report['stages']:
+        seconds = f"{entry['seconds']:.2f}s" if entry['seconds'] is not None else '-'
+        rows = entry['rows'] if entry['rows'] is not None else '-'
+        status = f"{icons.get(entry['status'], '')} {entry['status']}"
+        print(f"  {entry['description']:<28} {status:<10} {seconds:>9} {rows:>8}")
+        if entry['error']:
+            print(f"      {entry['error']}")
+    print(f"  {'Total (wall clock)':<28} {'':<10} {report['seconds']:>8.2f}s")
+
+
+def save_report(report, path):
+    """Write the run report as JSON (atomically)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
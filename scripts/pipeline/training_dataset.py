@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Typed training dataset shared by extract_features and the trainers.
+
+extract_features writes training_data.csv for people and a typed Parquet
+copy (training_data.parquet) for code. The Parquet file carries a schema
+version and has the gestalt features the trainers use precomputed, so a
+trainer reads just the columns it needs instead of re-parsing the CSV and
+re-deriving the same engineered columns every run.
+
+If pyarrow is missing, or the Parquet file is older than the CSV / from an
+older schema, load_training_data() falls back to the CSV and engineers the
+features in-process, so callers always get the same columns and values.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+DATASET_FILE = "data/processed/training_data.parquet"
+CSV_FILE = "data/processed/training_data.csv"
+
+# Bump when columns, dtypes or feature definitions change
+SCHEMA_VERSION = 1
+SCHEMA_VERSION_KEY = b"vault.schema_version"
+
+ID_COLUMNS = ['XML_File', 'Name', 'DOB', 'Eye', 'Exam_Date']
+MEASUREMENT_COLUMNS = [
+    'Age', 'WTW', 'ACD_internal', 'ACV', 'ACA_global', 'Pupil_diameter',
+    'AC_shape_ratio', 'TCRP_Km', 'TCRP_Astigmatism', 'SEQ', 'ICL_Power',
+    'SimK_steep', 'CCT', 'BAD_D',
+]
+TARGET_COLUMNS = ['Lens_Size', 'Vault']
+OUTPUT_COLUMNS = ID_COLUMNS + MEASUREMENT_COLUMNS + TARGET_COLUMNS + ['Exchange']
+
+# The 15 clinical gestalts used by the production models
+GESTALT_FEATURES = [
+    'WTW_Bucket', 'ACD_Bucket', 'Shape_Bucket',
+    'Space_Volume', 'Aspect_Ratio', 'Power_Density',
+    'High_Power_Deep_ACD', 'Chamber_Tightness', 'Curvature_Depth_Ratio',
+    'Stability_Risk', 'Age_Space_Ratio', 'Nomogram_Size',
+    'Volume_Constraint', 'Steep_Eye_Adjustment', 'Safety_Downsize_Flag',
+]
+# Extra features used by the tight-chamber models
+TIGHT_CHAMBER_FEATURES = ['Tight_Chamber_Score', 'Volume_Per_Depth', 'Nomogram_Downsize_Pressure']
+ENGINEERED_FEATURES = GESTALT_FEATURES + TIGHT_CHAMBER_FEATURES
+
+# Bucket / flag features: nullable ints in the dataset, plain ints once complete
+INT_FEATURES = [
+    'WTW_Bucket', 'ACD_Bucket', 'Shape_Bucket', 'High_Power_Deep_ACD',
+    'Stability_Risk', 'Volume_Constraint', 'Steep_Eye_Adjustment', 'Safety_Downsize_Flag',
+]
+
+SCHEMA = {
+    **{col: 'string' for col in ID_COLUMNS},
+    **{col: 'float64' for col in MEASUREMENT_COLUMNS + TARGET_COLUMNS},
+    'Exchange': 'boolean',
+    **{col: ('Int8' if col in INT_FEATURES else 'float64') for col in ENGINEERED_FEATURES},
+}
+
+
+def nomogram_size(wtw, acd):
+    """Sizing nomogram (WTW / ACD table) for arrays of eyes; 0.0 outside the table."""
+    wtw = np.asarray(wtw, dtype=float)
+    deep = np.asarray(acd, dtype=float) > 3.5
+    conditions = [
+        (wtw >= 10.5) & (wtw < 10.7),
+        (wtw >= 10.7) & (wtw < 11.1),
+        (wtw >= 11.1) & (wtw < 11.2),
+        (wtw >= 11.2) & (wtw < 11.5),
+        (wtw >= 11.5) & (wtw < 11.7),
+        (wtw >= 11.7) & (wtw < 12.2),
+        (wtw >= 12.2) & (wtw < 12.3),
+        (wtw >= 12.3) & (wtw < 13.0),
+    ]
+    choices = [
+        np.where(deep, 12.1, 0.0), 12.1,
+        np.where(deep, 12.6, 12.1), 12.6,
+        np.where(deep, 13.2, 12.6), 13.2,
+        np.where(deep, 13.7, 13.2), 13.7,
+    ]
+    return np.select(conditions, choices, default=0.0)
+
+
+def _bucket(values, bins):
+    return pd.cut(values, bins=bins, labels=False).astype('Int8')
+
+
+def _flag(condition, *inputs):
+    """0/1 flag, missing where any input is missing."""
+    missing = pd.concat(inputs, axis=1).isna().any(axis=1)
+    return condition.astype('Int8').mask(missing)
+
+
+def add_gestalt_features(df):
+    """
+    Return a copy of df with the gestalt and tight-chamber features added.
+
+    Same definitions as the trainers always used; rows with missing inputs
+    get missing features instead of failing.
+    """
+    df = df.copy()
+    wtw, acd, acv = df['WTW'], df['ACD_internal'], df['ACV']
+    power, simk = df['ICL_Power'], df['SimK_steep']
+
+    df['WTW_Bucket'] = _bucket(wtw, [0, 11.6, 11.9, 12.4, 20])
+    df['ACD_Bucket'] = _bucket(acd, [0, 3.1, 3.3, 10])
+    df['Shape_Bucket'] = _bucket(df['AC_shape_ratio'], [0, 58, 62.5, 68, 300])
+
+    df['Space_Volume'] = wtw * acd
+    df['Aspect_Ratio'] = wtw / acd
+    df['Power_Density'] = abs(power) / acv
+    df['High_Power_Deep_ACD'] = _flag((abs(power) > 14) & (acd > 3.3), power, acd)
+    df['Chamber_Tightness'] = acv / wtw
+    df['Curvature_Depth_Ratio'] = simk / acd
+    df['Stability_Risk'] = _flag((df['TCRP_Astigmatism'] > 1.5) & (wtw > 12.0),
+                                 df['TCRP_Astigmatism'], wtw)
+    df['Age_Space_Ratio'] = df['Age'] / acd
+
+    nomogram = pd.Series(nomogram_size(wtw, acd), index=df.index)
+    df['Nomogram_Size'] = nomogram
+    df['Volume_Constraint'] = _flag((nomogram > 12.1) & (acv < 170), acv)
+    df['Steep_Eye_Adjustment'] = _flag((nomogram > 12.1) & (simk > 46.0), simk)
+    df['Safety_Downsize_Flag'] = _flag((nomogram == 13.2) & (abs(power) < 10.0), power)
+
+    # Tight chamber: distance below the 12.1 medians on ACD / ACV / WTW
+    acd_z = ((3.07 - acd) / 0.30).clip(lower=0)
+    acv_z = ((174.7 - acv) / 30.0).clip(lower=0)
+    wtw_z = ((11.6 - wtw) / 0.35).clip(lower=0)
+    df['Tight_Chamber_Score'] = (acd_z + acv_z + wtw_z) / 3.0
+    df['Volume_Per_Depth'] = acv / (acd ** 2)
+    chamber_adequacy = ((acv / 170.0) * (acd / 3.1)).clip(lower=0.5)
+    df['Nomogram_Downsize_Pressure'] = (nomogram - 12.1) / chamber_adequacy
+    return df
+
+
+def to_schema(df):
+    """Cast the extract_features output columns to their dataset dtypes."""
+    typed = pd.DataFrame(index=df.index)
+    for col in OUTPUT_COLUMNS:
+        values = df[col]
+        if SCHEMA[col] == 'float64':
+            values = pd.to_numeric(values, errors='coerce')
+        typed[col] = values.astype(SCHEMA[col])
+    return typed
+
+
+def write_training_dataset(df, path=DATASET_FILE):
+    """
+    Write the typed Parquet dataset (base columns + engineered features).
+
+    Returns the path written, or None when pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("⚠️  pyarrow not installed - skipping typed dataset (trainers will read the CSV)")
+        return None
+
+    dataset = add_gestalt_features(to_schema(df)).reset_index(drop=True)
+    table = pa.Table.from_pandas(dataset, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SCHEMA_VERSION_KEY] = str(SCHEMA_VERSION).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_parquet(path, csv_path, columns):
+    """Requested columns from the Parquet dataset, or None if it can't be used."""
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(path):
+        print(f"⚠️  {path} is older than {csv_path} - reading the CSV")
+        return None
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+
+    metadata = pq.read_schema(path).metadata or {}
+    version = metadata.get(SCHEMA_VERSION_KEY, b'').decode()
+    if version != str(SCHEMA_VERSION):
+        print(f"⚠️  {path} has schema version {version or '?'} (expected {SCHEMA_VERSION}) - reading the CSV")
+        return None
+    return pq.read_table(path, columns=columns).to_pandas()
+
+
+def load_training_data(columns=None, path=DATASET_FILE, csv_path=CSV_FILE):
+    """
+    Load the training dataset, reading only `columns` (default: all).
+
+    Engineered features are always available, whether the data comes from
+    the Parquet dataset or the CSV fallback.
+    """
+    columns = list(columns) if columns is not None else None
+    df = _read_parquet(str(path), str(csv_path), columns)
+    if df is None:
+        df = add_gestalt_features(to_schema(pd.read_csv(csv_path, float_precision='round_trip')))
+        if columns is not None:
+            df = df[columns]
+    return df.copy()
+
+
+def complete_cases(df, required):
+    """
+    Rows with every `required` column present.
+
+    Bucket / flag features come back as plain ints once they have no gaps,
+    matching what the trainers used to engineer themselves.
+    """
+    df = df[df[list(required)].notna().all(axis=1)].copy()
+    for col in INT_FEATURES:
+        if col in df.columns and not df[col].isna().any():
+            df[col] = df[col].astype(int)
+    return df
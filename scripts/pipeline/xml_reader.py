@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for Pentacam exam XMLs (the output of ini_to_xml.py).
+
+The XMLs are ~1,700 <entry> elements each, and most callers only need a
+handful of keys near the top. iter_xml_entries() feeds a file through the
+C XML parser in chunks, never builds a tree, and lets callers stop as soon
+as they have what they need.
+
+When several stages run in one process (run_pipeline.py), shared_entry_cache()
+lets them parse each XML once and share the entries they asked for.
+
+Exams in the exam store (exam_store.py) are read from there instead,
+unless their XML file was modified after the store was written. Exams
+the store keeps detached are read from it although their XML is gone.
+"""
+
+import os
+import threading
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+
+CHUNK_SIZE = 8192
+
+PATIENT_INFO_KEYS = ('Name', 'Surname', 'DOB', 'Eye')
+
+
+class _EntryCollector:
+    """XMLParser target that records (section, key, text) for wanted entries."""
+
+    __slots__ = ('keys', 'section', 'key', 'text', 'entries')
+
+    def __init__(self, keys=None):
+        self.keys = keys
+        self.section = ''
+        self.key = None
+        self.text = []
+        self.entries = []
+
+    def start(self, tag, attrib):
+        if tag == 'entry':
+            key = attrib.get('key', '')
+            if self.keys is None or key in self.keys:
+                self.key = key
+                self.text = []
+        elif tag == 'section':
+            self.section = attrib.get('name', '')
+
+    def data(self, data):
+        if self.key is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        if tag == 'entry' and self.key is not None:
+            self.entries.append((self.section, self.key, ''.join(self.text) or None))
+            self.key = None
+
+    def close(self):
+        return None
+
+
+class EntryCache:
+    """Entries for a fixed key set, parsed once per XML (path, size, mtime)."""
+
+    def __init__(self, keys):
+        self.keys = frozenset(keys)
+        self.entries = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, xml_file_path):
+        stat = os.stat(xml_file_path)
+        cache_key = (os.path.abspath(xml_file_path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            file_lock = self.locks.setdefault(cache_key, threading.Lock())
+        # Per-file lock: two stages asking for the same XML parse it once
+        with file_lock:
+            cached = self.entries.get(cache_key)
+            if cached is None:
+                self.misses += 1
+                entries, error = [], None
+                try:
+                    for entry in _parse_entries(xml_file_path, self.keys):
+                        entries.append(entry)
+                except Exception as e:
+                    # Replayed after the entries read so far, like a direct parse
+                    error = e
+                cached = self.entries[cache_key] = (entries, error)
+            else:
+                self.hits += 1
+        return cached
+
+    def iter_entries(self, xml_file_path, keys):
+        entries, error = self.get(xml_file_path)
+        for entry in entries:
+            if entry[1] in keys:
+                yield entry
+        if error is not None:
+            raise error
+
+
+_shared_cache = None
+
+
+@contextmanager
+def shared_entry_cache(keys):
+    """
+    Serve iter_xml_entries() calls for a subset of `keys` from one cache.
+
+    Used by run_pipeline.py so matching and feature extraction share a
+    single parse of every XML.
+    """
+    global _shared_cache
+    previous = _shared_cache
+    _shared_cache = EntryCache(keys)
+    try:
+        yield _shared_cache
+    finally:
+        _shared_cache = previous
+
+
+def iter_xml_entries(xml_file_path, keys=None):
+    """
+    Yield (section_name, key, text) for each entry, in document order.
+
+    `text` is the raw entry text (None for empty entries). Pass `keys` to
+    only see entries with those keys; filtering happens inside the parser
+    callbacks, which is much cheaper than skipping them in Python. Breaking
+    out of the loop stops parsing and closes the file.
+    """
+    entries = _store_entries(xml_file_path, keys)
+    if entries is not None:
+        return iter(entries)
+    cache = _shared_cache
+    if cache is not None and keys is not None and cache.keys.issuperset(keys):
+        return cache.iter_entries(xml_file_path, frozenset(keys))
+    return _parse_entries(xml_file_path, keys)
+
+
+def _store_entries(xml_file_path, keys):
+    """The exam's entries from the exam store, or None if the XML should be parsed."""
+    from exam_store import default_store, exam_name
+
+    store = default_store()
+    if not store.has_exam(xml_file_path):
+        return None
+    if os.path.exists(xml_file_path) and store.mtime is not None \
+            and os.path.getmtime(xml_file_path) > store.mtime:
+        return None             # edited since the store was written
+    return store.entries(exam_name(xml_file_path), keys)
+
+
+def _parse_entries(xml_file_path, keys=None):
+    collector = _EntryCollector(frozenset(keys) if keys is not None else None)
+    parser = ET.XMLParser(target=collector)
+    with open(xml_file_path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            yield from collector.entries
+            collector.entries.clear()
+    parser.close()
+
+
+def read_patient_info(xml_file_path):
+    """
+    Read patient name, DOB and eye from an exam XML.
+
+    Name/Surname/DOB come from the "Patient Data" section; the eye is the
+    first non-empty "Eye" entry in a "Test Data" section. Parsing stops once
+    both are known.
+
+    Returns:
+        dict with keys: name, surname, full_name, eye, dob, xml_filename
+    """
+    info = {
+        'name': '',
+        'surname': '',
+        'full_name': '',
+        'eye': '',
+        'dob': '',
+        'xml_filename': os.path.basename(xml_file_path)
+    }
+    patient_seen = False
+    patient_done = False
+
+    for section_name, key, value in iter_xml_entries(xml_file_path, PATIENT_INFO_KEYS):
+        if section_name == 'Patient Data':
+            patient_seen = True
+            value = (value or '').strip()
+            if key == 'Name':
+                info['name'] = value
+            elif key == 'Surname':
+                info['surname'] = value
+            elif key == 'DOB':
+                info['dob'] = value
+            continue
+
+        patient_done = patient_seen
+        if not info['eye'] and key == 'Eye' and 'Test Data' in section_name and value:
+            info['eye'] = value.strip()
+        if info['eye'] and patient_done:
+            break
+
+    # Build full name (surname first, then name)
+    parts = [info['surname'], info['name']]
+    info['full_name'] = ' '.join([p for p in parts if p]).strip() or 'Unknown'
+
+    return info
@@ -18,10 +18,11 @@ Targets: Vault and ICL Size (using exchanged values when available)
 
 import pandas as pd
 import numpy as np
-import xml.etree.ElementTree as ET
+import sys
 from pathlib import Path
 import re
-from typing import Dict, List, Tuple, Optional
+from functools import lru_cache
+from typing import Dict, Tuple, Optional
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
@@ -33,6 +34,11 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
 
+# Shared streaming XML reader lives with the pipeline scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "pipeline"))
+from xml_reader import iter_xml_entries
+from exam_store import list_xml_names
+
 
 class NameMatcher:
     """Implements fuzzy name matching with various strategies"""
@@ -60,7 +66,9 @@ class NameMatcher:
         return re.sub(suffixes, '', name, flags=re.IGNORECASE).strip()
 
     @classmethod
-    def get_name_variations(cls, name: str) -> List[str]:
+    @lru_cache(maxsize=None)
+    def get_name_variations(cls, name: str) -> Tuple[str, ...]:
+        # Cached: merge_xml_and_csv compares every XML name with every CSV name
         name = cls.normalize_name(name)
         name = cls.remove_suffix(name)
         variations = [name]
@@ -79,7 +87,7 @@ class NameMatcher:
                     new_words[i] = cls.SPELLING_VARIATIONS[word]
                     variations.append(' '.join(new_words))
 
-        return list(set(variations))
+        return tuple(set(variations))
 
     @classmethod
     def match_names(cls, name1: str, name2: str) -> Tuple[bool, str]:
@@ -107,23 +115,45 @@ class NameMatcher:
 class XMLParser:
     """Parse Pentacam XML files and extract ONLY specified clinical features"""
 
+    TEST_DATA_KEYS = ('Cornea Dia Horizontal', 'Pupil diameter mm', 'Test Date')
+    EXAM_DATA_KEYS = ('TCRP 3mm zone pupil Km [D]', 'TCRP 3mm zone pupil Asti [D]',
+                      'ACD (Int.) [mm]', 'ACA (180°) [°]')
+    PATIENT_KEYS = ('Name', 'Surname', 'DOB')
+
     def __init__(self, xml_path: str):
         self.xml_path = Path(xml_path)
-        self.tree = ET.parse(xml_path)
-        self.root = self.tree.getroot()
+        self.sections = self._read_sections(xml_path)
+
+    @classmethod
+    def _read_sections(cls, xml_path) -> Dict[str, Dict]:
+        """
+        Stream the XML once, keeping only the entries this parser uses.
+
+        Like ElementTree's find(), only the first section with a given name counts.
+        """
+        sections = {}
+        finished = set()
+        current = None
+        keys = cls.PATIENT_KEYS + cls.TEST_DATA_KEYS + cls.EXAM_DATA_KEYS
+        for section_name, key, value in iter_xml_entries(xml_path, keys):
+            if section_name != current:
+                if current is not None:
+                    finished.add(current)
+                current = section_name
+            if section_name in finished:
+                continue
+            if (section_name == 'Patient Data'
+                    or (section_name.startswith('Test Data ') and key in cls.TEST_DATA_KEYS)
+                    or (section_name.startswith('Examination Data ') and key in cls.EXAM_DATA_KEYS)):
+                sections.setdefault(section_name, {})[key] = value
+        return sections
 
     def get_patient_info(self) -> Dict:
         """Extract patient name and DOB"""
-        patient_section = self.root.find(".//section[@name='Patient Data']")
-        if patient_section is None:
+        info = self.sections.get('Patient Data')
+        if info is None:
             return {}
 
-        info = {}
-        for entry in patient_section.findall('entry'):
-            key = entry.get('key')
-            value = entry.text
-            info[key] = value
-
         surname = info.get('Surname', '')
         name = info.get('Name', '')
         full_name = f"{name} {surname}".strip() if name and surname else ""
@@ -147,53 +177,51 @@ class XMLParser:
         eye_index = '0' if eye == 'OD' else '1'
 
         # Extract from Test Data section
-        test_section = self.root.find(f".//section[@name='Test Data {eye} {eye_index}']")
-        if test_section is not None:
-            for entry in test_section.findall('entry'):
-                key = entry.get('key')
+        test_entries = self.sections.get(f'Test Data {eye} {eye_index}')
+        if test_entries is not None:
+            for key, text in test_entries.items():
 
                 if key == 'Cornea Dia Horizontal':
                     try:
-                        features['WTW'] = float(entry.text) if entry.text else None
+                        features['WTW'] = float(text) if text else None
                     except (ValueError, TypeError):
                         features['WTW'] = None
 
                 elif key == 'Pupil diameter mm':
                     try:
-                        features['Pupil_Diameter'] = float(entry.text) if entry.text else None
+                        features['Pupil_Diameter'] = float(text) if text else None
                     except (ValueError, TypeError):
                         features['Pupil_Diameter'] = None
 
                 elif key == 'Test Date':
-                    features['exam_date'] = entry.text
+                    features['exam_date'] = text
 
         # Extract from Examination Data section
-        exam_section = self.root.find(f".//section[@name='Examination Data {eye_index}']")
-        if exam_section is not None:
-            for entry in exam_section.findall('entry'):
-                key = entry.get('key')
+        exam_entries = self.sections.get(f'Examination Data {eye_index}')
+        if exam_entries is not None:
+            for key, text in exam_entries.items():
 
                 if key == 'TCRP 3mm zone pupil Km [D]':
                     try:
-                        features['TCRP_Km'] = float(entry.text) if entry.text else None
+                        features['TCRP_Km'] = float(text) if text else None
                     except (ValueError, TypeError):
                         features['TCRP_Km'] = None
 
                 elif key == 'TCRP 3mm zone pupil Asti [D]':
                     try:
-                        features['TCRP_Asti'] = float(entry.text) if entry.text else None
+                        features['TCRP_Asti'] = float(text) if text else None
                     except (ValueError, TypeError):
                         features['TCRP_Asti'] = None
 
                 elif key == 'ACD (Int.) [mm]':
                     try:
-                        features['ACD'] = float(entry.text) if entry.text else None
+                        features['ACD'] = float(text) if text else None
                     except (ValueError, TypeError):
                         features['ACD'] = None
 
                 elif key == 'ACA (180°) [°]':
                     try:
-                        features['ACA_180'] = float(entry.text) if entry.text else None
+                        features['ACA_180'] = float(text) if text else None
                     except (ValueError, TypeError):
                         features['ACA_180'] = None
 
@@ -205,7 +233,8 @@ def parse_all_xml_files(xml_dir: str) -> pd.DataFrame:
     xml_dir = Path(xml_dir)
     all_data = []
 
-    xml_files = list(xml_dir.glob("*.xml"))
+    # XML files on disk plus exams only in the exam store
+    xml_files = [xml_dir / name for name in list_xml_names(str(xml_dir))]
     print(f"Found {len(xml_files)} XML files")
 
     for xml_file in xml_files:
@@ -292,6 +321,12 @@ def merge_xml_and_csv(xml_df: pd.DataFrame, csv_df: pd.DataFrame) -> pd.DataFram
     print("\nMatching XML patients to CSV outcomes...")
     print(f"Starting with {len(xml_df)} XML eye records")
 
+    # Walk the CSV once instead of once per XML row, bucketed by eye
+    csv_rows_by_eye = {}
+    for csv_idx, csv_row in csv_df.iterrows():
+        if isinstance(csv_row['eye'], str):
+            csv_rows_by_eye.setdefault(csv_row['eye'], []).append(csv_row)
+
     # XML-driven: for each XML eye, find its outcome in CSV
     for idx, xml_row in xml_df.iterrows():
         xml_name = xml_row['patient_name']
@@ -300,14 +335,9 @@ def merge_xml_and_csv(xml_df: pd.DataFrame, csv_df: pd.DataFrame) -> pd.DataFram
         best_match = None
         match_type = "no_match"
 
-        # Search CSV for matching patient and eye
-        for csv_idx, csv_row in csv_df.iterrows():
+        # Search CSV for matching patient and eye (eye must match)
+        for csv_row in csv_rows_by_eye.get(xml_eye, ()):
             csv_name = csv_row['patient_name']
-            csv_eye = csv_row['eye']
-
-            # Eye must match
-            if csv_eye != xml_eye:
-                continue
 
             # Try name matching
             is_match, match_type_result = matcher.match_names(xml_name, csv_name)
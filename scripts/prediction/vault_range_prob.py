@@ -9,9 +9,13 @@ It assumes residuals are approximately normal and uses their standard deviation.
 import argparse
 import math
 import pickle
+import sys
+from pathlib import Path
 
 import numpy as np
-import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "pipeline"))
+from training_dataset import load_training_data  # noqa: E402
 
 
 def normal_cdf(x: float, mu: float, sigma: float) -> float:
@@ -31,7 +35,12 @@ def main() -> None:
     parser.add_argument(
         "--training_csv",
         default="data/processed/training_data.csv",
-        help="Path to training data CSV",
+        help="Path to training data CSV (used if the typed dataset is missing or stale)",
+    )
+    parser.add_argument(
+        "--training_data",
+        default="data/processed/training_data.parquet",
+        help="Path to the typed training dataset",
     )
     parser.add_argument(
         "--vault_model",
@@ -58,8 +67,12 @@ def main() -> None:
     with open(args.feature_names, "rb") as f:
         feature_names = pickle.load(f)
 
-    # Load training data and compute residuals
-    df = pd.read_csv(args.training_csv)
+    # Load training data (only the model's features) and compute residuals
+    df = load_training_data(
+        list(dict.fromkeys(list(feature_names) + ["Vault"])),
+        path=args.training_data,
+        csv_path=args.training_csv,
+    )
     df = df[df["Vault"].notna()].copy()
     X = df[feature_names].copy().fillna(0)
     X_scaled = vault_scaler.transform(X)
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+ICL Vault Prediction - Model Archive Builder
+
+Rebuilds every models/archives/<tag> variant from one declarative spec
+list (ARCHIVES): feature set, lens / vault candidate estimators, lens
+class weighting. The training data is loaded and its features engineered
+once, every variant uses the same 5-fold splits, and all (variant, target,
+candidate, fold) fits plus the final full-data fits are scheduled in one
+process pool (cv_engine.run_tasks), using every core.
+
+Each archive gets the five .pkl files the backend loads and a generated
+"Build Metrics" section in its README (hand-written README text is kept).
+
+The per-variant scripts (train_model.py, train_tight_chamber*.py,
+train_no_acv.py, train_xgb.py) remain for detailed diagnostics; the
+XGBoost variant reuses the hyperparameters train_xgb.py tuned.
+
+Usage:
+    python scripts/training/build_archives.py [--only TAG ...] [--jobs N] [--out DIR] [--list]
+"""
+
+import argparse
+import pickle
+import sys
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
+from sklearn.metrics import accuracy_score, confusion_matrix, mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, PredefinedSplit
+from sklearn.preprocessing import StandardScaler
+from sklearn.utils.class_weight import compute_sample_weight
+import warnings
+warnings.filterwarnings('ignore')
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
+DATA_PATH = PROJECT_ROOT / "data" / "processed" / "training_data.csv"
+DATASET_PATH = PROJECT_ROOT / "data" / "processed" / "training_data.parquet"
+ARCHIVES_DIR = PROJECT_ROOT / "models" / "archives"
+
+from training_dataset import (  # noqa: E402
+    ENGINEERED_FEATURES, GESTALT_FEATURES, complete_cases, load_training_data,
+)
+from cv_engine import CVTask, run_tasks  # noqa: E402
+
+BASE_FEATURES = [
+    "Age", "WTW", "ACD_internal", "ICL_Power", "AC_shape_ratio",
+    "SimK_steep", "ACV", "TCRP_Km", "TCRP_Astigmatism",
+]
+ACV_DEPENDENT = {
+    "ACV", "AC_shape_ratio", "Shape_Bucket",
+    "Power_Density", "Chamber_Tightness", "Volume_Constraint",
+}
+FEATURES_24 = BASE_FEATURES + GESTALT_FEATURES
+FEATURES_27 = BASE_FEATURES + ENGINEERED_FEATURES
+
+CV = KFold(n_splits=5, shuffle=True, random_state=42)
+
+METRICS_START = "<!-- build_archives:metrics -->"
+METRICS_END = "<!-- /build_archives:metrics -->"
+
+MODEL_FILES = ['lens_size_model.pkl', 'lens_size_scaler.pkl', 'vault_model.pkl',
+               'vault_scaler.pkl', 'feature_names.pkl']
+
+
+class ArchiveSpec:
+    """
+    One archive variant.
+
+    lens() / vault() return {name: estimator} candidates; the best one by
+    CV accuracy / MAE is refitted on all rows. lens_weights='balanced'
+    fits the lens candidates with balanced sample weights. encode_lens
+    trains the classifier on integer labels (XGBoost) and stores the sizes
+    as model._vault_classes, which the backend maps back.
+    """
+
+    def __init__(self, tag, summary, features, lens, vault,
+                 lens_weights=None, encode_lens=False, parent="gestalt-24f-756c"):
+        self.tag = tag
+        self.summary = summary
+        self.features = list(features)
+        self.lens = lens
+        self.vault = vault
+        self.lens_weights = lens_weights
+        self.encode_lens = encode_lens
+        self.parent = parent
+
+
+# ── estimators ───────────────────────────────────────────────────────────
+def gb_lens():
+    return {'Gradient Boosting': GradientBoostingClassifier(
+        n_estimators=150, max_depth=4, learning_rate=0.05, subsample=0.8, random_state=42)}
+
+
+def gb_vault():
+    return {'Gradient Boosting': GradientBoostingRegressor(
+        n_estimators=50, max_depth=3, learning_rate=0.1, random_state=42)}
+
+
+def selected_lens():
+    """train_model.py's candidates (best by CV accuracy)."""
+    from train_model import lens_size_candidates
+    return lens_size_candidates()
+
+
+def selected_vault():
+    """train_model.py's candidates (best by CV MAE)."""
+    from train_model import vault_candidates
+    return vault_candidates()
+
+
+LGB_PARAMS = dict(n_estimators=150, max_depth=4, num_leaves=15, min_child_samples=20,
+                  learning_rate=0.05, random_state=42, verbose=-1, n_jobs=1)
+
+
+def lgb_lens():
+    import lightgbm as lgb
+    return {'LightGBM': lgb.LGBMClassifier(**LGB_PARAMS, class_weight='balanced')}
+
+
+def lgb_vault():
+    import lightgbm as lgb
+    return {'LightGBM': lgb.LGBMRegressor(**LGB_PARAMS)}
+
+
+def xgb_params(key):
+    """Hyperparameters tuned by train_xgb.py (kept in the xgb archive)."""
+    from train_xgb import prior_best_params
+    params = prior_best_params(key)
+    if params is None:
+        raise RuntimeError(f"No tuned {key} params in the xgb archive; run train_xgb.py first")
+    return params
+
+
+def xgb_lens():
+    from xgboost import XGBClassifier
+    return {'XGBoost': XGBClassifier(**xgb_params("lens_size"), objective="multi:softprob",
+                                     random_state=42, verbosity=0, n_jobs=1)}
+
+
+def xgb_vault():
+    from xgboost import XGBRegressor
+    return {'XGBoost': XGBRegressor(**xgb_params("vault"), objective="reg:squarederror",
+                                    random_state=42, verbosity=0, n_jobs=1)}
+
+
+# ── the compare registry ─────────────────────────────────────────────────
+ARCHIVES = [
+    ArchiveSpec(
+        "gestalt-5f-756c",
+        "GradientBoosting on 5 base Pentacam features only. Minimal model, no engineered gestalts.",
+        ["Age", "WTW", "ACD_internal", "ACV", "SimK_steep"], gb_lens, gb_vault),
+    ArchiveSpec(
+        "gestalt-10f-756c",
+        "GradientBoosting on 5 base Pentacam features + 5 gestalt ratios. Minimal feature set.",
+        ["Age", "WTW", "ACD_internal", "ACV", "SimK_steep", "Space_Volume", "Aspect_Ratio",
+         "Chamber_Tightness", "Age_Space_Ratio", "Curvature_Depth_Ratio"], gb_lens, gb_vault),
+    ArchiveSpec(
+        "gestalt-18f-756c",
+        "No-ACV fallback model: gestalt-24f-756c without the 6 ACV-dependent features.",
+        [f for f in FEATURES_24 if f not in ACV_DEPENDENT], selected_lens, selected_vault),
+    ArchiveSpec(
+        "gestalt-24f-756c",
+        "Foundation model. GradientBoosting on 9 base + 15 gestalt features.",
+        FEATURES_24, selected_lens, selected_vault, parent=None),
+    ArchiveSpec(
+        "gestalt-27f-756c",
+        "Tight-chamber GradientBoosting: 24 gestalt features + 3 tight-chamber features, "
+        "balanced lens weights.",
+        FEATURES_27, gb_lens, gb_vault, lens_weights='balanced'),
+    ArchiveSpec(
+        "lgb-24f-756c",
+        "LightGBM with balanced class weights, regularized for real probability outputs.",
+        FEATURES_24, lgb_lens, lgb_vault),
+    ArchiveSpec(
+        "lgb-27f-756c",
+        "Tight chamber model. LightGBM lens classifier on 27 features with balanced class "
+        "weights, GradientBoosting vault regressor.",
+        FEATURES_27, lgb_lens, gb_vault, parent="lgb-24f-756c"),
+    ArchiveSpec(
+        "xgb-24f-756c",
+        "XGBoost on the 24 gestalt features with the Optuna-tuned hyperparameters "
+        "from train_xgb.py.",
+        FEATURES_24, xgb_lens, xgb_vault, encode_lens=True),
+]
+
+
+# ── data ─────────────────────────────────────────────────────────────────
+def load_data():
+    """Complete training cases with every feature any archive uses."""
+    print("=" * 70)
+    print("LOADING TRAINING DATA")
+    print("=" * 70)
+
+    target_cols = ['Lens_Size', 'Vault']
+    df = load_training_data(FEATURES_27 + target_cols, path=DATASET_PATH, csv_path=DATA_PATH)
+    df_complete = complete_cases(df, BASE_FEATURES + target_cols)
+
+    df_complete['Lens_Size'] = df_complete['Lens_Size'].abs()
+    valid_lens = (df_complete['Lens_Size'] > 0) & (df_complete['Lens_Size'] < 20)
+    df_complete = df_complete[valid_lens].copy()
+    df_complete['Lens_Size'] = df_complete['Lens_Size'].astype(str)
+
+    print(f"\nTotal cases: {len(df)}")
+    print(f"Complete cases: {len(df_complete)}")
+    return df_complete
+
+
+def shared_splits(n_rows):
+    """The 5-fold KFold splits as a PredefinedSplit every task reuses."""
+    test_fold = np.empty(n_rows, dtype=int)
+    for fold, (_, test) in enumerate(CV.split(np.zeros(n_rows))):
+        test_fold[test] = fold
+    return PredefinedSplit(test_fold)
+
+
+def build_tasks(specs, df, cv):
+    """CVTasks for every spec (lens and vault) plus their fitted scalers."""
+    y_lens = df['Lens_Size'].to_numpy(dtype=object)
+    y_vault = df['Vault'].to_numpy()
+    classes = sorted(set(y_lens))
+    y_lens_int = np.array([classes.index(c) for c in y_lens])
+    balanced = lambda y_train: compute_sample_weight('balanced', y_train)  # noqa: E731
+
+    tasks, scalers = {}, {}
+    for spec in specs:
+        X = df[spec.features]
+        scalers[spec.tag] = {'lens': StandardScaler(), 'vault': StandardScaler()}
+        tasks[f"{spec.tag}/lens"] = CVTask(
+            spec.lens(), scalers[spec.tag]['lens'].fit_transform(X),
+            y_lens_int if spec.encode_lens else y_lens, cv, accuracy_score,
+            sample_weight=balanced if spec.lens_weights == 'balanced' else None)
+        tasks[f"{spec.tag}/vault"] = CVTask(
+            spec.vault(), scalers[spec.tag]['vault'].fit_transform(X),
+            y_vault, cv, mean_absolute_error, greater_is_better=False)
+    return tasks, scalers, classes
+
+
+# ── archives ─────────────────────────────────────────────────────────────
+def archive_metrics(spec, lens, vault, classes):
+    """README metrics from the CV results of one archive."""
+    y_lens, oof = lens.task.y, lens.predictions[lens.best_name].oof
+    if spec.encode_lens:
+        y_lens = np.array([classes[i] for i in y_lens], dtype=object)
+        oof = np.array([classes[i] for i in oof], dtype=object)
+    labels = sorted(set(y_lens))
+    cm = confusion_matrix(y_lens, oof, labels=labels)
+    small = labels.index("12.1") if "12.1" in labels else None
+
+    vault_oof = vault.predictions[vault.best_name].oof
+    return {
+        'cases': len(y_lens),
+        'features': len(spec.features),
+        'lens_model': lens.best_name,
+        'lens_accuracy': lens.best_score,
+        'lens_std': lens.scores[lens.best_name].std(),
+        'recall_121': None if small is None else (int(cm[small, small]), int(cm[small].sum())),
+        'vault_model': vault.best_name,
+        'vault_mae': vault.best_score,
+        'vault_std': vault.scores[vault.best_name].std(),
+        'vault_r2': r2_score(vault.task.y, vault_oof),
+    }
+
+
+def render_metrics(spec, metrics):
+    weights = ", balanced weights" if spec.lens_weights else ""
+    lines = [
+        METRICS_START,
+        "## Build Metrics",
+        "",
+        "| Metric | Value |",
+        "|---|---|",
+        f"| Lens model | {metrics['lens_model']} |",
+        f"| Lens size accuracy | {metrics['lens_accuracy']:.1%} ± {metrics['lens_std']:.1%} "
+        f"(5-fold CV{weights}) |",
+    ]
+    if metrics['recall_121']:
+        correct, total = metrics['recall_121']
+        lines.append(f"| 12.1 recall (CV) | {correct}/{total} ({correct / total:.0%}) |")
+    lines += [
+        f"| Vault model | {metrics['vault_model']} |",
+        f"| Vault MAE | {metrics['vault_mae']:.1f} ± {metrics['vault_std']:.1f} µm (5-fold CV) |",
+        f"| Vault R² (CV) | {metrics['vault_r2']:.3f} |",
+        f"| Features | {metrics['features']} |",
+        f"| Training cases | {metrics['cases']} |",
+        f"| Built | {date.today().strftime('%b %d, %Y')} |",
+        "| Build script | `scripts/training/build_archives.py` |",
+        METRICS_END,
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def update_readme(path, spec, metrics):
+    """Replace the README's generated metrics section (or add one)."""
+    block = render_metrics(spec, metrics)
+    if not path.exists():
+        parent = f"\n## Parent\n{spec.parent}\n" if spec.parent else ""
+        features = "\n".join(f"- {f}" for f in spec.features)
+        text = (f"# {spec.tag}\n\n{spec.summary}\n\n{block}\n"
+                f"## Features ({len(spec.features)})\n{features}\n{parent}")
+    else:
+        text = path.read_text()
+        if METRICS_START in text and METRICS_END in text:
+            head, rest = text.split(METRICS_START, 1)
+            tail = rest.split(METRICS_END, 1)[1]
+            text = head + block.rstrip("\n") + tail
+        else:
+            text = text.rstrip("\n") + "\n\n" + block
+    path.write_text(text)
+
+
+def save_archive(out_dir, spec, lens, vault, scalers, classes):
+    archive = out_dir / spec.tag
+    archive.mkdir(parents=True, exist_ok=True)
+
+    lens_model = lens.best_model
+    if spec.encode_lens:
+        lens_model._vault_classes = np.array(classes, dtype=float)
+    artifacts = dict(zip(MODEL_FILES, [
+        lens_model, scalers['lens'], vault.best_model, scalers['vault'], list(spec.features)
+    ]))
+    for filename, obj in artifacts.items():
+        with open(archive / filename, 'wb') as f:
+            pickle.dump(obj, f)
+
+    metrics = archive_metrics(spec, lens, vault, classes)
+    update_readme(archive / "README.md", spec, metrics)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build every models/archives variant in one pass")
+    parser.add_argument("--only", nargs="+", metavar="TAG", help="Build just these archives")
+    parser.add_argument("--jobs", type=int, default=-1, help="Worker processes (-1 = all cores)")
+    parser.add_argument("--out", type=Path, default=ARCHIVES_DIR, help="Archive root directory")
+    parser.add_argument("--list", action="store_true", help="List the archive specs and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for spec in ARCHIVES:
+            print(f"  {spec.tag:<20} {len(spec.features):>2} features  {spec.summary}")
+        return
+
+    specs = ARCHIVES
+    if args.only:
+        unknown = set(args.only) - {spec.tag for spec in ARCHIVES}
+        if unknown:
+            print(f"❌ Unknown archive(s): {', '.join(sorted(unknown))}")
+            sys.exit(1)
+        specs = [spec for spec in ARCHIVES if spec.tag in args.only]
+
+    print("\n" + "=" * 70)
+    print(f"ICL VAULT - BUILDING {len(specs)} MODEL ARCHIVES")
+    print("=" * 70)
+
+    df = load_data()
+    if len(df) == 0:
+        print("\n❌ No complete training cases found!")
+        sys.exit(1)
+
+    tasks, scalers, classes = build_tasks(specs, df, shared_splits(len(df)))
+    n_fits = sum(len(task.models) * CV.get_n_splits() for task in tasks.values())
+    print(f"\nCross-validating {n_fits} (model, fold) fits for {len(tasks)} tasks "
+          f"in one pool (n_jobs={args.jobs})...")
+    results = run_tasks(tasks, n_jobs=args.jobs)
+
+    print("\n" + "=" * 70)
+    print(f"SAVING TO {args.out}")
+    print("=" * 70)
+    print(f"\n  {'Archive':<20} {'Lens model':<18} {'Accuracy':>8}  {'Vault model':<18} {'MAE':>8}")
+    for spec in specs:
+        metrics = save_archive(args.out, spec, results[f"{spec.tag}/lens"],
+                               results[f"{spec.tag}/vault"], scalers[spec.tag], classes)
+        print(f"  {spec.tag:<20} {metrics['lens_model']:<18} {metrics['lens_accuracy']:>7.1%}  "
+              f"{metrics['vault_model']:<18} {metrics['vault_mae']:>6.1f}µm")
+
+    print(f"\n✅ {len(specs)} archives written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
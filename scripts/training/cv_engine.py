@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Cross-validation engine for the training scripts.
+
+Candidate models for one or more targets are evaluated in a single joblib
+pool: every (task, model, fold) fit is one job, so lens-size and vault
+candidates train side by side on all cores. Each fit's out-of-fold
+predictions are kept, so fold scores for any metric and the winner's
+out-of-fold predictions come from the same fits instead of re-running
+cross_val_score / cross_val_predict. Results match those sklearn helpers
+for the same estimators and folds.
+
+run_folds() does the same for a single model with per-fold sample
+weights (the tight-chamber trainers): folds and the full-data fit run as
+parallel processes and the fitted fold models are returned too.
+
+SubsetEvaluator cross-validates many feature subsets of one dataset
+(feature_selection_analysis), memoizing each subset's score.
+
+Feature matrices go through shared_matrix() first: they are written once
+to a .npy file and memory-mapped, and joblib hands a memmap to its worker
+processes by file name instead of pickling the data into every job.
+Workers only receive index arrays for their fold / feature subset.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+
+SHARED_DIR = os.path.join("data", "processed", "cache", "shared")
+SHARED_MAX_AGE_S = 24 * 3600   # matrix files unused this long are deleted
+
+
+def shared_matrix(X, directory=SHARED_DIR):
+    """
+    X as a read-only memory-mapped array for worker processes to attach to.
+
+    Files are named by content hash, so re-running a trainer on the same
+    data (or several trainers on the same matrix) reuses one file; reuse
+    refreshes its mtime. Object arrays cannot be memory-mapped and are
+    returned unchanged.
+    """
+    if isinstance(X, np.memmap):
+        return X
+    X = np.ascontiguousarray(X)
+    if X.dtype == object:
+        return X
+    hasher = hashlib.sha256(X.tobytes())
+    hasher.update(f"{X.dtype.str}{X.shape}".encode())
+    path = os.path.join(directory, f"{hasher.hexdigest()[:20]}.npy")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, X)
+        os.replace(tmp_path, path)
+        _prune_shared(directory)
+    else:
+        os.utime(path)
+    return np.load(path, mmap_mode='r')
+
+
+def _prune_shared(directory, max_age=SHARED_MAX_AGE_S):
+    """
+    Delete matrix files nobody has created or reused for `max_age` seconds.
+
+    Pruning by age, not count: another trainer running alongside may still
+    have workers attaching to an older file by name.
+    """
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        if not name.endswith(('.npy', '.tmp')):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class CVTask:
+    """
+    Candidate models for one target.
+
+    `metric(y_true, y_pred)` picks the winner by its mean over folds
+    (highest if greater_is_better, else lowest; the first model wins ties).
+    sample_weight is passed to every fit, as in run_folds().
+    """
+
+    def __init__(self, models, X, y, cv, metric, greater_is_better=True, sample_weight=None):
+        self.models = models
+        self.X = shared_matrix(X)
+        self.y = np.asarray(y)
+        self.cv = cv
+        self.metric = metric
+        self.greater_is_better = greater_is_better
+        self.sample_weight = sample_weight
+
+
+class CVPredictions:
+    """Out-of-fold predictions of one model, kept per fold."""
+
+    def __init__(self, y, folds):
+        self.y = y
+        self.folds = folds          # [(test_indices, predictions), ...] in CV order
+
+    def fold_scores(self, metric):
+        """metric(y_true, y_pred) on each fold, like cross_val_score."""
+        return np.array([metric(self.y[test], pred) for test, pred in self.folds])
+
+    @property
+    def oof(self):
+        """Out-of-fold prediction for every sample, like cross_val_predict."""
+        dtype = np.result_type(*[pred for _, pred in self.folds])
+        predictions = np.empty(len(self.y), dtype=dtype)
+        for test, pred in self.folds:
+            predictions[test] = pred
+        return predictions
+
+
+class TaskResult:
+    """Cross-validation results of one task plus its refitted winner."""
+
+    def __init__(self, task, predictions, fold_seconds=None):
+        self.task = task
+        self.predictions = predictions                     # {name: CVPredictions}
+        self.fold_seconds = fold_seconds or {}             # {name: [fit+predict seconds per fold]}
+        self.scores = {name: p.fold_scores(task.metric) for name, p in predictions.items()}
+        pick = max if task.greater_is_better else min
+        self.best_name = pick(self.scores, key=lambda name: self.scores[name].mean())
+        self.best_score = self.scores[self.best_name].mean()
+        self.best_model = None                             # fitted on all data by run_tasks()
+
+
+def _fit(model, X, y, sample_weight=None):
+    if sample_weight is None:
+        return clone(model).fit(X, y)
+    return clone(model).fit(X, y, sample_weight=sample_weight)
+
+
+def _fit_predict(model, X, y, train, test, sample_weight=None):
+    """Fold predictions plus the seconds the fit and predict took."""
+    start = time.perf_counter()
+    fitted = _fit(model, X[train], y[train], sample_weight)
+    return fitted.predict(X[test]), time.perf_counter() - start
+
+
+def _fit_fold(model, X, y, train, test, sample_weight):
+    fitted = _fit(model, X[train], y[train], sample_weight)
+    return fitted, fitted.predict(X[test])
+
+
+def _weights(sample_weight, y, idx):
+    """Weights for the rows `idx`: sample_weight is None, an array, or a function of y."""
+    if sample_weight is None:
+        return None
+    if callable(sample_weight):
+        return sample_weight(y[idx])
+    return np.asarray(sample_weight)[idx]
+
+
+class FoldRun:
+    """Result of run_folds(): out-of-fold predictions plus the fitted models."""
+
+    def __init__(self, y, folds, fold_models, full_model):
+        self.predictions = CVPredictions(y, folds)
+        self.fold_models = fold_models
+        self.full_model = full_model
+
+    @property
+    def oof(self):
+        return self.predictions.oof
+
+    def fold_scores(self, metric):
+        return self.predictions.fold_scores(metric)
+
+
+def run_folds(model, X, y, cv, sample_weight=None, n_jobs=-1):
+    """
+    Cross-validate one model and fit it on all data, in parallel processes.
+
+    sample_weight is None, an array aligned with y, or a function of the
+    training labels (e.g. balanced class weights) evaluated per fold and
+    for the full fit. The full fit runs alongside the folds rather than
+    after them.
+    """
+    X, y = shared_matrix(X), np.asarray(y)
+    splits = list(cv.split(X, y))
+    jobs = [delayed(_fit_fold)(model, X, y, train, test, _weights(sample_weight, y, train))
+            for train, test in splits]
+    jobs.append(delayed(_fit)(model, X, y, _weights(sample_weight, y, slice(None))))
+
+    *fold_outputs, full_model = Parallel(n_jobs=n_jobs)(jobs)
+    folds = [(test, pred) for (_, test), (_, pred) in zip(splits, fold_outputs)]
+    return FoldRun(y, folds, [fitted for fitted, _ in fold_outputs], full_model)
+
+
+def run_tasks(tasks, n_jobs=-1):
+    """
+    Cross-validate every task's candidates and refit each winner.
+
+    tasks: {task_name: CVTask}. Returns {task_name: TaskResult}. All
+    (task, model, fold) fits share one pool; the winners are then refitted
+    on all data concurrently.
+    """
+    jobs = []
+    for task_name, task in tasks.items():
+        for train, test in task.cv.split(task.X, task.y):
+            for model_name, model in task.models.items():
+                weights = _weights(task.sample_weight, task.y, train)
+                jobs.append((task_name, model_name, test,
+                             delayed(_fit_predict)(model, task.X, task.y, train, test, weights)))
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        outputs = parallel(job[-1] for job in jobs)
+
+        # Jobs were queued fold by fold, so each model's folds stay in CV order
+        folds = {name: {model: [] for model in task.models} for name, task in tasks.items()}
+        seconds = {name: {model: [] for model in task.models} for name, task in tasks.items()}
+        for (task_name, model_name, test, _), (pred, fold_seconds) in zip(jobs, outputs):
+            folds[task_name][model_name].append((test, pred))
+            seconds[task_name][model_name].append(fold_seconds)
+
+        results = {
+            name: TaskResult(task, {model: CVPredictions(task.y, fold_list)
+                                    for model, fold_list in folds[name].items()},
+                             seconds[name])
+            for name, task in tasks.items()
+        }
+
+        winners = parallel(
+            delayed(_fit)(task.models[results[name].best_name], task.X, task.y,
+                          _weights(task.sample_weight, task.y, slice(None)))
+            for name, task in tasks.items()
+        )
+    for name, model in zip(tasks, winners):
+        results[name].best_model = model
+    return results
+
+
+def _fold_score(model, X, y, columns, train, test, score):
+    fitted = clone(model).fit(X[np.ix_(train, columns)], y[train])
+    return score(y[test], fitted.predict(X[np.ix_(test, columns)]))
+
+
+class SubsetEvaluator:
+    """
+    Memoized, parallel cross-validation of feature subsets.
+
+    The feature matrix is standardised once (StandardScaler works column
+    by column, so a subset's columns equal scaling that subset alone),
+    shared with the workers via shared_matrix(), and the CV splits are
+    computed once; a job is just (column indices, fold indices) into it.
+    Results are memoized by (target, model config, features) and, with
+    cache_file, persisted for reruns on the same data.
+
+    targets: {name: (y, model, score)} where score(y_true, y_pred) is the
+    per-fold metric.
+    """
+
+    def __init__(self, X, targets, cv, n_jobs=-1, cache_file=None):
+        self.columns = {name: i for i, name in enumerate(X.columns)}
+        self.X = shared_matrix(StandardScaler().fit_transform(X))
+        self.targets = {name: (np.asarray(y), model, score)
+                        for name, (y, model, score) in targets.items()}
+        self.splits = list(cv.split(self.X))
+        self.n_jobs = n_jobs
+        self.cache_file = cache_file
+        self.data_key = self._data_key()
+        self.results = self._load_cache()
+        self.evaluated = 0
+
+    def _data_key(self):
+        hasher = hashlib.sha256(self.X.tobytes())
+        for name, (y, _, _) in sorted(self.targets.items()):
+            hasher.update(name.encode())
+            hasher.update(np.asarray(y).astype(str).astype('U').tobytes())
+        for _, test in self.splits:
+            hasher.update(test.tobytes())
+        return hasher.hexdigest()
+
+    def _key(self, features, target):
+        _, model, score = self.targets[target]
+        config = f"{type(model).__name__}{sorted(model.get_params().items())}:{score.__name__}"
+        return f"{target}|{config}|{','.join(features)}"
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable subset cache {self.cache_file}: {e}")
+            return {}
+        if cached.get('data_key') != self.data_key:
+            return {}
+        return {key: tuple(value) for key, value in cached.get('results', {}).items()}
+
+    def save(self):
+        if not self.cache_file:
+            return
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        tmp_path = self.cache_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'data_key': self.data_key, 'results': self.results}, f, indent=1)
+        os.replace(tmp_path, self.cache_file)
+
+    def evaluate_many(self, requests):
+        """
+        (mean, std) fold score for each (features, target) in `requests`.
+
+        Subsets not seen before are cross-validated together: every
+        (subset, fold) fit is one job in a single process pool.
+        """
+        keys = [self._key(features, target) for features, target in requests]
+        todo = {}
+        for key, (features, target) in zip(keys, requests):
+            if key not in self.results and key not in todo:
+                todo[key] = (list(features), target)
+
+        if todo:
+            jobs = []
+            for key, (features, target) in todo.items():
+                y, model, score = self.targets[target]
+                columns = np.array([self.columns[f] for f in features])
+                for train, test in self.splits:
+                    jobs.append(delayed(_fold_score)(model, self.X, y, columns, train, test, score))
+            scores = Parallel(n_jobs=self.n_jobs)(jobs)
+            n_folds = len(self.splits)
+            for i, key in enumerate(todo):
+                fold_scores = np.array(scores[i * n_folds:(i + 1) * n_folds])
+                self.results[key] = (float(fold_scores.mean()), float(fold_scores.std()))
+            self.evaluated += len(todo)
+            self.save()
+
+        return [self.results[key] for key in keys]
+
+    def evaluate(self, features, target):
+        return self.evaluate_many([(features, target)])[0]
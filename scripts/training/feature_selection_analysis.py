@@ -2,17 +2,28 @@
 """
 Feature Selection Analysis for ICL Prediction
 Tests which features actually matter and finds optimal minimal set.
+
+Subsets are scored by cv_engine.SubsetEvaluator: every batch of candidate
+subsets (an ablation, a forward-selection round) is cross-validated in
+one process pool, and scores are cached in
+data/processed/cache/feature_subsets.json so reruns on the same data only
+evaluate new subsets. Pass --no-cache to recompute everything.
 """
 
-import pandas as pd
+import sys
+from pathlib import Path
+
 import numpy as np
-from sklearn.model_selection import cross_val_score, KFold
+from sklearn.model_selection import KFold
 from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error
+from sklearn.metrics import accuracy_score, mean_absolute_error
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "pipeline"))
+from training_dataset import load_training_data, complete_cases  # noqa: E402
+from cv_engine import SubsetEvaluator  # noqa: E402
+
 # All 13 features
 ALL_FEATURES = ['Age', 'WTW', 'ACD_internal', 'ACV', 'ACA_global', 
                 'Pupil_diameter', 'AC_shape_ratio', 'TCRP_Km', 
@@ -26,14 +37,15 @@ OPTIONAL_FEATURES = ['ACV', 'ACA_global', 'Pupil_diameter',
                      'AC_shape_ratio', 'TCRP_Km', 'TCRP_Astigmatism', 
                      'SimK_steep', 'CCT', 'BAD_D']
 
+SUBSET_CACHE = "data/processed/cache/feature_subsets.json"
+
 
 def load_data():
-    """Load training data."""
-    df = pd.read_csv('training_data.csv')
+    """Load training data (only the columns the ablations use)."""
+    df = load_training_data(ALL_FEATURES + ['Lens_Size', 'Vault'])
     
     # Filter complete cases
-    complete = df[ALL_FEATURES + ['Lens_Size', 'Vault']].notna().all(axis=1)
-    df = df[complete].copy()
+    df = complete_cases(df, ALL_FEATURES + ['Lens_Size', 'Vault'])
     
     # Remove lens size outliers
     valid = (df['Lens_Size'] > 0) & (df['Lens_Size'] < 20)
@@ -44,35 +56,31 @@ def load_data():
     return df
 
 
-def evaluate_feature_set(df, features, target, task='classification'):
+def make_evaluator(df, n_jobs=-1, cache_file=SUBSET_CACHE):
     """
-    Evaluate model performance with given feature set.
-    
-    Returns: (mean_score, std_score)
+    Subset evaluator for both targets (5-fold CV on standardized features).
+
+    Lens Size scores are accuracy; Vault scores are MAE in µm.
     """
-    X = df[features].values
-    y = df[target].values
-    
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
+    targets = {
+        'Lens_Size': (
+            df['Lens_Size'].to_numpy(dtype=object),
+            GradientBoostingClassifier(n_estimators=50, max_depth=2,
+                                       learning_rate=0.1, random_state=42),
+            accuracy_score,
+        ),
+        'Vault': (
+            df['Vault'].to_numpy(),
+            GradientBoostingRegressor(n_estimators=50, max_depth=3,
+                                      learning_rate=0.1, random_state=42),
+            mean_absolute_error,
+        ),
+    }
     cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    
-    if task == 'classification':
-        model = GradientBoostingClassifier(n_estimators=50, max_depth=2, 
-                                          learning_rate=0.1, random_state=42)
-        scores = cross_val_score(model, X_scaled, y, cv=cv, scoring='accuracy')
-    else:  # regression
-        model = GradientBoostingRegressor(n_estimators=50, max_depth=3, 
-                                         learning_rate=0.1, random_state=42)
-        scores = cross_val_score(model, X_scaled, y, cv=cv, 
-                                scoring='neg_mean_absolute_error')
-        scores = -scores  # Convert to positive MAE
-    
-    return scores.mean(), scores.std()
+    return SubsetEvaluator(df[ALL_FEATURES], targets, cv, n_jobs=n_jobs, cache_file=cache_file)
 
 
-def ablation_study(df):
+def ablation_study(evaluator):
     """
     Remove one feature at a time and see impact.
     Tests which features can be removed without hurting performance.
@@ -81,18 +89,21 @@ def ablation_study(df):
     print("ABLATION STUDY: Remove One Feature at a Time")
     print("="*80)
     
+    # Every leave-one-out subset for both targets in one parallel batch
+    subsets = [ALL_FEATURES] + [[f for f in ALL_FEATURES if f != feature] for feature in ALL_FEATURES]
+    evaluator.evaluate_many([(features, target) for target in ('Lens_Size', 'Vault')
+                             for features in subsets])
+    
     # Baseline: all features
     print("\n📊 LENS SIZE MODEL (Accuracy)")
     print("-" * 80)
-    baseline_lens, baseline_lens_std = evaluate_feature_set(
-        df, ALL_FEATURES, 'Lens_Size', 'classification'
-    )
+    baseline_lens, baseline_lens_std = evaluator.evaluate(ALL_FEATURES, 'Lens_Size')
     print(f"{'BASELINE (all 13 features)':<40} {baseline_lens:.3f} ± {baseline_lens_std:.3f}")
     
     results_lens = []
     for feature in ALL_FEATURES:
         features_without = [f for f in ALL_FEATURES if f != feature]
-        score, std = evaluate_feature_set(df, features_without, 'Lens_Size', 'classification')
+        score, std = evaluator.evaluate(features_without, 'Lens_Size')
         diff = score - baseline_lens
         results_lens.append({
             'removed': feature,
@@ -107,15 +118,13 @@ def ablation_study(df):
     print("\n" + "="*80)
     print("📊 VAULT MODEL (MAE in µm)")
     print("-" * 80)
-    baseline_vault, baseline_vault_std = evaluate_feature_set(
-        df, ALL_FEATURES, 'Vault', 'regression'
-    )
+    baseline_vault, baseline_vault_std = evaluator.evaluate(ALL_FEATURES, 'Vault')
     print(f"{'BASELINE (all 13 features)':<40} {baseline_vault:.1f} ± {baseline_vault_std:.1f} µm")
     
     results_vault = []
     for feature in ALL_FEATURES:
         features_without = [f for f in ALL_FEATURES if f != feature]
-        mae, std = evaluate_feature_set(df, features_without, 'Vault', 'regression')
+        mae, std = evaluator.evaluate(features_without, 'Vault')
         diff = mae - baseline_vault
         results_vault.append({
             'removed': feature,
@@ -160,7 +169,7 @@ def ablation_study(df):
     return results_lens, results_vault
 
 
-def progressive_feature_addition(df):
+def progressive_feature_addition(evaluator):
     """
     Start with core features, add one at a time to see what helps most.
     """
@@ -175,8 +184,8 @@ def progressive_feature_addition(df):
     current_features = CORE_FEATURES.copy()
     remaining_features = OPTIONAL_FEATURES.copy()
     
-    lens_score, lens_std = evaluate_feature_set(df, current_features, 'Lens_Size', 'classification')
-    vault_mae, vault_std = evaluate_feature_set(df, current_features, 'Vault', 'regression')
+    (lens_score, lens_std), (vault_mae, vault_std) = evaluator.evaluate_many(
+        [(current_features, 'Lens_Size'), (current_features, 'Vault')])
     
     print(f"Lens Size Accuracy: {lens_score:.3f} ± {lens_std:.3f}")
     print(f"Vault MAE:          {vault_mae:.1f} ± {vault_std:.1f} µm")
@@ -199,10 +208,13 @@ def progressive_feature_addition(df):
         best_lens = lens_score
         best_vault = vault_mae
         
-        for feature in remaining_features:
-            test_features = current_features + [feature]
-            new_lens, _ = evaluate_feature_set(df, test_features, 'Lens_Size', 'classification')
-            new_vault, _ = evaluate_feature_set(df, test_features, 'Vault', 'regression')
+        # All candidates of this round, both targets, in one parallel batch
+        candidates = [current_features + [feature] for feature in remaining_features]
+        scores = evaluator.evaluate_many([(features, target) for features in candidates
+                                          for target in ('Lens_Size', 'Vault')])
+        
+        for i, feature in enumerate(remaining_features):
+            (new_lens, _), (new_vault, _) = scores[2 * i], scores[2 * i + 1]
             
             # Combined improvement score (normalize both)
             lens_improvement = (new_lens - lens_score) * 100  # Convert to percentage points
@@ -252,7 +264,7 @@ def progressive_feature_addition(df):
     return history
 
 
-def minimal_feature_sets(df):
+def minimal_feature_sets(evaluator):
     """Test predefined minimal feature sets."""
     print("\n" + "="*80)
     print("TESTING MINIMAL FEATURE SETS")
@@ -267,10 +279,12 @@ def minimal_feature_sets(df):
     }
     
     results = []
+    evaluator.evaluate_many([(features, target) for features in feature_sets.values()
+                             for target in ('Lens_Size', 'Vault')])
     
     for name, features in feature_sets.items():
-        lens_acc, lens_std = evaluate_feature_set(df, features, 'Lens_Size', 'classification')
-        vault_mae, vault_std = evaluate_feature_set(df, features, 'Vault', 'regression')
+        lens_acc, lens_std = evaluator.evaluate(features, 'Lens_Size')
+        vault_mae, vault_std = evaluator.evaluate(features, 'Vault')
         
         results.append({
             'name': name,
@@ -320,18 +334,24 @@ def main():
     print(f"\nLoaded {len(df)} complete training cases")
     print(f"Testing {len(ALL_FEATURES)} features")
     
+    cache_file = None if '--no-cache' in sys.argv else SUBSET_CACHE
+    evaluator = make_evaluator(df, cache_file=cache_file)
+    cached = len(evaluator.results)
+    
     # 1. Ablation study
-    ablation_study(df)
+    ablation_study(evaluator)
     
     # 2. Progressive addition
-    progressive_feature_addition(df)
+    progressive_feature_addition(evaluator)
     
     # 3. Test minimal sets
-    minimal_feature_sets(df)
+    minimal_feature_sets(evaluator)
     
     print("\n" + "="*80)
     print("ANALYSIS COMPLETE")
     print("="*80)
+    print(f"\nSubset evaluations: {evaluator.evaluated} cross-validated, "
+          f"{cached} available from cache")
     print("\n📋 RECOMMENDATIONS:")
     print("1. Check ablation study for features that can be removed")
     print("2. Review progressive addition for optimal feature count")
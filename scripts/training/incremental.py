@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Incremental retraining support for train_model.py.
+
+After a full model search, train_model.py records what it trained on in
+the 'train_model' stage manifest (data/processed/manifest/train_model.json):
+a fingerprint of every training row, the feature statistics and CV scores
+of the search, and the saved model files. `train_model.py --incremental`
+compares the current dataset with that record and then
+
+- stops if no training rows changed,
+- adds trees to the saved models for the new rows (warm_start for sklearn
+  ensembles, init_model / xgb_model for LightGBM / XGBoost, a plain refit
+  for everything else) when rows were only appended, or
+- falls back to the full search when rows were edited or removed, the
+  features drifted, the saved models score worse on the new rows than in
+  the last search by more than sampling noise, or the data grew too much since that search.
+"""
+
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.pipeline.manifest import StageManifest
+from scripts.pipeline.training_dataset import DATASET_FILE, CSV_FILE
+
+STATE_STAGE = 'train_model'
+STATE_VERSION = 1
+
+DRIFT_THRESHOLD = 0.25    # max shift of a feature mean since the last search, in its SDs
+MAX_GROWTH = 0.25         # rows added since the last search, as a fraction of the searched rows
+MAX_UPDATES = 10          # warm-start updates before the next full search
+ACCURACY_DROP = 0.05      # smallest lens accuracy drop on the new rows worth a full search
+MAE_RISE = 15.0           # smallest vault MAE rise (µm) on the new rows worth a full search
+REGRESSION_Z = 2.33       # one-sided z (~1% false alarms) for the regression check
+MIN_CHECK_ROWS = 30       # new rows needed before the regression check is trusted
+MIN_EXTRA_TREES = 5
+FINGERPRINT_DECIMALS = 6
+
+
+def dataset_path():
+    """The dataset file the trainers read (Parquet when present)."""
+    return DATASET_FILE if os.path.exists(DATASET_FILE) else CSV_FILE
+
+
+def row_fingerprints(X, *targets):
+    """
+    Stable hash of every row (features plus targets), as hex strings.
+
+    Floats are rounded first: engineered features can differ in the last
+    bit depending on how many rows they were computed alongside.
+    """
+    frame = X.reset_index(drop=True).round(FINGERPRINT_DECIMALS)
+    for i, y in enumerate(targets):
+        frame[f'_target_{i}'] = pd.Series(np.asarray(y)).astype(str)
+    return [f"{h:016x}" for h in pd.util.hash_pandas_object(frame, index=False)]
+
+
+def feature_stats(X):
+    return {col: [float(X[col].mean()), float(X[col].std(ddof=0))] for col in X.columns}
+
+
+def feature_drift(X, stats):
+    """Shift of each feature mean since `stats`, in units of the SD back then."""
+    return {col: abs(float(X[col].mean()) - mean) / std if std > 0 else 0.0
+            for col, (mean, std) in stats.items()}
+
+
+def tree_count(model):
+    return getattr(model, 'n_estimators', None)
+
+
+def load_state(manifest=None):
+    """
+    State recorded by the last training run, or None if there is none or
+    the saved model files changed since (e.g. another trainer overwrote them).
+    """
+    manifest = manifest or StageManifest(STATE_STAGE, STATE_VERSION)
+    entry = manifest.entries.get(os.path.basename(dataset_path()))
+    if not entry or 'result' not in entry:
+        return None
+    if not all(manifest.is_current(path) for path in entry['outputs']):
+        return None
+    return entry['result']
+
+
+def save_state(state, model_files):
+    """Record `state` against the current dataset file and the saved models."""
+    manifest = StageManifest(STATE_STAGE, STATE_VERSION, full=True)
+    manifest.record(dataset_path(), result=state, outputs=model_files)
+    for path in model_files:
+        manifest.record(path)
+    manifest.save()
+
+
+def plan_update(state, X, fingerprints):
+    """
+    Decide how to bring the models up to date with the current rows.
+
+    Returns (action, reason, new_rows) where action is 'none', 'update' or
+    'search' and new_rows is a boolean mask of rows not trained on yet.
+    """
+    trained = set(state['rows'])
+    new_rows = np.array([fp not in trained for fp in fingerprints], dtype=bool)
+    search = state['search']
+
+    if list(X.columns) != state['features']:
+        return 'search', "feature list changed", new_rows
+    missing = len(trained - set(fingerprints))
+    if missing:
+        return 'search', f"{missing} previously trained rows were changed or removed", new_rows
+    if not new_rows.any():
+        return 'none', "no new training rows", new_rows
+
+    growth = (len(fingerprints) - search['rows']) / search['rows']
+    if growth > MAX_GROWTH:
+        return 'search', f"dataset grew {growth:.0%} since the last full search", new_rows
+    if state['updates'] >= MAX_UPDATES:
+        return 'search', f"{state['updates']} incremental updates since the last full search", new_rows
+    drift = feature_drift(X, search['stats'])
+    feature, shift = max(drift.items(), key=lambda item: item[1])
+    if shift > DRIFT_THRESHOLD:
+        return 'search', f"{feature} drifted {shift:.2f} SD since the last full search", new_rows
+    return 'update', f"{new_rows.sum()} new rows", new_rows
+
+
+def regression_reason(state, lens_correct, vault_errors):
+    """
+    Why the saved models are no longer good enough on the new rows, or None.
+
+    lens_correct holds one bool per new row, vault_errors one absolute error
+    (µm). A score only counts as worse when it is off from the search CV
+    score by more than REGRESSION_Z standard errors at this sample size
+    (binomial for accuracy, the spread of the errors for MAE), and by at
+    least ACCURACY_DROP / MAE_RISE.
+    """
+    n_new = len(lens_correct)
+    if n_new < MIN_CHECK_ROWS:
+        return None
+    search = state['search']
+
+    lens_accuracy = float(np.mean(lens_correct))
+    p = search['lens_accuracy']
+    accuracy_margin = max(ACCURACY_DROP, REGRESSION_Z * math.sqrt(p * (1 - p) / n_new))
+    if lens_accuracy < p - accuracy_margin:
+        return (f"lens accuracy on new rows {lens_accuracy:.1%} vs "
+                f"{p:.1%} in the last search (n={n_new})")
+
+    vault_mae = float(np.mean(vault_errors))
+    mae_margin = max(MAE_RISE, REGRESSION_Z * float(np.std(vault_errors, ddof=1)) / math.sqrt(n_new))
+    if vault_mae > search['vault_mae'] + mae_margin:
+        return (f"vault MAE on new rows {vault_mae:.1f}µm vs "
+                f"{search['vault_mae']:.1f}µm in the last search (n={n_new})")
+    return None
+
+
+def extra_trees(base_trees, n_new, search_rows):
+    """Trees to add for n_new rows: the searched ensemble size, pro rata."""
+    return max(MIN_EXTRA_TREES, math.ceil(base_trees * n_new / search_rows))
+
+
+def add_trees(model, X, y, n_trees):
+    """
+    Continue training `model` on (X, y) with n_trees more trees.
+
+    Returns the updated model, or None if the model cannot be warm-started
+    (no trees, or new classes for a classifier); refit it from scratch then.
+    """
+    classes = getattr(model, 'classes_', None)
+    if classes is not None and not set(np.unique(y)) <= set(classes):
+        return None
+
+    total = tree_count(model)
+    if total is None:
+        return None
+    module = type(model).__module__
+    if module.startswith('lightgbm'):
+        model.set_params(n_estimators=n_trees)
+        model.fit(X, y, init_model=model.booster_)
+    elif module.startswith('xgboost'):
+        model.set_params(n_estimators=n_trees)
+        model.fit(X, y, xgb_model=model.get_booster())
+    elif 'warm_start' in model.get_params():
+        model.set_params(warm_start=True, n_estimators=total + n_trees)
+        model.fit(X, y)
+        model.set_params(warm_start=False)
+        return model
+    else:
+        return None
+    model.set_params(n_estimators=total + n_trees)
+    return model
@@ -2,88 +2,271 @@
 """
 Performance Tracking System
 Logs model performance after each training run to track improvement over time.
+
+Runs are appended, one JSON object per line, to model_runs.jsonl (the run
+ledger); earlier lines are never rewritten. Besides accuracy and MAE a run
+records its wall time, per-stage timings, CV fold fit times, peak RSS,
+model size on disk and single-patient inference latency, so training or
+serving slowdowns show up next to accuracy changes. The old
+model_performance_history.json is imported into the ledger on first use.
+
+Scores are cross-validated unless a run has score_basis 'new_rows': an
+incremental update scores the saved models on the rows it adds (a small
+holdout), and keeps the last search's CV scores as search_lens_accuracy /
+search_vault_mae.
+
+Usage:
+    python scripts/training/track_performance.py              # progress + trend
+    python scripts/training/track_performance.py runs [--last N] [--script NAME]
+    python scripts/training/track_performance.py compare [RUN_A] [RUN_B]
+    python scripts/training/track_performance.py stages [--last N]
 """
 
-import pandas as pd
+import argparse
+import hashlib
 import json
 import os
+import sys
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 
 HISTORY_FILE = "model_performance_history.json"
+LEDGER_FILE = "model_runs.jsonl"
+LEDGER_VERSION = 1
+
+# compare: flag a slowdown / growth beyond these ratios as a regression
+SLOWER_THRESHOLD = 1.20
+LATENCY_REPEATS = 50
 
 
 def load_history():
-    """Load performance history from file."""
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    """All recorded runs, oldest first (imports the JSON history once)."""
+    if not os.path.exists(LEDGER_FILE) and os.path.exists(HISTORY_FILE):
+        _import_history()
+    runs = []
+    if os.path.exists(LEDGER_FILE):
+        with open(LEDGER_FILE, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    print(f"Warning: Skipping unreadable ledger line {line_no} in {LEDGER_FILE}")
+    return runs
 
 
-def save_run(num_cases, lens_accuracy, vault_mae, notes=""):
-    """Save performance metrics from a training run."""
-    history = load_history()
-    
+def _import_history():
+    with open(HISTORY_FILE, 'r') as f:
+        history = json.load(f)
+    for i, run in enumerate(history, 1):
+        _append({'version': LEDGER_VERSION, 'run_id': f"history-{i:03d}",
+                 'script': 'train_model', 'source': 'history', **run})
+    print(f"Imported {len(history)} runs from {HISTORY_FILE} into {LEDGER_FILE}")
+
+
+def _append(entry):
+    line = json.dumps(entry, sort_keys=True, default=float) + "\n"
+    # One write per run in append mode: earlier lines are never touched
+    with open(LEDGER_FILE, 'a', encoding='utf-8') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB."""
+    if resource is None:
+        return None
+    kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+             resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return kb / (1024 * 1024) if sys.platform == 'darwin' else kb / 1024
+
+
+def files_size(paths):
+    """Total bytes on disk of the existing `paths`."""
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def data_fingerprint(X, *targets):
+    """Short hash of the training matrix and targets (spots reruns on identical data)."""
+    hasher = hashlib.sha256(np.ascontiguousarray(np.asarray(X, dtype=float)).tobytes())
+    for y in targets:
+        hasher.update(np.asarray(y).astype(str).astype('U').tobytes())
+    return hasher.hexdigest()[:12]
+
+
+def inference_ms(model, scaler, row, repeats=LATENCY_REPEATS):
+    """Median milliseconds to scale and predict one patient (one-row frame)."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(scaler.transform(row))
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+class RunRecorder:
+    """
+    Collects timings and resource figures for one training run.
+
+    Usage:
+        recorder = RunRecorder('train_model')
+        with recorder.stage('load'):
+            ...
+        save_run(num_cases, acc, mae, recorder=recorder)
+    """
+
+    def __init__(self, script, mode='full'):
+        self.script = script
+        self.mode = mode
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.metrics = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(self.stages.get(name, 0.0) + time.perf_counter() - start, 3)
+
+    def record_cv(self, results):
+        """Per-fold fit times from cv_engine results ({task: TaskResult})."""
+        self.metrics['cv_fold_seconds'] = {
+            f"{task}/{model}": [round(s, 3) for s in seconds]
+            for task, result in results.items()
+            for model, seconds in result.fold_seconds.items()
+        }
+
+    def summary(self):
+        return {
+            'run_id': f"{self.started:%Y%m%d-%H%M%S}-{os.getpid()}",
+            'script': self.script,
+            'mode': self.mode,
+            'wall_seconds': round(time.perf_counter() - self.start, 3),
+            'stages': dict(self.stages),
+            'peak_rss_mb': peak_rss_mb(),
+            **self.metrics,
+        }
+
+
+def save_run(num_cases, lens_accuracy, vault_mae, notes="", recorder=None, **metrics):
+    """Append one training run to the ledger."""
+    load_history()  # imports the JSON history before the first new run
     run = {
+        'version': LEDGER_VERSION,
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'training_cases': num_cases,
         'lens_size_accuracy': lens_accuracy,
         'vault_mae': vault_mae,
-        'notes': notes
+        'notes': notes,
+        'source': 'train',
     }
-    
-    history.append(run)
-    
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(history, f, indent=2)
-    
+    if recorder is not None:
+        run.update(recorder.summary())
+    run.update(metrics)
+    run.setdefault('run_id', f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+    _append(run)
+
     print(f"\n✅ Logged training run: {num_cases} cases, {lens_accuracy:.1%} acc, {vault_mae:.1f}µm MAE")
+    if run.get('wall_seconds') is not None:
+        print(f"   Wall time {run['wall_seconds']:.1f}s, peak RSS {_fmt(run.get('peak_rss_mb'), '.0f')} MB "
+              f"→ {LEDGER_FILE}")
+
+
+def _runs_frame(runs=None):
+    df = pd.DataFrame(runs if runs is not None else load_history())
+    for col in ['wall_seconds', 'peak_rss_mb', 'mode', 'score_basis', 'scored_rows',
+                'search_lens_accuracy', 'search_vault_mae']:
+        if col not in df.columns:
+            df[col] = None
+    return df
+
+
+def _collapse_reruns(df):
+    """Drop runs that repeat the previous run's cases and scores exactly."""
+    keys = df[['training_cases', 'lens_size_accuracy', 'vault_mae']].round(6)
+    repeat = (keys == keys.shift()).all(axis=1)
+    return df[~repeat], int(repeat.sum())
+
+
+def _score_basis(run):
+    """How a run's accuracy / MAE were measured: 'cv' or 'new_rows'."""
+    basis = run.get('score_basis')
+    return 'cv' if basis is None or (isinstance(basis, float) and np.isnan(basis)) else basis
+
+
+def _fmt(value, spec, suffix=""):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "-"
+    return f"{value:{spec}}{suffix}"
 
 
 def show_progress():
     """Display performance progress over time."""
     history = load_history()
-    
+
     if not history:
         print("No training history yet. Run train_model.py first!")
         return
-    
+
     print("\n" + "="*80)
     print("MODEL LEARNING PROGRESS")
     print("="*80)
-    
-    df = pd.DataFrame(history)
-    
+
+    df, repeats = _collapse_reruns(_runs_frame(history))
+
     print("\nAll Training Runs:")
+    if repeats:
+        print(f"({repeats} reruns with identical results not shown)")
     print("-"*80)
-    for idx, row in df.iterrows():
-        print(f"Run {idx+1}: {row['timestamp']}")
-        print(f"  Cases: {row['training_cases']}")
-        print(f"  Lens Size Accuracy: {row['lens_size_accuracy']:.1%}")
-        print(f"  Vault MAE: {row['vault_mae']:.1f} µm")
-        if row['notes']:
-            print(f"  Notes: {row['notes']}")
+    for idx, row in enumerate(df.itertuples(index=False), 1):
+        print(f"Run {idx}: {row.timestamp}")
+        print(f"  Cases: {row.training_cases}")
+        print(f"  Lens Size Accuracy: {row.lens_size_accuracy:.1%}")
+        print(f"  Vault MAE: {row.vault_mae:.1f} µm")
+        if _score_basis(row._asdict()) == 'new_rows':
+            print(f"  (scored on {row.scored_rows:.0f} new rows, not cross-validated; "
+                  f"last search: {row.search_lens_accuracy:.1%}, {row.search_vault_mae:.1f} µm)")
+        if row.wall_seconds is not None and not pd.isna(row.wall_seconds):
+            print(f"  Training: {row.wall_seconds:.1f}s wall, "
+                  f"{_fmt(row.peak_rss_mb, '.0f')} MB peak RSS ({row.mode})")
+        if row.notes:
+            print(f"  Notes: {row.notes}")
         print()
-    
-    # Show improvement
-    if len(df) > 1:
-        first_run = df.iloc[0]
-        last_run = df.iloc[-1]
-        
+
+    # Show improvement (cross-validated runs only)
+    cv_runs = df[[_score_basis(run) == 'cv' for run in df.to_dict('records')]]
+    if len(cv_runs) > 1:
+        first_run = cv_runs.iloc[0]
+        last_run = cv_runs.iloc[-1]
+
         print("="*80)
         print("IMPROVEMENT SUMMARY")
         print("="*80)
-        
+
         cases_added = last_run['training_cases'] - first_run['training_cases']
         acc_improvement = (last_run['lens_size_accuracy'] - first_run['lens_size_accuracy']) * 100
         mae_improvement = first_run['vault_mae'] - last_run['vault_mae']
-        
+
         print(f"\nFrom first run ({first_run['timestamp']}) to now:")
         print(f"  📊 Data Growth:        +{cases_added} cases ({first_run['training_cases']} → {last_run['training_cases']})")
         print(f"  📈 Lens Accuracy:      {acc_improvement:+.1f}% ({first_run['lens_size_accuracy']:.1%} → {last_run['lens_size_accuracy']:.1%})")
         print(f"  📉 Vault MAE:          {mae_improvement:+.1f}µm ({first_run['vault_mae']:.1f} → {last_run['vault_mae']:.1f}µm)")
-        
+
         if acc_improvement > 0 or mae_improvement > 0:
             print("\n✅ MODEL IS LEARNING! Performance improving with more data.")
         else:
@@ -95,45 +278,177 @@ def show_progress():
 
 def plot_progress():
     """Create a simple visualization of progress."""
-    history = load_history()
-    
-    if len(history) < 2:
+    df, _ = _collapse_reruns(_runs_frame())
+
+    if len(df) < 2:
         print("\nNeed at least 2 training runs to show progress chart.")
         return
-    
-    df = pd.DataFrame(history)
-    
+
     print("\n" + "="*80)
     print("PERFORMANCE TREND")
     print("="*80)
-    print("\nLens Size Accuracy over time:")
-    
-    max_acc = df['lens_size_accuracy'].max()
-    for idx, row in df.iterrows():
-        acc = row['lens_size_accuracy']
-        bar_length = int((acc / max_acc) * 50)
-        bar = '█' * bar_length
-        print(f"  Run {idx+1} ({row['training_cases']:3d} cases): {bar} {acc:.1%}")
-    
-    print("\nVault MAE over time (lower is better):")
-    max_mae = df['vault_mae'].max()
-    for idx, row in df.iterrows():
-        mae = row['vault_mae']
-        bar_length = int((mae / max_mae) * 50)
-        bar = '█' * bar_length
-        print(f"  Run {idx+1} ({row['training_cases']:3d} cases): {bar} {mae:.1f}µm")
 
+    charts = [
+        ("Lens Size Accuracy over time:", 'lens_size_accuracy', lambda v: f"{v:.1%}"),
+        ("Vault MAE over time (lower is better):", 'vault_mae', lambda v: f"{v:.1f}µm"),
+        ("Training wall time (lower is better):", 'wall_seconds', lambda v: f"{v:.1f}s"),
+    ]
+    for title, col, fmt in charts:
+        values = pd.to_numeric(df[col], errors='coerce')
+        if values.notna().sum() == 0:
+            continue
+        print(f"\n{title}")
+        max_value = values.max()
+        for idx, (cases, value) in enumerate(zip(df['training_cases'], values), 1):
+            if pd.isna(value):
+                continue
+            bar = '█' * int((value / max_value) * 50)
+            print(f"  Run {idx} ({cases:3d} cases): {bar} {fmt(value)}")
+
+
+def print_runs(last=20, script=None, as_json=False):
+    """Table of recent runs: accuracy next to training / serving cost."""
+    runs = [run for run in load_history() if not script or run.get('script') == script][-last:]
+    if as_json:
+        print(json.dumps(runs, indent=2))
+        return
+    if not runs:
+        print("No matching runs.")
+        return
+
+    print(f"\n{'Run':<24} {'Cases':>5} {'Acc':>6} {'MAE':>7} {'Wall':>7} {'RSS':>6} "
+          f"{'Size':>8} {'Lens ms':>8} {'Vault ms':>8}  Mode")
+    for row in runs:
+        latency = row.get('inference_ms') or {}
+        size = row.get('model_bytes')
+        print(f"{row['run_id']:<24} {row['training_cases']:>5} "
+              f"{row['lens_size_accuracy']:>6.1%} {row['vault_mae']:>6.1f}µ "
+              f"{_fmt(row.get('wall_seconds'), '.1f', 's'):>7} "
+              f"{_fmt(row.get('peak_rss_mb'), '.0f', 'M'):>6} "
+              f"{_fmt(size / 1024 if size else None, '.0f', 'K'):>8} "
+              f"{_fmt(latency.get('lens_size'), '.2f'):>8} {_fmt(latency.get('vault'), '.2f'):>8}  "
+              f"{row.get('mode') or '-'}")
+
+
+def _find_run(runs, run_id):
+    matches = [run for run in runs if str(run.get('run_id', '')).startswith(run_id)]
+    if not matches:
+        print(f"❌ No run matching '{run_id}'")
+        sys.exit(1)
+    return matches[-1]
 
-if __name__ == '__main__':
-    show_progress()
-    plot_progress()
 
+def compare_runs(run_a=None, run_b=None):
+    """Side-by-side diff of two runs (default: the last two recorded)."""
+    runs = load_history()
+    if run_a and run_b:
+        a, b = _find_run(runs, run_a), _find_run(runs, run_b)
+    elif run_a:
+        a, b = _find_run(runs, run_a), runs[-1]
+    elif len(runs) >= 2:
+        a, b = runs[-2], runs[-1]
+    else:
+        print("Need at least 2 runs to compare.")
+        return
+
+    print(f"\n{'':<26} {str(a.get('run_id')):>24} {str(b.get('run_id')):>24}")
+    print(f"{'Scored on':<26} {_score_basis(a):>24} {_score_basis(b):>24}")
+    same_basis = _score_basis(a) == _score_basis(b)
+    rows = [
+        ('Training cases', 'training_cases', 'd', None),
+        ('Lens accuracy', 'lens_size_accuracy', '.1%', 'higher'),
+        ('Vault MAE (µm)', 'vault_mae', '.1f', 'lower'),
+        ('Wall time (s)', 'wall_seconds', '.1f', 'cost'),
+        ('Peak RSS (MB)', 'peak_rss_mb', '.0f', 'cost'),
+        ('Model size (KB)', 'model_bytes', '.0f', 'cost'),
+    ]
+    flagged = []
+    for label, key, spec, better in rows:
+        va, vb = a.get(key), b.get(key)
+        if key == 'model_bytes':
+            va, vb = (va / 1024 if va else None), (vb / 1024 if vb else None)
+        print(f"{label:<26} {_fmt(va, spec):>24} {_fmt(vb, spec):>24}")
+        if better in ('higher', 'lower') and not same_basis:
+            continue            # CV scores and a new-row holdout aren't comparable
+        flagged += _regression(label, va, vb, better)
+
+    stages = sorted(set(a.get('stages') or {}) | set(b.get('stages') or {}))
+    for name in stages:
+        va, vb = (a.get('stages') or {}).get(name), (b.get('stages') or {}).get(name)
+        print(f"{'  stage ' + name + ' (s)':<26} {_fmt(va, '.2f'):>24} {_fmt(vb, '.2f'):>24}")
+        flagged += _regression(f"stage {name}", va, vb, 'cost')
+    for target in ('lens_size', 'vault'):
+        va = (a.get('inference_ms') or {}).get(target)
+        vb = (b.get('inference_ms') or {}).get(target)
+        print(f"{'  ' + target + ' inference (ms)':<26} {_fmt(va, '.3f'):>24} {_fmt(vb, '.3f'):>24}")
+        flagged += _regression(f"{target} inference", va, vb, 'cost')
+
+    if not same_basis:
+        print("\nℹ️  Scores were measured differently (CV vs new rows) and are not compared")
+    if flagged:
+        print("\n⚠️  Regressions:")
+        for line in flagged:
+            print(f"   - {line}")
+    else:
+        print("\n✅ No regressions between these runs")
 
 
+def _regression(label, va, vb, better):
+    """
+    Regression note for one compared value, as a list (empty if none).
+
+    Scores regress on any change in the wrong direction; costs (time,
+    memory, size) only when they grow by more than SLOWER_THRESHOLD,
+    since timings vary from run to run.
+    """
+    if better is None or va is None or vb is None:
+        return []
+    if (better == 'higher' and vb < va) or (better == 'lower' and vb > va):
+        return [f"{label}: {va:.3g} → {vb:.3g}"]
+    if better == 'cost' and va > 0 and vb > va * SLOWER_THRESHOLD:
+        return [f"{label}: {va:.3g} → {vb:.3g} (+{vb / va - 1:.0%})"]
+    return []
 
 
+def print_stages(last=10):
+    """Per-stage training time of recent runs."""
+    runs = [run for run in load_history() if run.get('stages')][-last:]
+    if not runs:
+        print("No runs with stage timings yet.")
+        return
+    names = []
+    for run in runs:
+        names += [name for name in run['stages'] if name not in names]
+    print(f"\n{'Run':<24} " + " ".join(f"{name:>14}" for name in names) + f" {'wall':>8}")
+    for run in runs:
+        cells = " ".join(f"{_fmt(run['stages'].get(name), '.2f', 's'):>14}" for name in names)
+        print(f"{run['run_id']:<24} {cells} {_fmt(run.get('wall_seconds'), '.1f', 's'):>8}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Query the training-run ledger")
+    sub = parser.add_subparsers(dest='command')
+    runs = sub.add_parser('runs', help="recent runs with timing, memory, size and latency")
+    runs.add_argument('--last', type=int, default=20)
+    runs.add_argument('--script', help="only runs of this training script")
+    runs.add_argument('--json', action='store_true', help="print the runs as JSON")
+    compare = sub.add_parser('compare', help="diff two runs and flag regressions")
+    compare.add_argument('run_a', nargs='?', help="run id (prefix); default: second to last")
+    compare.add_argument('run_b', nargs='?', help="run id (prefix); default: last")
+    stages = sub.add_parser('stages', help="per-stage timings of recent runs")
+    stages.add_argument('--last', type=int, default=10)
+    args = parser.parse_args()
 
+    if args.command == 'runs':
+        print_runs(args.last, args.script, args.json)
+    elif args.command == 'compare':
+        compare_runs(args.run_a, args.run_b)
+    elif args.command == 'stages':
+        print_stages(args.last)
+    else:
+        show_progress()
+        plot_progress()
 
 
+if __name__ == '__main__':
+    main()
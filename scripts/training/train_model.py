@@ -6,12 +6,26 @@ Trains models to predict:
 1. Lens Size (classification - discrete sizes like 12.6, 13.2, 13.7)
 2. Vault (regression - continuous measurement)
 
-Uses cross-validation due to small dataset size (56 cases).
+Uses cross-validation due to small dataset size (56 cases). All candidate
+models for both targets are cross-validated in one parallel pool
+(cv_engine.py), using every core.
+
+With --incremental, new training rows are added to the saved models by
+warm-starting them (incremental.py); the full model search only runs when
+the data changed in other ways, drifted, or the models got worse.
+
+Every run is appended to the run ledger (track_performance.py) with its
+stage timings, CV fold times, peak memory, model size and inference
+latency.
 """
 
+import argparse
+import sys
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import cross_val_score, cross_val_predict, KFold
+from sklearn.model_selection import KFold
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
 from sklearn.linear_model import Ridge, Lasso
@@ -24,34 +38,16 @@ import pickle
 import warnings
 warnings.filterwarnings('ignore')
 
+# Appended, so sibling modules win over the legacy copies in the repo
+# root (e.g. track_performance.py)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
 # Import performance tracking
-from track_performance import save_run
-from scripts.pipeline.feature_config import TRAINING_FEATURES
-
-
-def get_nomogram_size(wtw, acd):
-    """Implementation of the sizing nomogram from the provided table."""
-    if wtw < 10.5 or wtw >= 13.0:
-        return 0.0
-    
-    if 10.5 <= wtw < 10.7:
-        return 12.1 if acd > 3.5 else 0.0
-    elif 10.7 <= wtw < 11.1:
-        return 12.1
-    elif 11.1 <= wtw < 11.2:
-        return 12.6 if acd > 3.5 else 12.1
-    elif 11.2 <= wtw < 11.5:
-        return 12.6
-    elif 11.5 <= wtw < 11.7:
-        return 13.2 if acd > 3.5 else 12.6
-    elif 11.7 <= wtw < 12.2:
-        return 13.2
-    elif 12.2 <= wtw < 12.3:
-        return 13.7 if acd > 3.5 else 13.2
-    elif 12.3 <= wtw < 13.0:
-        return 13.7
-    
-    return 0.0
+from track_performance import RunRecorder, save_run, files_size, inference_ms, data_fingerprint  # noqa: E402
+from cv_engine import CVTask, run_tasks  # noqa: E402
+import incremental  # noqa: E402
+from scripts.pipeline.feature_config import TRAINING_FEATURES  # noqa: E402
+from scripts.pipeline.training_dataset import GESTALT_FEATURES, load_training_data, complete_cases  # noqa: E402
 
 
 def load_and_prepare_data():
@@ -60,15 +56,14 @@ def load_and_prepare_data():
     print("LOADING TRAINING DATA")
     print("="*70)
     
-    df = pd.read_csv('data/processed/training_data.csv')
-    
-    # Use the same feature list as preprocessing gates
-    feature_cols = TRAINING_FEATURES
+    # Use the same feature list as preprocessing gates, plus the
+    # precomputed gestalt features from the typed dataset
+    feature_cols = TRAINING_FEATURES + GESTALT_FEATURES
     target_cols = ['Lens_Size', 'Vault']
+    df = load_training_data(feature_cols + target_cols)
     
     # Filter complete cases
-    complete = df[feature_cols + target_cols].notna().all(axis=1)
-    df_complete = df[complete].copy()
+    df_complete = complete_cases(df, TRAINING_FEATURES + target_cols)
     
     # Standardize Lens_Size (fix negative values like -12.6 -> 12.6)
     df_complete['Lens_Size'] = df_complete['Lens_Size'].abs()
@@ -77,71 +72,6 @@ def load_and_prepare_data():
     valid_lens = (df_complete['Lens_Size'] > 0) & (df_complete['Lens_Size'] < 20)
     df_complete = df_complete[valid_lens].copy()
     
-    # --- ADD ADVANCED GESTALT CLINICAL FEATURES ---
-    # 1. WTW Buckets (based on real patient distribution)
-    df_complete['WTW_Bucket'] = pd.cut(df_complete['WTW'], 
-                                     bins=[0, 11.6, 11.9, 12.4, 20], 
-                                     labels=[0, 1, 2, 3]).astype(int)
-    
-    # 2. ACD Buckets
-    df_complete['ACD_Bucket'] = pd.cut(df_complete['ACD_internal'], 
-                                     bins=[0, 3.1, 3.3, 10], 
-                                     labels=[0, 1, 2]).astype(int)
-    
-    # 3. Shape Ratio Buckets (Major decision point at 62.5)
-    df_complete['Shape_Bucket'] = pd.cut(df_complete['AC_shape_ratio'],
-                                       bins=[0, 58, 62.5, 68, 300],
-                                       labels=[0, 1, 2, 3]).astype(int)
-    
-    # 4. Interaction Features
-    df_complete['Space_Volume'] = df_complete['WTW'] * df_complete['ACD_internal']
-    df_complete['Aspect_Ratio'] = df_complete['WTW'] / df_complete['ACD_internal']
-    df_complete['Power_Density'] = abs(df_complete['ICL_Power']) / df_complete['ACV']
-    
-    # 5. NEW ADVANCED GESTALT FEATURES
-    # User Nuance: High Power + Deep ACD often means 13.7
-    df_complete['High_Power_Deep_ACD'] = ((abs(df_complete['ICL_Power']) > 14) & 
-                                         (df_complete['ACD_internal'] > 3.3)).astype(int)
-    
-    # Chamber Tightness: Volume per mm of diameter (Excellent linear progression with size)
-    df_complete['Chamber_Tightness'] = df_complete['ACV'] / df_complete['WTW']
-    
-    # Curvature-Depth Ratio: How steep is the cornea relative to the chamber depth
-    df_complete['Curvature_Depth_Ratio'] = df_complete['SimK_steep'] / df_complete['ACD_internal']
-    
-    # 6. ROTATIONAL & AGE GESTALT
-    # Stability Risk: High astigmatism in a larger eye often gets a larger lens to prevent rotation
-    df_complete['Stability_Risk'] = ((df_complete['TCRP_Astigmatism'] > 1.5) & 
-                                    (df_complete['WTW'] > 12.0)).astype(int)
-    
-    # Age-Space Constraint: Relative space loss due to crystalline lens thickening
-    df_complete['Age_Space_Ratio'] = df_complete['Age'] / df_complete['ACD_internal']
-    
-    # 7. NOMOGRAM FEATURE (from user sizing table)
-    df_complete['Nomogram_Size'] = df_complete.apply(
-        lambda row: get_nomogram_size(row['WTW'], row['ACD_internal']), axis=1
-    )
-    
-    # 8. NOMOGRAM DEVIATION GESTALT (Learning "Conservative Sizing")
-    # Rule 1: Volume Constraint - Lower size if chamber volume is tight (<170)
-    df_complete['Volume_Constraint'] = ((df_complete['Nomogram_Size'] > 12.1) & 
-                                       (df_complete['ACV'] < 170)).astype(int)
-    
-    # Rule 2: Steep Eye Adjustment - Lower size if cornea is very steep (>46D)
-    df_complete['Steep_Eye_Adjustment'] = ((df_complete['Nomogram_Size'] > 12.1) & 
-                                          (df_complete['SimK_steep'] > 46.0)).astype(int)
-    
-    # Rule 3: Safety Downsize - Tendency to drop from 13.2 to 12.6 when power is moderate
-    df_complete['Safety_Downsize_Flag'] = ((df_complete['Nomogram_Size'] == 13.2) & 
-                                          (abs(df_complete['ICL_Power']) < 10.0)).astype(int)
-    
-    # Update feature list
-    feature_cols += ['WTW_Bucket', 'ACD_Bucket', 'Shape_Bucket', 
-                    'Space_Volume', 'Aspect_Ratio', 'Power_Density',
-                    'High_Power_Deep_ACD', 'Chamber_Tightness', 'Curvature_Depth_Ratio',
-                    'Stability_Risk', 'Age_Space_Ratio', 'Nomogram_Size',
-                    'Volume_Constraint', 'Steep_Eye_Adjustment', 'Safety_Downsize_Flag']
-    
     # Convert Lens_Size to string for classification
     df_complete['Lens_Size'] = df_complete['Lens_Size'].astype(str)
     
@@ -156,8 +86,8 @@ def load_and_prepare_data():
     X = df_complete[feature_cols].copy()
     
     # Targets
-    y_lens = df_complete['Lens_Size'].values
-    y_vault = df_complete['Vault'].values
+    y_lens = df_complete['Lens_Size'].to_numpy(dtype=object)
+    y_vault = df_complete['Vault'].to_numpy()
     
     print(f"\nFeature matrix shape: {X.shape}")
     print(f"Target distributions:")
@@ -167,18 +97,19 @@ def load_and_prepare_data():
     return X, y_lens, y_vault, df_complete
 
 
-def train_lens_size_model(X, y):
-    """Train Lens Size prediction model (classification)."""
-    print("\n" + "="*70)
-    print("TRAINING LENS SIZE CLASSIFIER")
-    print("="*70)
-    
-    # Standardize features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    # Try multiple models
-    models = {
+# Cross-validation (5-fold), shared by both targets
+CV = KFold(n_splits=5, shuffle=True, random_state=42)
+
+# Joblib workers for cross-validation (-1 = all cores)
+N_JOBS = -1
+
+MODEL_FILES = ['lens_size_model.pkl', 'lens_size_scaler.pkl', 'vault_model.pkl',
+               'vault_scaler.pkl', 'feature_names.pkl']
+
+
+def lens_size_candidates():
+    """Candidate Lens Size classifiers."""
+    return {
         'Random Forest': RandomForestClassifier(
             n_estimators=150, 
             max_depth=5,
@@ -194,33 +125,72 @@ def train_lens_size_model(X, y):
             random_state=42
         )
     }
-    
-    # Cross-validation (5-fold)
-    cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    
-    best_model = None
-    best_score = 0
-    best_name = None
+
+
+def vault_candidates():
+    """Candidate Vault regressors."""
+    return {
+        'Random Forest': RandomForestRegressor(
+            n_estimators=100,
+            max_depth=4,
+            min_samples_split=5,
+            random_state=42
+        ),
+        'Gradient Boosting': GradientBoostingRegressor(
+            n_estimators=50,
+            max_depth=3,
+            learning_rate=0.1,
+            random_state=42
+        ),
+        'Ridge Regression': Ridge(alpha=1.0)
+    }
+
+
+def cross_validate_models(X, y_lens, y_vault, n_jobs=N_JOBS):
+    """
+    Evaluate every candidate for both targets in one parallel pool.
+
+    Returns ({'lens_size': TaskResult, 'vault': TaskResult}, scalers) with
+    each task's winner already refitted on the full dataset.
+    """
+    scalers = {'lens_size': StandardScaler(), 'vault': StandardScaler()}
+    tasks = {
+        'lens_size': CVTask(lens_size_candidates(), scalers['lens_size'].fit_transform(X),
+                            y_lens, CV, accuracy_score),
+        'vault': CVTask(vault_candidates(), scalers['vault'].fit_transform(X),
+                        y_vault, CV, mean_absolute_error, greater_is_better=False),
+    }
+    n_fits = sum(len(task.models) * CV.get_n_splits() for task in tasks.values())
+    print(f"\nCross-validating {n_fits} (model, fold) fits in parallel (n_jobs={n_jobs})...")
+    return run_tasks(tasks, n_jobs=n_jobs), scalers
+
+
+def print_top_features(model, feature_names):
+    if hasattr(model, 'feature_importances_'):
+        print("\nTop 5 Most Important Features:")
+        importances = model.feature_importances_
+        indices = np.argsort(importances)[::-1][:5]
+        
+        for i, idx in enumerate(indices, 1):
+            print(f"  {i}. {feature_names[idx]:20s}: {importances[idx]:.4f}")
+
+
+def train_lens_size_model(X, y, result, scaler):
+    """Report the Lens Size classifier selection (classification)."""
+    print("\n" + "="*70)
+    print("TRAINING LENS SIZE CLASSIFIER")
+    print("="*70)
     
     print("\nCross-validation results:")
-    for name, model in models.items():
-        scores = cross_val_score(model, X_scaled, y, cv=cv, scoring='accuracy')
-        mean_score = scores.mean()
-        std_score = scores.std()
-        
-        print(f"  {name:20s}: {mean_score:.3f} ± {std_score:.3f}")
-        
-        if mean_score > best_score:
-            best_score = mean_score
-            best_model = model
-            best_name = name
+    for name, scores in result.scores.items():
+        print(f"  {name:20s}: {scores.mean():.3f} ± {scores.std():.3f}")
     
-    # Train best model on full dataset
+    # Best model, already trained on the full dataset
+    best_name, best_score, best_model = result.best_name, result.best_score, result.best_model
     print(f"\nBest model: {best_name} (Accuracy: {best_score:.3f})")
-    best_model.fit(X_scaled, y)
     
-    # Get predictions for detailed evaluation
-    y_pred = cross_val_predict(best_model, X_scaled, y, cv=cv)
+    # Out-of-fold predictions from the cross-validation fits
+    y_pred = result.predictions[best_name].oof
     
     print("\nDetailed Classification Report:")
     print(classification_report(y, y_pred, zero_division=0))
@@ -228,78 +198,29 @@ def train_lens_size_model(X, y):
     print("\nConfusion Matrix:")
     print(confusion_matrix(y, y_pred))
     
-    # Feature importance (if available)
-    if hasattr(best_model, 'feature_importances_'):
-        print("\nTop 5 Most Important Features:")
-        importances = best_model.feature_importances_
-        feature_names = X.columns
-        indices = np.argsort(importances)[::-1][:5]
-        
-        for i, idx in enumerate(indices, 1):
-            print(f"  {i}. {feature_names[idx]:20s}: {importances[idx]:.4f}")
+    print_top_features(best_model, X.columns)
     
     return best_model, scaler, best_name, best_score
 
 
-def train_vault_model(X, y):
-    """Train Vault prediction model (regression)."""
+def train_vault_model(X, y, result, scaler):
+    """Report the Vault regressor selection (regression)."""
     print("\n" + "="*70)
     print("TRAINING VAULT REGRESSOR")
     print("="*70)
     
-    # Standardize features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    # Try multiple models
-    models = {
-        'Random Forest': RandomForestRegressor(
-            n_estimators=100,
-            max_depth=4,
-            min_samples_split=5,
-            random_state=42
-        ),
-        'Gradient Boosting': GradientBoostingRegressor(
-            n_estimators=50,
-            max_depth=3,
-            learning_rate=0.1,
-            random_state=42
-        ),
-        'Ridge Regression': Ridge(alpha=1.0)
-    }
-    
-    # Cross-validation (5-fold)
-    cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    
-    best_model = None
-    best_mae = float('inf')
-    best_name = None
-    
     print("\nCross-validation results (MAE = Mean Absolute Error):")
-    for name, model in models.items():
-        # Negative MAE because sklearn maximizes scores
-        scores = cross_val_score(model, X_scaled, y, cv=cv, 
-                                 scoring='neg_mean_absolute_error')
-        mae = -scores.mean()
-        std = scores.std()
-        
-        # Also get R²
-        r2_scores = cross_val_score(model, X_scaled, y, cv=cv, scoring='r2')
-        r2 = r2_scores.mean()
-        
-        print(f"  {name:20s}: MAE={mae:.1f}µm ± {std:.1f}, R²={r2:.3f}")
-        
-        if mae < best_mae:
-            best_mae = mae
-            best_model = model
-            best_name = name
+    for name, predictions in result.predictions.items():
+        mae_scores = result.scores[name]
+        r2 = predictions.fold_scores(r2_score).mean()
+        print(f"  {name:20s}: MAE={mae_scores.mean():.1f}µm ± {mae_scores.std():.1f}, R²={r2:.3f}")
     
-    # Train best model on full dataset
+    # Best model, already trained on the full dataset
+    best_name, best_mae, best_model = result.best_name, result.best_score, result.best_model
     print(f"\nBest model: {best_name} (MAE: {best_mae:.1f}µm)")
-    best_model.fit(X_scaled, y)
     
-    # Get predictions for detailed evaluation
-    y_pred = cross_val_predict(best_model, X_scaled, y, cv=cv)
+    # Out-of-fold predictions from the cross-validation fits
+    y_pred = result.predictions[best_name].oof
     
     mae = mean_absolute_error(y, y_pred)
     rmse = np.sqrt(mean_squared_error(y, y_pred))
@@ -317,15 +238,7 @@ def train_vault_model(X, y):
     print(f"  Within ±100µm: {within_100}/{len(y)} ({within_100/len(y)*100:.1f}%)")
     print(f"  Within ±200µm: {within_200}/{len(y)} ({within_200/len(y)*100:.1f}%)")
     
-    # Feature importance (if available)
-    if hasattr(best_model, 'feature_importances_'):
-        print("\nTop 5 Most Important Features:")
-        importances = best_model.feature_importances_
-        feature_names = X.columns
-        indices = np.argsort(importances)[::-1][:5]
-        
-        for i, idx in enumerate(indices, 1):
-            print(f"  {i}. {feature_names[idx]:20s}: {importances[idx]:.4f}")
+    print_top_features(best_model, X.columns)
     
     return best_model, scaler, best_name, best_mae
 
@@ -336,13 +249,9 @@ def save_models(lens_model, lens_scaler, vault_model, vault_scaler, feature_name
     print("SAVING MODELS")
     print("="*70)
     
-    models_to_save = {
-        'lens_size_model.pkl': lens_model,
-        'lens_size_scaler.pkl': lens_scaler,
-        'vault_model.pkl': vault_model,
-        'vault_scaler.pkl': vault_scaler,
-        'feature_names.pkl': list(feature_names)
-    }
+    models_to_save = dict(zip(MODEL_FILES, [
+        lens_model, lens_scaler, vault_model, vault_scaler, list(feature_names)
+    ]))
     
     for filename, obj in models_to_save.items():
         with open(filename, 'wb') as f:
@@ -352,27 +261,171 @@ def save_models(lens_model, lens_scaler, vault_model, vault_scaler, feature_name
     print("\n✅ Models saved successfully!")
 
 
+def load_models():
+    """Load the saved models and scalers (same order as MODEL_FILES)."""
+    models = []
+    for filename in MODEL_FILES:
+        with open(filename, 'rb') as f:
+            models.append(pickle.load(f))
+    return models
+
+
+def record_serving_metrics(recorder, X, lens_model, lens_scaler, vault_model, vault_scaler):
+    """Saved model size and single-patient prediction latency, for the run ledger."""
+    row = X.iloc[[0]]
+    with recorder.stage('latency'):
+        recorder.metrics['inference_ms'] = {
+            'lens_size': round(inference_ms(lens_model, lens_scaler, row), 4),
+            'vault': round(inference_ms(vault_model, vault_scaler, row), 4),
+        }
+    recorder.metrics['model_bytes'] = files_size(MODEL_FILES)
+
+
+def record_training_state(X, y_lens, y_vault, search, updates=0):
+    """Remember what the saved models were trained on, for --incremental."""
+    incremental.save_state({
+        'features': list(X.columns),
+        'rows': incremental.row_fingerprints(X, y_lens, y_vault),
+        'search': search,
+        'updates': updates,
+    }, MODEL_FILES)
+
+
+def incremental_update(X, y_lens, y_vault, recorder):
+    """
+    Add the new training rows to the saved models without a model search.
+
+    Returns True if the saved models are now up to date, False if a full
+    search is needed instead.
+    """
+    print("\n" + "="*70)
+    print("INCREMENTAL UPDATE")
+    print("="*70)
+    
+    with recorder.stage('plan'):
+        state = incremental.load_state()
+        fingerprints = incremental.row_fingerprints(X, y_lens, y_vault) if state else None
+    if state is None:
+        print("\n⚠️  No record of the saved models' training data → full search")
+        return False
+    
+    action, reason, new_rows = incremental.plan_update(state, X, fingerprints)
+    if action == 'none':
+        print(f"\n✅ Models are up to date ({reason})")
+        return True
+    if action == 'search':
+        print(f"\n⚠️  {reason} → full search")
+        return False
+    
+    with recorder.stage('check'):
+        lens_model, lens_scaler, vault_model, vault_scaler, _ = load_models()
+        X_lens, X_vault = lens_scaler.transform(X), vault_scaler.transform(X)
+        n_new = int(new_rows.sum())
+        
+        # The saved models have not seen the new rows: a small holdout check
+        lens_correct = np.asarray(y_lens[new_rows]) == lens_model.predict(X_lens[new_rows])
+        vault_errors = np.abs(np.asarray(y_vault[new_rows]) - vault_model.predict(X_vault[new_rows]))
+    print(f"\n{n_new} new rows. Saved models on them: "
+          f"Lens accuracy {lens_correct.mean():.1%}, Vault MAE {vault_errors.mean():.1f}µm")
+    regression = incremental.regression_reason(state, lens_correct, vault_errors)
+    if regression:
+        print(f"\n⚠️  {regression} → full search")
+        return False
+    
+    # Scalers stay fixed: the existing trees split on the scaled features
+    search = state['search']
+    updated = []
+    for name, model, X_scaled, y in [('lens_size', lens_model, X_lens, y_lens),
+                                     ('vault', vault_model, X_vault, y_vault)]:
+        before = incremental.tree_count(model)
+        n_trees = incremental.extra_trees(search['trees'][name] or 0, n_new, search['rows'])
+        with recorder.stage('warm_start'):
+            warm = incremental.add_trees(model, X_scaled, y, n_trees)
+            if warm is None:
+                model = model.fit(X_scaled, y)
+        if warm is None:
+            print(f"  {name}: refitted {type(model).__name__} on {len(y)} rows")
+        else:
+            model = warm
+            print(f"  {name}: {type(model).__name__} {before} → {incremental.tree_count(model)} trees")
+        updated.append(model)
+    lens_model, vault_model = updated
+    
+    with recorder.stage('save'):
+        save_models(lens_model, lens_scaler, vault_model, vault_scaler, X.columns)
+        record_training_state(X, y_lens, y_vault, search, updates=state['updates'] + 1)
+    record_serving_metrics(recorder, X, lens_model, lens_scaler, vault_model, vault_scaler)
+    
+    # No CV was run: the run's scores are the holdout check on the new rows,
+    # the last search's CV scores are kept under their own keys
+    save_run(
+        num_cases=len(X),
+        lens_accuracy=float(lens_correct.mean()),
+        vault_mae=float(vault_errors.mean()),
+        notes=(f"Incremental +{n_new} rows (scores: saved models on the new rows); "
+               f"Lens: {search['lens_model']}, Vault: {search['vault_model']}"),
+        recorder=recorder,
+        data_sha=data_fingerprint(X, y_lens, y_vault),
+        score_basis='new_rows',
+        scored_rows=n_new,
+        search_lens_accuracy=search['lens_accuracy'],
+        search_vault_mae=search['vault_mae'],
+    )
+    return True
+
+
 def main():
     """Main training pipeline."""
+    parser = argparse.ArgumentParser(description="ICL Vault Prediction - Model Training")
+    parser.add_argument('--incremental', action='store_true',
+                        help="warm-start the saved models on new rows instead of a full search "
+                             "when the data allows it")
+    args = parser.parse_args()
+    
     print("\n" + "="*70)
     print("ICL VAULT PREDICTION - MODEL TRAINING")
     print("="*70)
+    recorder = RunRecorder('train_model', mode='incremental' if args.incremental else 'full')
     
     # Load data
-    X, y_lens, y_vault, df_complete = load_and_prepare_data()
+    with recorder.stage('load'):
+        X, y_lens, y_vault, df_complete = load_and_prepare_data()
     
     if len(df_complete) == 0:
         print("\n❌ No complete training cases found!")
         return
     
-    # Train Lens Size model
-    lens_model, lens_scaler, lens_name, lens_score = train_lens_size_model(X, y_lens)
+    if args.incremental and incremental_update(X, y_lens, y_vault, recorder):
+        return
+    recorder.mode = 'full'
+    
+    # Cross-validate Lens Size and Vault candidates together
+    with recorder.stage('cross_validate'):
+        results, scalers = cross_validate_models(X, y_lens, y_vault)
+    recorder.record_cv(results)
+    
+    # Lens Size model
+    lens_model, lens_scaler, lens_name, lens_score = train_lens_size_model(
+        X, y_lens, results['lens_size'], scalers['lens_size'])
     
-    # Train Vault model
-    vault_model, vault_scaler, vault_name, vault_mae = train_vault_model(X, y_vault)
+    # Vault model
+    vault_model, vault_scaler, vault_name, vault_mae = train_vault_model(
+        X, y_vault, results['vault'], scalers['vault'])
     
     # Save models
-    save_models(lens_model, lens_scaler, vault_model, vault_scaler, X.columns)
+    with recorder.stage('save'):
+        save_models(lens_model, lens_scaler, vault_model, vault_scaler, X.columns)
+        record_training_state(X, y_lens, y_vault, {
+            'rows': len(X),
+            'stats': incremental.feature_stats(X),
+            'lens_accuracy': float(lens_score),
+            'vault_mae': float(vault_mae),
+            'lens_model': lens_name,
+            'vault_model': vault_name,
+            'trees': {'lens_size': incremental.tree_count(lens_model),
+                      'vault': incremental.tree_count(vault_model)},
+        })
+    record_serving_metrics(recorder, X, lens_model, lens_scaler, vault_model, vault_scaler)
     
     # Final summary
     print("\n" + "="*70)
@@ -399,7 +452,9 @@ def main():
         num_cases=len(df_complete),
         lens_accuracy=lens_score,
         vault_mae=vault_mae,
-        notes=f"Lens: {lens_name}, Vault: {vault_name}"
+        notes=f"Lens: {lens_name}, Vault: {vault_name}",
+        recorder=recorder,
+        data_sha=data_fingerprint(X, y_lens, y_vault),
     )
 
 
@@ -40,9 +40,13 @@ import warnings
 warnings.filterwarnings("ignore")
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
 DATA_PATH = PROJECT_ROOT / "data" / "processed" / "training_data.csv"
+DATASET_PATH = PROJECT_ROOT / "data" / "processed" / "training_data.parquet"
 ARCHIVE_DIR = PROJECT_ROOT / "models" / "archives" / "gestalt-18f-756c"
 
+from training_dataset import GESTALT_FEATURES, complete_cases, load_training_data  # noqa: E402
+
 BASE_FEATURES = [
     "Age", "WTW", "ACD_internal", "ICL_Power",
     "SimK_steep", "TCRP_Km", "TCRP_Astigmatism",
@@ -54,94 +58,27 @@ ACV_DEPENDENT = {
 }
 
 
-def get_nomogram_size(wtw, acd):
-    if wtw < 10.5 or wtw >= 13.0:
-        return 0.0
-    if 10.5 <= wtw < 10.7:
-        return 12.1 if acd > 3.5 else 0.0
-    if 10.7 <= wtw < 11.1:
-        return 12.1
-    if 11.1 <= wtw < 11.2:
-        return 12.6 if acd > 3.5 else 12.1
-    if 11.2 <= wtw < 11.5:
-        return 12.6
-    if 11.5 <= wtw < 11.7:
-        return 13.2 if acd > 3.5 else 12.6
-    if 11.7 <= wtw < 12.2:
-        return 13.2
-    if 12.2 <= wtw < 12.3:
-        return 13.7 if acd > 3.5 else 13.2
-    if 12.3 <= wtw < 13.0:
-        return 13.7
-    return 0.0
-
-
 def load_and_prepare():
     print("=" * 70)
     print("LOADING TRAINING DATA (No-ACV variant)")
     print("=" * 70)
 
-    df = pd.read_csv(DATA_PATH)
+    # Build feature list: 24f minus the 6 ACV-dependent ones = 18
+    all_24 = BASE_FEATURES + ["ACV", "AC_shape_ratio"] + GESTALT_FEATURES
+    feature_cols = [f for f in all_24 if f not in ACV_DEPENDENT]
 
     # Still require all 9 base features for training (we have ACV in training data,
     # we just don't use it as a feature)
     all_base = BASE_FEATURES + ["ACV", "AC_shape_ratio"]
     target_cols = ["Lens_Size", "Vault"]
-    complete = df[all_base + target_cols].notna().all(axis=1)
-    df_c = df[complete].copy()
+    df = load_training_data(
+        all_24 + target_cols, path=DATASET_PATH, csv_path=DATA_PATH,
+    )
+    df_c = complete_cases(df, all_base + target_cols)
 
     df_c["Lens_Size"] = df_c["Lens_Size"].abs()
     df_c = df_c[(df_c["Lens_Size"] > 0) & (df_c["Lens_Size"] < 20)].copy()
 
-    # ── Engineer ALL gestalt features (same as production) ──
-    df_c["WTW_Bucket"] = pd.cut(
-        df_c["WTW"], bins=[0, 11.6, 11.9, 12.4, 20], labels=[0, 1, 2, 3]
-    ).astype(int)
-    df_c["ACD_Bucket"] = pd.cut(
-        df_c["ACD_internal"], bins=[0, 3.1, 3.3, 10], labels=[0, 1, 2]
-    ).astype(int)
-    df_c["Shape_Bucket"] = pd.cut(
-        df_c["AC_shape_ratio"], bins=[0, 58, 62.5, 68, 300], labels=[0, 1, 2, 3]
-    ).astype(int)
-
-    df_c["Space_Volume"] = df_c["WTW"] * df_c["ACD_internal"]
-    df_c["Aspect_Ratio"] = df_c["WTW"] / df_c["ACD_internal"]
-    df_c["Power_Density"] = abs(df_c["ICL_Power"]) / df_c["ACV"]
-
-    df_c["High_Power_Deep_ACD"] = (
-        (abs(df_c["ICL_Power"]) > 14) & (df_c["ACD_internal"] > 3.3)
-    ).astype(int)
-    df_c["Chamber_Tightness"] = df_c["ACV"] / df_c["WTW"]
-    df_c["Curvature_Depth_Ratio"] = df_c["SimK_steep"] / df_c["ACD_internal"]
-
-    df_c["Stability_Risk"] = (
-        (df_c["TCRP_Astigmatism"] > 1.5) & (df_c["WTW"] > 12.0)
-    ).astype(int)
-    df_c["Age_Space_Ratio"] = df_c["Age"] / df_c["ACD_internal"]
-
-    df_c["Nomogram_Size"] = df_c.apply(
-        lambda r: get_nomogram_size(r["WTW"], r["ACD_internal"]), axis=1
-    )
-    df_c["Volume_Constraint"] = (
-        (df_c["Nomogram_Size"] > 12.1) & (df_c["ACV"] < 170)
-    ).astype(int)
-    df_c["Steep_Eye_Adjustment"] = (
-        (df_c["Nomogram_Size"] > 12.1) & (df_c["SimK_steep"] > 46.0)
-    ).astype(int)
-    df_c["Safety_Downsize_Flag"] = (
-        (df_c["Nomogram_Size"] == 13.2) & (abs(df_c["ICL_Power"]) < 10.0)
-    ).astype(int)
-
-    # ── Build feature list: 24f minus the 6 ACV-dependent ones = 18 ──
-    all_24 = BASE_FEATURES + ["ACV", "AC_shape_ratio"] + [
-        "WTW_Bucket", "ACD_Bucket", "Shape_Bucket",
-        "Space_Volume", "Aspect_Ratio", "Power_Density",
-        "High_Power_Deep_ACD", "Chamber_Tightness", "Curvature_Depth_Ratio",
-        "Stability_Risk", "Age_Space_Ratio", "Nomogram_Size",
-        "Volume_Constraint", "Steep_Eye_Adjustment", "Safety_Downsize_Flag",
-    ]
-    feature_cols = [f for f in all_24 if f not in ACV_DEPENDENT]
-
     df_c["Lens_Size"] = df_c["Lens_Size"].astype(str)
 
     X = df_c[feature_cols].copy()
@@ -2,10 +2,10 @@
 """
 ICL Vault Prediction - Tight Chamber Model Training (gestalt-27f-756c)
 
-Self-contained training script that:
-1. Loads training_data.csv
-2. Engineers all 24 existing gestalt features
-3. Adds 3 new tight-chamber features (27 total)
+Training script that:
+1. Loads the typed training dataset (training_data.parquet)
+2. Uses all 24 existing gestalt features (precomputed in the dataset)
+3. Adds the 3 tight-chamber features (27 total, also precomputed)
 4. Trains GradientBoosting with balanced sample weights
 5. Saves to models/archives/gestalt-27f-756c/
 
@@ -22,7 +22,7 @@ from datetime import date
 import numpy as np
 import pandas as pd
 import pickle
-from sklearn.model_selection import cross_val_predict, KFold
+from sklearn.model_selection import KFold
 from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.utils.class_weight import compute_sample_weight
@@ -36,146 +36,43 @@ warnings.filterwarnings('ignore')
 
 # ── paths ────────────────────────────────────────────────────────────────
 PROJECT_ROOT = Path(__file__).resolve().parents[2]          # Vault 3.0/
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
 DATA_PATH = PROJECT_ROOT / "data" / "processed" / "training_data.csv"
+DATASET_PATH = PROJECT_ROOT / "data" / "processed" / "training_data.parquet"
 ARCHIVE_DIR = PROJECT_ROOT / "models" / "archives" / "gestalt-27f-756c"
 
+from training_dataset import (  # noqa: E402
+    ENGINEERED_FEATURES, add_gestalt_features, complete_cases, load_training_data,
+)
+from cv_engine import run_folds  # noqa: E402
+
 BASE_FEATURES = [
     "Age", "WTW", "ACD_internal", "ICL_Power", "AC_shape_ratio",
     "SimK_steep", "ACV", "TCRP_Km", "TCRP_Astigmatism",
 ]
 
 
-# ── nomogram lookup (identical to train_model.py) ────────────────────────
-def get_nomogram_size(wtw, acd):
-    if wtw < 10.5 or wtw >= 13.0:
-        return 0.0
-    if 10.5 <= wtw < 10.7:
-        return 12.1 if acd > 3.5 else 0.0
-    if 10.7 <= wtw < 11.1:
-        return 12.1
-    if 11.1 <= wtw < 11.2:
-        return 12.6 if acd > 3.5 else 12.1
-    if 11.2 <= wtw < 11.5:
-        return 12.6
-    if 11.5 <= wtw < 11.7:
-        return 13.2 if acd > 3.5 else 12.6
-    if 11.7 <= wtw < 12.2:
-        return 13.2
-    if 12.2 <= wtw < 12.3:
-        return 13.7 if acd > 3.5 else 13.2
-    if 12.3 <= wtw < 13.0:
-        return 13.7
-    return 0.0
-
-
-# ── feature engineering ──────────────────────────────────────────────────
-def engineer_all_features(df):
-    """Apply the 24 existing gestalt features + 3 new tight-chamber features."""
-
-    # ── 15 existing gestalt features (same as train_model.py) ────────────
-
-    # Buckets
-    df['WTW_Bucket'] = pd.cut(
-        df['WTW'], bins=[0, 11.6, 11.9, 12.4, 20], labels=[0, 1, 2, 3]
-    ).astype(int)
-    df['ACD_Bucket'] = pd.cut(
-        df['ACD_internal'], bins=[0, 3.1, 3.3, 10], labels=[0, 1, 2]
-    ).astype(int)
-    df['Shape_Bucket'] = pd.cut(
-        df['AC_shape_ratio'], bins=[0, 58, 62.5, 68, 300], labels=[0, 1, 2, 3]
-    ).astype(int)
-
-    # Interactions
-    df['Space_Volume'] = df['WTW'] * df['ACD_internal']
-    df['Aspect_Ratio'] = df['WTW'] / df['ACD_internal']
-    df['Power_Density'] = abs(df['ICL_Power']) / df['ACV']
-
-    # Advanced gestalt
-    df['High_Power_Deep_ACD'] = (
-        (abs(df['ICL_Power']) > 14) & (df['ACD_internal'] > 3.3)
-    ).astype(int)
-    df['Chamber_Tightness'] = df['ACV'] / df['WTW']
-    df['Curvature_Depth_Ratio'] = df['SimK_steep'] / df['ACD_internal']
-
-    # Rotational / age
-    df['Stability_Risk'] = (
-        (df['TCRP_Astigmatism'] > 1.5) & (df['WTW'] > 12.0)
-    ).astype(int)
-    df['Age_Space_Ratio'] = df['Age'] / df['ACD_internal']
-
-    # Nomogram
-    df['Nomogram_Size'] = df.apply(
-        lambda row: get_nomogram_size(row['WTW'], row['ACD_internal']), axis=1
-    )
-
-    # Conservative deviations
-    df['Volume_Constraint'] = (
-        (df['Nomogram_Size'] > 12.1) & (df['ACV'] < 170)
-    ).astype(int)
-    df['Steep_Eye_Adjustment'] = (
-        (df['Nomogram_Size'] > 12.1) & (df['SimK_steep'] > 46.0)
-    ).astype(int)
-    df['Safety_Downsize_Flag'] = (
-        (df['Nomogram_Size'] == 13.2) & (abs(df['ICL_Power']) < 10.0)
-    ).astype(int)
-
-    # ── 3 NEW tight-chamber features ─────────────────────────────────────
-
-    # A. Tight_Chamber_Score — how far below 12.1 medians on ACD/ACV/WTW
-    acd_z = ((3.07 - df['ACD_internal']) / 0.30).clip(lower=0)
-    acv_z = ((174.7 - df['ACV']) / 30.0).clip(lower=0)
-    wtw_z = ((11.6 - df['WTW']) / 0.35).clip(lower=0)
-    df['Tight_Chamber_Score'] = (acd_z + acv_z + wtw_z) / 3.0
-
-    # B. Volume_Per_Depth — nonlinear ACV / ACD^2 interaction
-    df['Volume_Per_Depth'] = df['ACV'] / (df['ACD_internal'] ** 2)
-
-    # C. Nomogram_Downsize_Pressure — tension between nomogram and chamber
-    nomogram_gap = df['Nomogram_Size'] - 12.1
-    chamber_adequacy = (
-        (df['ACV'] / 170.0) * (df['ACD_internal'] / 3.1)
-    ).clip(lower=0.5)
-    df['Nomogram_Downsize_Pressure'] = nomogram_gap / chamber_adequacy
-
-    return df
-
-
 # ── data loading ─────────────────────────────────────────────────────────
 def load_and_prepare_data():
     print("=" * 70)
     print("LOADING TRAINING DATA")
     print("=" * 70)
 
-    df = pd.read_csv(DATA_PATH)
-
+    # Base + 15 gestalt + 3 tight-chamber features come precomputed
+    feature_cols = BASE_FEATURES + ENGINEERED_FEATURES
     target_cols = ['Lens_Size', 'Vault']
-    complete = df[BASE_FEATURES + target_cols].notna().all(axis=1)
-    df_complete = df[complete].copy()
+    df = load_training_data(feature_cols + target_cols, path=DATASET_PATH, csv_path=DATA_PATH)
+    df_complete = complete_cases(df, BASE_FEATURES + target_cols)
 
-    # Fix negative lens sizes
     df_complete['Lens_Size'] = df_complete['Lens_Size'].abs()
     valid_lens = (df_complete['Lens_Size'] > 0) & (df_complete['Lens_Size'] < 20)
     df_complete = df_complete[valid_lens].copy()
 
-    # Engineer all 27 features
-    df_complete = engineer_all_features(df_complete)
-
-    # Build full feature list: 9 base + 15 existing gestalt + 3 new = 27
-    feature_cols = BASE_FEATURES + [
-        'WTW_Bucket', 'ACD_Bucket', 'Shape_Bucket',
-        'Space_Volume', 'Aspect_Ratio', 'Power_Density',
-        'High_Power_Deep_ACD', 'Chamber_Tightness', 'Curvature_Depth_Ratio',
-        'Stability_Risk', 'Age_Space_Ratio', 'Nomogram_Size',
-        'Volume_Constraint', 'Steep_Eye_Adjustment', 'Safety_Downsize_Flag',
-        # ── new ──
-        'Tight_Chamber_Score', 'Volume_Per_Depth', 'Nomogram_Downsize_Pressure',
-    ]
-
     df_complete['Lens_Size'] = df_complete['Lens_Size'].astype(str)
 
     X = df_complete[feature_cols].copy()
-    y_lens = df_complete['Lens_Size'].values
-    y_vault = df_complete['Vault'].values
+    y_lens = df_complete['Lens_Size'].to_numpy(dtype=object)
+    y_vault = df_complete['Vault'].to_numpy()
 
     print(f"\nTotal cases: {len(df)}")
     print(f"Complete cases: {len(df_complete)}")
@@ -207,21 +104,13 @@ def train_lens_size_model(X, y):
 
     cv = KFold(n_splits=5, shuffle=True, random_state=42)
 
-    # Manual CV loop to pass sample_weight per fold
-    y_pred_all = np.empty_like(y, dtype=object)
-    fold_accuracies = []
-
-    for fold_i, (train_idx, val_idx) in enumerate(cv.split(X_scaled), 1):
-        X_train, X_val = X_scaled[train_idx], X_scaled[val_idx]
-        y_train, y_val = y[train_idx], y[val_idx]
-
-        weights = compute_sample_weight('balanced', y_train)
-        model.fit(X_train, y_train, sample_weight=weights)
-
-        y_fold_pred = model.predict(X_val)
-        y_pred_all[val_idx] = y_fold_pred
-        acc = accuracy_score(y_val, y_fold_pred)
-        fold_accuracies.append(acc)
+    # Folds and the full fit run in parallel, each with balanced weights
+    # computed from its own training labels
+    run = run_folds(model, X_scaled, y, cv,
+                    sample_weight=lambda y_train: compute_sample_weight('balanced', y_train))
+    y_pred_all = run.oof
+    fold_accuracies = run.fold_scores(accuracy_score)
+    for fold_i, acc in enumerate(fold_accuracies, 1):
         print(f"  Fold {fold_i}: accuracy = {acc:.3f}")
 
     mean_acc = np.mean(fold_accuracies)
@@ -245,9 +134,8 @@ def train_lens_size_model(X, y):
         recall = correct / total if total > 0 else 0
         print(f"  {lbl}: {correct}/{total} = {recall:.1%}")
 
-    # Final fit on full data with balanced weights
-    weights_full = compute_sample_weight('balanced', y)
-    model.fit(X_scaled, y, sample_weight=weights_full)
+    # Final fit on full data with balanced weights (trained alongside the folds)
+    model = run.full_model
 
     # Feature importance
     print("\nTop 10 Most Important Features:")
@@ -277,7 +165,8 @@ def train_vault_model(X, y):
     )
 
     cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    y_pred = cross_val_predict(model, X_scaled, y, cv=cv)
+    run = run_folds(model, X_scaled, y, cv)
+    y_pred = run.oof
 
     mae = mean_absolute_error(y, y_pred)
     rmse = np.sqrt(mean_squared_error(y, y_pred))
@@ -292,8 +181,8 @@ def train_vault_model(X, y):
     print(f"\n  Within +/-100um: {within_100}/{len(y)} ({within_100/len(y)*100:.1f}%)")
     print(f"  Within +/-200um: {within_200}/{len(y)} ({within_200/len(y)*100:.1f}%)")
 
-    # Full fit
-    model.fit(X_scaled, y)
+    # Full fit (trained alongside the folds)
+    model = run.full_model
 
     return model, scaler, mae
 
@@ -311,7 +200,7 @@ def test_reference_patient(lens_model, lens_scaler, feature_names):
         'TCRP_Km': 42.0, 'TCRP_Astigmatism': 1.90,
     }
     df = pd.DataFrame([ref])
-    df = engineer_all_features(df)
+    df = add_gestalt_features(df)
     X = df[feature_names]
     X_scaled = lens_scaler.transform(X)
 
@@ -341,7 +230,7 @@ def test_reference_patient(lens_model, lens_scaler, feature_names):
         'TCRP_Km': 43.5, 'TCRP_Astigmatism': 0.8,
     }
     df2 = pd.DataFrame([ctrl])
-    df2 = engineer_all_features(df2)
+    df2 = add_gestalt_features(df2)
     X2 = df2[feature_names]
     X2_scaled = lens_scaler.transform(X2)
     probs2 = lens_model.predict_proba(X2_scaled)[0]
@@ -428,7 +317,7 @@ Tension between nomogram recommendation and chamber capacity.
 - **Type:** GradientBoostingClassifier (sklearn)
 - **Hyperparameters:** n_estimators=150, max_depth=4, learning_rate=0.05, subsample=0.8
 - **Class weighting:** compute_sample_weight('balanced') passed to fit()
-- **CV:** KFold(n_splits=5, shuffle=True, random_state=42), manual loop for sample weights
+- **CV:** KFold(n_splits=5, shuffle=True, random_state=42), per-fold sample weights (cv_engine.run_folds)
 
 ### Vault Regressor
 - **Type:** GradientBoostingRegressor (sklearn)
@@ -8,17 +8,34 @@ Trains XGBoost models with Optuna hyperparameter optimization for:
 
 Uses the same 24 gestalt features as the current GradientBoosting models.
 Saves to models/archives/xgb-24f-756c/ without touching the live model.
+
+Studies are stored in SQLite (data/processed/optuna/train_xgb.db) and are
+keyed on the training data, so an interrupted run resumes where it left
+off and a rerun on unchanged data only tops up missing trials. Trials run
+in parallel with one core budget (--jobs) split between concurrent trials
+and XGBoost threads; trials whose running CV score is below the median
+after the first folds are pruned. A fresh study first evaluates the best
+params saved in the archive.
+
+Usage:
+    python scripts/training/train_xgb.py [--trials N] [--jobs N] [--fresh]
 """
 
+import argparse
+import hashlib
+import json
+import os
+import sys
 from pathlib import Path
 
 import numpy as np
 import optuna
 import pandas as pd
 import pickle
-from sklearn.model_selection import cross_val_score, cross_val_predict, KFold
+from sklearn.model_selection import KFold
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import (
+    accuracy_score,
     classification_report,
     mean_absolute_error,
     mean_squared_error,
@@ -29,103 +46,51 @@ from xgboost import XGBClassifier, XGBRegressor
 optuna.logging.set_verbosity(optuna.logging.WARNING)
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "pipeline"))
 
+from training_dataset import (  # noqa: E402
+    GESTALT_FEATURES, add_gestalt_features, complete_cases, load_training_data,
+)
+from cv_engine import run_folds  # noqa: E402
 
-def get_nomogram_size(wtw, acd):
-    if wtw < 10.5 or wtw >= 13.0:
-        return 0.0
-    if 10.5 <= wtw < 10.7:
-        return 12.1 if acd > 3.5 else 0.0
-    if 10.7 <= wtw < 11.1:
-        return 12.1
-    if 11.1 <= wtw < 11.2:
-        return 12.6 if acd > 3.5 else 12.1
-    if 11.2 <= wtw < 11.5:
-        return 12.6
-    if 11.5 <= wtw < 11.7:
-        return 13.2 if acd > 3.5 else 12.6
-    if 11.7 <= wtw < 12.2:
-        return 13.2
-    if 12.2 <= wtw < 12.3:
-        return 13.7 if acd > 3.5 else 13.2
-    if 12.3 <= wtw < 13.0:
-        return 13.7
-    return 0.0
-
-
-def engineer_gestalt_features(df):
-    df = df.copy()
-    df["WTW_Bucket"] = pd.cut(
-        df["WTW"], bins=[0, 11.6, 11.9, 12.4, 20], labels=[0, 1, 2, 3]
-    ).astype(int)
-    df["ACD_Bucket"] = pd.cut(
-        df["ACD_internal"], bins=[0, 3.1, 3.3, 10], labels=[0, 1, 2]
-    ).astype(int)
-    df["Shape_Bucket"] = pd.cut(
-        df["AC_shape_ratio"], bins=[0, 58, 62.5, 68, 300], labels=[0, 1, 2, 3]
-    ).astype(int)
-    df["Space_Volume"] = df["WTW"] * df["ACD_internal"]
-    df["Aspect_Ratio"] = df["WTW"] / df["ACD_internal"]
-    df["Power_Density"] = abs(df["ICL_Power"]) / df["ACV"]
-    df["High_Power_Deep_ACD"] = (
-        (abs(df["ICL_Power"]) > 14) & (df["ACD_internal"] > 3.3)
-    ).astype(int)
-    df["Chamber_Tightness"] = df["ACV"] / df["WTW"]
-    df["Curvature_Depth_Ratio"] = df["SimK_steep"] / df["ACD_internal"]
-    df["Stability_Risk"] = (
-        (df["TCRP_Astigmatism"] > 1.5) & (df["WTW"] > 12.0)
-    ).astype(int)
-    df["Age_Space_Ratio"] = df["Age"] / df["ACD_internal"]
-    df["Nomogram_Size"] = df.apply(
-        lambda row: get_nomogram_size(row["WTW"], row["ACD_internal"]), axis=1
-    )
-    df["Volume_Constraint"] = (
-        (df["Nomogram_Size"] > 12.1) & (df["ACV"] < 170)
-    ).astype(int)
-    df["Steep_Eye_Adjustment"] = (
-        (df["Nomogram_Size"] > 12.1) & (df["SimK_steep"] > 46.0)
-    ).astype(int)
-    df["Safety_Downsize_Flag"] = (
-        (df["Nomogram_Size"] == 13.2) & (abs(df["ICL_Power"]) < 10.0)
-    ).astype(int)
-    return df
+ARCHIVE_DIR = PROJECT_ROOT / "models" / "archives" / "xgb-24f-756c"
+STUDY_DB = PROJECT_ROOT / "data" / "processed" / "optuna" / "train_xgb.db"
+N_TRIALS = 100
+
+# Bump when the search space or objective changes so old studies aren't resumed
+STUDY_VERSION = 1
 
 
 BASE_FEATURES = [
     "Age", "WTW", "ACD_internal", "ICL_Power", "AC_shape_ratio",
     "SimK_steep", "ACV", "TCRP_Km", "TCRP_Astigmatism",
 ]
-GESTALT_FEATURES = [
-    "WTW_Bucket", "ACD_Bucket", "Shape_Bucket",
-    "Space_Volume", "Aspect_Ratio", "Power_Density",
-    "High_Power_Deep_ACD", "Chamber_Tightness", "Curvature_Depth_Ratio",
-    "Stability_Risk", "Age_Space_Ratio", "Nomogram_Size",
-    "Volume_Constraint", "Steep_Eye_Adjustment", "Safety_Downsize_Flag",
-]
 ALL_FEATURES = BASE_FEATURES + GESTALT_FEATURES
 
 
 def load_data():
-    csv_path = PROJECT_ROOT / "data" / "processed" / "training_data.csv"
-    df = pd.read_csv(csv_path)
-
     required_cols = [
         "Age", "WTW", "ACD_internal", "ICL_Power", "SimK_steep",
         "ACV", "TCRP_Km", "TCRP_Astigmatism", "Lens_Size", "Vault",
     ]
-    df = df[df[required_cols].notna().all(axis=1)].copy()
+    df = load_training_data(
+        ALL_FEATURES + ["Lens_Size", "Vault"],
+        path=PROJECT_ROOT / "data" / "processed" / "training_data.parquet",
+        csv_path=PROJECT_ROOT / "data" / "processed" / "training_data.csv",
+    )
+    df = complete_cases(df, required_cols)
 
     if "AC_shape_ratio" not in df.columns or df["AC_shape_ratio"].isna().any():
         df["AC_shape_ratio"] = df["ACV"] / df["ACD_internal"]
+        # Shape-dependent gestalts change with the recomputed ratio
+        df = complete_cases(add_gestalt_features(df), required_cols)
 
     df["Lens_Size"] = df["Lens_Size"].abs()
     df = df[(df["Lens_Size"] > 0) & (df["Lens_Size"] < 20)].copy()
 
-    df = engineer_gestalt_features(df)
-
     X = df[ALL_FEATURES].copy()
-    y_lens = df["Lens_Size"].astype(str).values
-    y_vault = df["Vault"].values
+    y_lens = df["Lens_Size"].astype(str).to_numpy(dtype=object)
+    y_vault = df["Vault"].to_numpy()
 
     print(f"Training data: {len(df)} complete cases, {len(ALL_FEATURES)} features")
     print(f"Lens sizes: {pd.Series(y_lens).value_counts().to_dict()}")
@@ -133,85 +98,189 @@ def load_data():
     return X, y_lens, y_vault
 
 
-def tune_lens_classifier(X_scaled, y, cv):
+def suggest_params(trial):
+    return {
+        "n_estimators": trial.suggest_int("n_estimators", 50, 500),
+        "max_depth": trial.suggest_int("max_depth", 2, 8),
+        "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3, log=True),
+        "subsample": trial.suggest_float("subsample", 0.5, 1.0),
+        "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
+        "min_child_weight": trial.suggest_int("min_child_weight", 1, 10),
+        "gamma": trial.suggest_float("gamma", 0.0, 5.0),
+        "reg_alpha": trial.suggest_float("reg_alpha", 1e-8, 10.0, log=True),
+        "reg_lambda": trial.suggest_float("reg_lambda", 1e-8, 10.0, log=True),
+    }
+
+
+SEARCH_SPACE = [
+    "n_estimators", "max_depth", "learning_rate", "subsample", "colsample_bytree",
+    "min_child_weight", "gamma", "reg_alpha", "reg_lambda",
+]
+
+
+def split_core_budget(cores, n_trials):
+    """
+    Split `cores` between concurrent trials (or fits) and XGBoost threads per fit.
+
+    With ~750 rows a single fit gains little from extra threads, so the
+    budget goes to concurrent trials first; leftover cores become threads.
+    """
+    trial_workers = max(1, min(cores, n_trials))
+    return trial_workers, max(1, cores // trial_workers)
+
+
+def data_key(X_scaled, y):
+    """Short fingerprint of the training data, part of the study name."""
+    hasher = hashlib.sha256()
+    hasher.update(np.ascontiguousarray(X_scaled).tobytes())
+    hasher.update(np.asarray(y).astype(str).astype("U").tobytes())
+    return hasher.hexdigest()[:12]
+
+
+def prior_best_params(key):
+    """Best params from the archive (best_params.json, else the saved model)."""
+    params_file = ARCHIVE_DIR / "best_params.json"
+    if params_file.exists():
+        try:
+            return json.loads(params_file.read_text()).get(key)
+        except (OSError, ValueError) as e:
+            print(f"  Warning: Ignoring unreadable {params_file}: {e}")
+    model_file = ARCHIVE_DIR / f"{key}_model.pkl"
+    if model_file.exists():
+        try:
+            with open(model_file, "rb") as f:
+                params = pickle.load(f).get_params()
+            return {name: params[name] for name in SEARCH_SPACE if params.get(name) is not None}
+        except Exception as e:
+            print(f"  Warning: Could not read params from {model_file}: {e}")
+    return None
+
+
+def run_study(name, objective, n_trials, direction, storage, trial_workers, prior_params=None):
+    """Create or resume a SQLite-backed study and run the trials it is missing."""
+    study = optuna.create_study(
+        direction=direction,
+        study_name=name,
+        storage=storage,
+        load_if_exists=True,
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1),
+    )
+    # Trials cut short by an interruption (failed / still "running") are redone
+    done_states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    finished = [t for t in study.trials if t.state in done_states]
+    if finished:
+        print(f"  Resuming study {name}: {len(finished)}/{n_trials} trials done")
+    remaining = max(0, n_trials - len(finished))
+    if not study.trials and prior_params and remaining:
+        # Run the enqueued trial on its own: parallel workers can race for it
+        print("  Warm start: evaluating the archive's best params first")
+        study.enqueue_trial(prior_params, skip_if_exists=True)
+        study.optimize(objective, n_trials=1)
+        remaining -= 1
+    if remaining:
+        print(f"  Running {remaining} trial(s), {trial_workers} in parallel")
+        study.optimize(objective, n_trials=remaining, n_jobs=trial_workers,
+                       show_progress_bar=True)
+    pruned = sum(t.state == optuna.trial.TrialState.PRUNED for t in study.trials)
+    print(f"  Trials: {len(study.trials)} total, {pruned} pruned")
+    return study
+
+
+def cv_objective(make_model, X_scaled, y, cv, score):
+    """Optuna objective: mean fold score, pruned on the running mean."""
+    splits = list(cv.split(X_scaled, y))
+
+    def objective(trial):
+        model = make_model(suggest_params(trial))
+        scores = []
+        for fold, (train, test) in enumerate(splits):
+            model.fit(X_scaled[train], y[train])
+            scores.append(score(y[test], model.predict(X_scaled[test])))
+            trial.report(float(np.mean(scores)), fold)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        return float(np.mean(scores))
+
+    return objective
+
+
+def tune_lens_classifier(X_scaled, y, cv, storage, n_trials=N_TRIALS, cores=1):
     classes = sorted(set(y))
     label_map = {c: i for i, c in enumerate(classes)}
     y_int = np.array([label_map[c] for c in y])
+    trial_workers, xgb_threads = split_core_budget(cores, n_trials)
 
-    def objective(trial):
-        params = {
-            "n_estimators": trial.suggest_int("n_estimators", 50, 500),
-            "max_depth": trial.suggest_int("max_depth", 2, 8),
-            "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3, log=True),
-            "subsample": trial.suggest_float("subsample", 0.5, 1.0),
-            "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
-            "min_child_weight": trial.suggest_int("min_child_weight", 1, 10),
-            "gamma": trial.suggest_float("gamma", 0.0, 5.0),
-            "reg_alpha": trial.suggest_float("reg_alpha", 1e-8, 10.0, log=True),
-            "reg_lambda": trial.suggest_float("reg_lambda", 1e-8, 10.0, log=True),
-        }
-        model = XGBClassifier(
+    def make_model(params, n_jobs=xgb_threads):
+        return XGBClassifier(
             **params, objective="multi:softprob", num_class=len(classes),
-            random_state=42, verbosity=0, n_jobs=-1,
+            random_state=42, verbosity=0, n_jobs=n_jobs,
         )
-        scores = cross_val_score(model, X_scaled, y_int, cv=cv, scoring="accuracy")
-        return scores.mean()
 
-    study = optuna.create_study(direction="maximize", study_name="lens_xgb")
-    study.optimize(objective, n_trials=100, show_progress_bar=True)
+    objective = cv_objective(make_model, X_scaled, y_int, cv, accuracy_score)
+    study = run_study(
+        f"lens_xgb-v{STUDY_VERSION}-{data_key(X_scaled, y)}", objective, n_trials,
+        "maximize", storage, trial_workers, prior_best_params("lens_size"),
+    )
 
     print(f"  Best lens accuracy: {study.best_value:.4f}")
     print(f"  Best params: {study.best_params}")
 
-    best_model = XGBClassifier(
-        **study.best_params, objective="multi:softprob", num_class=len(classes),
-        random_state=42, verbosity=0, n_jobs=-1,
-    )
-    best_model.fit(X_scaled, y_int)
+    # Out-of-fold predictions and the full fit in one parallel pass
+    fit_workers, fit_threads = split_core_budget(cores, cv.get_n_splits() + 1)
+    run = run_folds(make_model(study.best_params, n_jobs=fit_threads), X_scaled, y_int, cv,
+                    n_jobs=fit_workers)
+    best_model = run.full_model
     best_model._vault_classes = np.array(classes, dtype=float)
 
-    return best_model, study.best_value, study.best_params
+    return best_model, study.best_value, study.best_params, [classes[i] for i in run.oof]
 
 
-def tune_vault_regressor(X_scaled, y, cv):
-    def objective(trial):
-        params = {
-            "n_estimators": trial.suggest_int("n_estimators", 50, 500),
-            "max_depth": trial.suggest_int("max_depth", 2, 8),
-            "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3, log=True),
-            "subsample": trial.suggest_float("subsample", 0.5, 1.0),
-            "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
-            "min_child_weight": trial.suggest_int("min_child_weight", 1, 10),
-            "gamma": trial.suggest_float("gamma", 0.0, 5.0),
-            "reg_alpha": trial.suggest_float("reg_alpha", 1e-8, 10.0, log=True),
-            "reg_lambda": trial.suggest_float("reg_lambda", 1e-8, 10.0, log=True),
-        }
-        model = XGBRegressor(
+def tune_vault_regressor(X_scaled, y, cv, storage, n_trials=N_TRIALS, cores=1):
+    trial_workers, xgb_threads = split_core_budget(cores, n_trials)
+
+    def make_model(params, n_jobs=xgb_threads):
+        return XGBRegressor(
             **params, objective="reg:squarederror",
-            random_state=42, verbosity=0, n_jobs=-1,
-        )
-        scores = cross_val_score(
-            model, X_scaled, y, cv=cv, scoring="neg_mean_absolute_error"
+            random_state=42, verbosity=0, n_jobs=n_jobs,
         )
-        return scores.mean()
 
-    study = optuna.create_study(direction="maximize", study_name="vault_xgb")
-    study.optimize(objective, n_trials=100, show_progress_bar=True)
+    # Negative MAE, as with scoring="neg_mean_absolute_error"
+    objective = cv_objective(make_model, X_scaled, y, cv,
+                             lambda y_true, y_pred: -mean_absolute_error(y_true, y_pred))
+    study = run_study(
+        f"vault_xgb-v{STUDY_VERSION}-{data_key(X_scaled, y)}", objective, n_trials,
+        "maximize", storage, trial_workers, prior_best_params("vault"),
+    )
 
     best_mae = -study.best_value
     print(f"  Best vault MAE: {best_mae:.1f}um")
     print(f"  Best params: {study.best_params}")
 
-    best_model = XGBRegressor(
-        **study.best_params, objective="reg:squarederror",
-        random_state=42, verbosity=0, n_jobs=-1,
-    )
-    best_model.fit(X_scaled, y)
+    fit_workers, fit_threads = split_core_budget(cores, cv.get_n_splits() + 1)
+    run = run_folds(make_model(study.best_params, n_jobs=fit_threads), X_scaled, y, cv,
+                    n_jobs=fit_workers)
 
-    return best_model, best_mae, study.best_params
+    return run.full_model, best_mae, study.best_params, run.oof
+
+
+def open_storage(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Parallel trials share the database; wait for locks instead of failing
+    return optuna.storages.RDBStorage(
+        f"sqlite:///{path}", engine_kwargs={"connect_args": {"timeout": 60}},
+    )
 
 
 def main():
+    parser = argparse.ArgumentParser(description="XGBoost + Optuna training")
+    parser.add_argument("--trials", type=int, default=N_TRIALS, help="Optuna trials per model")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Core budget shared by parallel trials and XGBoost threads")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Discard stored studies and start tuning from scratch")
+    args = parser.parse_args()
+    cores = max(1, args.jobs)
+
     print("=" * 70)
     print("XGBoost + Optuna Training")
     print("=" * 70)
@@ -219,6 +288,11 @@ def main():
     X, y_lens, y_vault = load_data()
     cv = KFold(n_splits=5, shuffle=True, random_state=42)
 
+    if args.fresh and STUDY_DB.exists():
+        STUDY_DB.unlink()
+    storage = open_storage(STUDY_DB)
+    print(f"Studies: {STUDY_DB} | core budget: {cores}")
+
     lens_scaler = StandardScaler()
     X_lens_scaled = lens_scaler.fit_transform(X)
 
@@ -228,22 +302,12 @@ def main():
     # --- Lens Size ---
     print()
     print("=" * 70)
-    print("TUNING LENS SIZE CLASSIFIER (100 Optuna trials)")
+    print(f"TUNING LENS SIZE CLASSIFIER ({args.trials} Optuna trials)")
     print("=" * 70)
-    lens_model, lens_acc, lens_params = tune_lens_classifier(X_lens_scaled, y_lens, cv)
+    lens_model, lens_acc, lens_params, y_pred_labels = tune_lens_classifier(
+        X_lens_scaled, y_lens, cv, storage, args.trials, cores)
 
     # Detailed eval
-    classes = sorted(set(y_lens))
-    label_map = {c: i for i, c in enumerate(classes)}
-    y_lens_int = np.array([label_map[c] for c in y_lens])
-    y_pred_lens = cross_val_predict(
-        XGBClassifier(
-            **lens_params, objective="multi:softprob", num_class=len(classes),
-            random_state=42, verbosity=0, n_jobs=-1,
-        ),
-        X_lens_scaled, y_lens_int, cv=cv,
-    )
-    y_pred_labels = [classes[i] for i in y_pred_lens]
     print()
     print("Classification Report:")
     print(classification_report(y_lens, y_pred_labels, zero_division=0))
@@ -251,18 +315,12 @@ def main():
     # --- Vault ---
     print()
     print("=" * 70)
-    print("TUNING VAULT REGRESSOR (100 Optuna trials)")
+    print(f"TUNING VAULT REGRESSOR ({args.trials} Optuna trials)")
     print("=" * 70)
-    vault_model, vault_mae, vault_params = tune_vault_regressor(X_vault_scaled, y_vault, cv)
+    vault_model, vault_mae, vault_params, y_pred_vault = tune_vault_regressor(
+        X_vault_scaled, y_vault, cv, storage, args.trials, cores)
 
     # Detailed eval
-    y_pred_vault = cross_val_predict(
-        XGBRegressor(
-            **vault_params, objective="reg:squarederror",
-            random_state=42, verbosity=0, n_jobs=-1,
-        ),
-        X_vault_scaled, y_vault, cv=cv,
-    )
     rmse = np.sqrt(mean_squared_error(y_vault, y_pred_vault))
     r2 = r2_score(y_vault, y_pred_vault)
     within_100 = np.sum(np.abs(y_vault - y_pred_vault) <= 100)
@@ -277,7 +335,7 @@ def main():
     print(f"  Within +/-200um: {within_200}/{len(y_vault)} ({within_200/len(y_vault)*100:.1f}%)")
 
     # --- Save ---
-    out_dir = PROJECT_ROOT / "models" / "archives" / "xgb-24f-756c"
+    out_dir = ARCHIVE_DIR
     out_dir.mkdir(parents=True, exist_ok=True)
 
     artifacts = {
@@ -292,6 +350,11 @@ def main():
             pickle.dump(obj, f)
         print(f"  Saved {fname}")
 
+    # Best params warm-start the next tuning run
+    (out_dir / "best_params.json").write_text(json.dumps(
+        {"lens_size": lens_params, "vault": vault_params}, indent=2))
+    print("  Saved best_params.json")
+
     # README
     readme_text = (
         "# xgb-24f-756c\n\n"
@@ -302,7 +365,7 @@ def main():
         f"- **Training cases**: {len(y_lens)}\n"
         f"- **Lens accuracy**: {lens_acc:.1%} (5-fold CV)\n"
         f"- **Vault MAE**: {vault_mae:.1f}um (5-fold CV)\n"
-        f"- **Tuning**: Optuna, 100 trials per model\n"
+        f"- **Tuning**: Optuna, {args.trials} trials per model (median pruning)\n"
     )
     (out_dir / "README.md").write_text(readme_text)
 
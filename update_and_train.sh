@@ -30,11 +30,12 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
-# Step 2: Train models
+# Step 2: Train models (new rows are added to the saved models; the full
+# model search only reruns when the data drifted or accuracy dropped)
 echo ""
 echo "🤖 STEP 2: Training machine learning models..."
 echo ""
-python train_model.py
+python scripts/training/train_model.py --incremental
 
 if [ $? -ne 0 ]; then
     echo ""
@@ -85,5 +86,5 @@ echo "========================================================================"
 echo "  📊 LEARNING PROGRESS"
 echo "========================================================================"
 echo ""
-python track_performance.py
+python scripts/training/track_performance.py
 